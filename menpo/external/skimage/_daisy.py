@@ -1,11 +1,38 @@
 from __future__ import division
 import numpy as np
-from scipy.ndimage import gaussian_filter
+
+
+def _orientation_histograms(img, orientations):
+    # the gradient magnitude of the channel with the highest magnitude at each
+    # pixel, weighted for every orientation bin by the circular normal
+    # distribution. As cos(theta - o) = cos(theta) cos(o) + sin(theta) sin(o),
+    # all the bins are obtained from the cosine and sine of the gradient
+    # angles, which are computed natively along with the gradient.
+    from menpo.feature.features import _gradient_orientation
+    n_channels = img.shape[0]
+    _, grad_mag, components = _gradient_orientation(img, components=True)
+    max_channel = np.argmax(grad_mag, axis=0)
+    rows, cols = np.indices(img.shape[1:])
+    grad_mag = grad_mag[max_channel, rows, cols]
+    # the cosine and sine of arctan2(row derivative, column derivative)
+    cos_ori = components[max_channel, rows, cols]
+    sin_ori = components[max_channel + n_channels, rows, cols]
+    orientation_kappa = orientations / np.pi
+    orientation_angles = np.array([2 * o * np.pi / orientations - np.pi
+                                   for o in range(orientations)])
+    hist = np.multiply.outer(orientation_kappa * np.cos(orientation_angles),
+                             cos_ori)
+    hist += np.multiply.outer(orientation_kappa * np.sin(orientation_angles),
+                              sin_ori)
+    np.exp(hist, out=hist)
+    hist *= grad_mag
+    return hist
 
 
 def _daisy(img, step=4, radius=15, rings=3, histograms=8, orientations=8,
-           normalization='l1', sigmas=None, ring_radii=None):
-    r"""Extract DAISY feature descriptors densely for the given image.
+           normalization='l1', sigmas=None, ring_radii=None, centres=None):
+    r"""Extract DAISY feature descriptors densely for the given image, or at
+    the given centres.
 
     DAISY is a feature descriptor similar to SIFT formulated in a way that
     allows for fast dense extraction. Typically, this is practical for
@@ -22,10 +49,17 @@ def _daisy(img, step=4, radius=15, rings=3, histograms=8, orientations=8,
         the centre histogram. However, this smoothing is not documented in [1]_
         and, therefore, it is omitted.
 
+    The orientation histograms are computed once and all of them are
+    smoothed in a single pass per distinct sigma, thus the centre and the
+    first ring share their smoothed histograms. The descriptors are then
+    sampled from the smoothed histograms at the step of the grid, or at the
+    centres, without visiting the other pixels.
+
     Parameters
     ----------
-    img : (M, N) array
-        Input image (greyscale).
+    img : (C, M, N) array
+        Input image. The gradient of the channel with the highest magnitude
+        is used at each pixel.
     step : int, optional
         Distance between descriptor sampling points.
     radius : int, optional
@@ -64,19 +98,25 @@ def _daisy(img, step=4, radius=15, rings=3, histograms=8, orientations=8,
         histogram.
 
             ``len(ring_radii) == len(sigmas) + 1``
+    centres : (K, 2) array of float, optional
+        If given, the descriptors are only computed at these points, which
+        are rounded to the nearest pixels, rather than over the grid. The
+        histograms that lie outside the image are zero.
 
     Returns
     -------
     descs : array
         Grid of DAISY descriptors for the given image as an array
-        dimensionality  (P, Q, R) where ::
+        dimensionality  (R, P, Q) where ::
 
             ``P = ceil((M - radius*2) / step)``
             ``Q = ceil((N - radius*2) / step)``
             ``R = (rings * histograms + 1) * orientations``
 
-    descs_img : (M, N, 3) array (only if visualize==True)
-        Visualization of the DAISY descriptors.
+        The descriptor at (p, q) is centred at the pixel
+        ``(radius + p * step, radius + q * step)``. If centres are given,
+        the descriptors are returned as an array of dimensionality (K, R)
+        instead.
 
     References
     ----------
@@ -85,60 +125,50 @@ def _daisy(img, step=4, radius=15, rings=3, histograms=8, orientations=8,
            Transactions on 32.5 (2010): 815-830.
     .. [2] http://cvlab.epfl.ch/alumni/tola/daisy.html
     """
-    from menpo.feature import gradient
-
-    # Compute image derivatives.
-    # Get number of input image's channels
-    n_channels = img.shape[0]
-
-    # Compute image gradient
-    grad = gradient(img)
+    from menpo.feature.features import _gaussian_filter
 
-    # For each pixel, select gradient with highest magnitude
-    grad_mag = np.zeros(img.shape[1:])
-    grad_ori = np.zeros(img.shape[1:])
-    for c in range(n_channels):
-        c_grad_mag = np.sqrt(grad[c] ** 2 + grad[c + n_channels] ** 2)
-        tmp_max_mask = c_grad_mag > grad_mag
-        grad_mag[tmp_max_mask] = c_grad_mag[tmp_max_mask]
-        grad_ori[tmp_max_mask] = np.arctan2(grad[c][tmp_max_mask],
-                                            grad[c + n_channels][tmp_max_mask])
-
-    orientation_kappa = orientations / np.pi
-    orientation_angles = [2 * o * np.pi / orientations - np.pi
-                          for o in range(orientations)]
-    hist = np.empty((orientations,) + img.shape[1:], dtype=float)
-    for i, o in enumerate(orientation_angles):
-        # Weigh bin contribution by the circular normal distribution
-        hist[i] = np.exp(orientation_kappa * np.cos(grad_ori - o))
-        # Weigh bin contribution by the gradient magnitude
-        hist[i] = hist[i] * grad_mag
+    hist = _orientation_histograms(img, orientations)
 
     # Smooth orientation histograms for the center and all rings.
-    sigmas = [sigmas[0]] + sigmas
-    hist_smooth = np.empty((rings + 1,) + hist.shape, dtype=float)
-    for i in range(rings + 1):
-        for j in range(orientations):
-            hist_smooth[i, j] = gaussian_filter(hist[j], sigma=sigmas[i])
-
-    # Assemble descriptor grid.
+    sigmas = [sigmas[0]] + list(sigmas)
+    smoothed = {}
+    for sigma in sigmas:
+        if sigma not in smoothed:
+            smoothed[sigma] = _gaussian_filter(hist, sigma)
+    hist_smooth = [smoothed[sigma] for sigma in sigmas]
+
+    # The offset of every histogram from the centre of the descriptor.
     theta = [2 * np.pi * j / histograms for j in range(histograms)]
-    desc_dims = (rings * histograms + 1) * orientations
-    descs = np.empty((desc_dims, img.shape[1] - 2 * radius,
-                      img.shape[2] - 2 * radius))
-    descs[:orientations] = hist_smooth[0, :, radius:-radius, radius:-radius]
-    idx = orientations
+    offsets = [(0, 0, 0)]
     for i in range(rings):
         for j in range(histograms):
-            y_min = radius + int(np.round(ring_radii[i] * np.sin(theta[j])))
-            y_max = descs.shape[1] + y_min
-            x_min = radius + int(np.round(ring_radii[i] * np.cos(theta[j])))
-            x_max = descs.shape[2] + x_min
-            descs[idx:idx + orientations] = hist_smooth[i + 1, :,
-                                                        y_min:y_max,
-                                                        x_min:x_max]
-            idx += orientations
-    descs = descs[:, ::step, ::step]
+            offsets.append(
+                (i + 1, int(np.round(ring_radii[i] * np.sin(theta[j]))),
+                 int(np.round(ring_radii[i] * np.cos(theta[j])))))
+
+    # Assemble descriptors.
+    desc_dims = (rings * histograms + 1) * orientations
+    if centres is None:
+        height = img.shape[1] - 2 * radius
+        width = img.shape[2] - 2 * radius
+        descs = np.empty((desc_dims, len(range(0, height, step)),
+                          len(range(0, width, step))))
+        for k, (level, dy, dx) in enumerate(offsets):
+            y_min = radius + dy
+            x_min = radius + dx
+            descs[k * orientations:(k + 1) * orientations] = \
+                hist_smooth[level][:, y_min:y_min + height:step,
+                                   x_min:x_min + width:step]
+    else:
+        points = np.round(centres).astype(np.intp)
+        descs = np.zeros((desc_dims, points.shape[0]))
+        for k, (level, dy, dx) in enumerate(offsets):
+            y = points[:, 0] + dy
+            x = points[:, 1] + dx
+            inside = ((y >= 0) & (y < img.shape[1]) &
+                      (x >= 0) & (x < img.shape[2]))
+            descs[k * orientations:(k + 1) * orientations, inside] = \
+                hist_smooth[level][:, y[inside], x[inside]]
 
     # Normalize descriptors.
     if normalization != 'off':
@@ -148,10 +178,9 @@ def _daisy(img, step=4, radius=15, rings=3, histograms=8, orientations=8,
         elif normalization == 'l2':
             descs /= np.sqrt(np.sum(descs ** 2, axis=0))
         elif normalization == 'daisy':
-            for i in range(0, desc_dims, orientations):
-                norms = np.sqrt(np.sum(descs[i:i + orientations] ** 2, axis=0))
-                descs[i:i + orientations] /= norms
-
-    descs = np.require(descs, requirements=['C'])
+            hists = descs.reshape((-1, orientations) + descs.shape[1:])
+            hists /= np.sqrt(np.sum(hists ** 2, axis=1))[:, None]
 
+    if centres is not None:
+        return np.ascontiguousarray(descs.T)
     return descs
@@ -1,10 +1,14 @@
 from .features import (gradient, hog, lbp, es, igo, no_op, gaussian_filter,
                        daisy, normalize, normalize_norm, normalize_std,
-                       normalize_var, features_selection_widget)
+                       normalize_var, features_selection_widget,
+                       gradient_cache)
 # Optional dependencies may return nothing.
 from .optional import *
 
 from .predefined import sparse_hog, double_igo
 
-from .base import ndfeature, imgfeature
+from .base import ndfeature, imgfeature, batch
+from .cache import FeatureCache
+from .pipeline import Pipeline
+from .pyramid import feature_pyramid, estimate_power_law
 from .visualize import glyph, sum_channels
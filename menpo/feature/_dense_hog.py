@@ -0,0 +1,278 @@
+from __future__ import division
+import numpy as np
+from scipy.ndimage import correlate1d
+
+# the maximum number of elements of the per-pixel orientation votes that are
+# computed at once. The image is processed in horizontal strips of windows.
+_MAX_STRIP_SIZE = 2 ** 20
+# pi in single precision, exactly as in the C++ implementation
+_PI = np.float32(3.1415926536)
+
+
+def _window_origins(image_size, window_size, step, padding):
+    # the same window placement as ImageWindowIterator
+    if padding:
+        n_windows = 1 + (image_size - 1) // step
+        centres = np.arange(n_windows) * step
+        origins = centres - int(np.ceil(window_size / 2.)) + 1
+    else:
+        n_windows = 1 + (image_size - window_size) // step
+        origins = np.arange(n_windows) * step
+        centres = origins + int(np.ceil(window_size / 2.)) - 1
+    return origins, centres
+
+
+def _votes(dx, dy, num_bins, signed_gradient):
+    # per-pixel orientation votes of the channel with the largest gradient
+    # magnitude, interpolated between the two closest orientation bins
+    magnitude = np.sqrt(dx * dx + dy * dy)
+    channel = np.argmax(magnitude, axis=0)
+    if dx.shape[0] > 1:
+        rows, cols = np.indices(channel.shape)
+        magnitude = magnitude[channel, rows, cols]
+        dx = dx[channel, rows, cols]
+        dy = dy[channel, rows, cols]
+    else:
+        magnitude, dx, dy = magnitude[0], dx[0], dy[0]
+    orientation = np.arctan2(dy, dx)
+    orientation[orientation < 0] += _PI + np.float32(signed_gradient) * _PI
+    bins_size = np.float64(np.float32((1 + signed_gradient) * _PI) /
+                           np.float32(num_bins))
+    position = orientation / bins_size - 1
+    bin1 = np.floor(position).astype(np.int64)
+    bin2 = bin1 + 1
+    bin2[bin2 >= num_bins] = 0
+    bin1[bin1 < 0] = num_bins - 1
+    fraction = position.astype(np.float32)
+    fraction[fraction < 0] += num_bins
+    weight = (fraction - bin1).astype(np.float32)
+
+    votes = np.zeros(magnitude.shape + (num_bins,), dtype=np.float32)
+    flat_votes = votes.reshape(-1, num_bins)
+    pixels = np.arange(flat_votes.shape[0])
+    flat_votes[pixels, bin1.ravel()] = (magnitude * (1 - weight)).ravel()
+    flat_votes[pixels, bin2.ravel()] += (magnitude * weight).ravel()
+    return votes
+
+
+def _cell_weights(window_size, cell_size):
+    # weights[j, x] is the weight of pixel x of the window on cell j + 1 for
+    # every cell that is used by the blocks, i.e. the linear interpolation
+    # between the two cells closest to each pixel
+    x = np.arange(window_size)
+    x1 = x // cell_size
+    x_weight = (x.astype(np.float32) / np.float32(cell_size) -
+                x1).astype(np.float64)
+    n_cells = window_size // cell_size
+    weights = np.zeros((n_cells, window_size))
+    for j in range(1, n_cells + 1):
+        weights[j - 1, x1 == j] = 1 - x_weight[x1 == j]
+        weights[j - 1, x1 + 1 == j] = x_weight[x1 + 1 == j]
+    return weights
+
+
+def _kernels(window_size, cell_size):
+    # the cell weights relative to the first pixel of their support. All the
+    # cells but the last one have the same (triangular) kernel, the support of
+    # the last one is truncated by the end of the window.
+    weights = _cell_weights(window_size, cell_size)
+    full = weights[0, :2 * cell_size]
+    last = weights[-1, (weights.shape[0] - 1) * cell_size:]
+    return full, last
+
+
+def _correlate(values, kernel, axis):
+    # out[i] = sum_u kernel[u] * values[i + u], zero beyond the end
+    return correlate1d(values, kernel, axis=axis, mode='constant',
+                       origin=-(len(kernel) // 2), output=np.float32)
+
+
+def _strip_histograms(image, n_rows, n_cols, step_vertical, step_horizontal,
+                      window_height, window_width, num_bins, cell_size,
+                      signed_gradient):
+    # cell histograms of the n_rows x n_cols windows, which start at the first
+    # pixel of the zero padded image (that has an extra pixel on every side)
+    dx = (image[:, 1:-1, 2:] - image[:, 1:-1, :-2]).astype(np.float32)
+    dy = (image[:, :-2, 1:-1] - image[:, 2:, 1:-1]).astype(np.float32)
+    # within a window, the gradients of the last column and row are computed
+    # as if the pixels beyond them were zeros
+    dx_last = (-image[:, 1:-1, :-2]).astype(np.float32)
+    dy_last = image[:, :-2, 1:-1].astype(np.float32)
+    votes = _votes(dx, dy, num_bins, signed_gradient)
+    right = _votes(dx_last, dy, num_bins, signed_gradient) - votes
+    bottom = _votes(dx, dy_last, num_bins, signed_gradient) - votes
+    corner = (_votes(dx_last, dy_last, num_bins, signed_gradient) - votes -
+              right - bottom)
+
+    y_weights = _cell_weights(window_height, cell_size)
+    x_weights = _cell_weights(window_width, cell_size)
+    y_full, y_last = _kernels(window_height, cell_size)
+    x_full, x_last = _kernels(window_width, cell_size)
+    n_cells_y, n_cells_x = y_weights.shape[0], x_weights.shape[0]
+
+    # the kernel, the offset of the support and the weight of the last
+    # pixel of the window for every cell of each axis
+    y_cells = [(y_full if i < n_cells_y - 1 else y_last, i * cell_size,
+                y_weights[i, -1]) for i in range(n_cells_y)]
+    x_cells = [(x_full if j < n_cells_x - 1 else x_last, j * cell_size,
+                x_weights[j, -1]) for j in range(n_cells_x)]
+
+    def windows(values, row, col):
+        # the values at the given pixel of every window
+        return values[row:row + (n_rows - 1) * step_vertical + 1:step_vertical,
+                      col:col + (n_cols - 1) * step_horizontal + 1:
+                      step_horizontal]
+
+    last_row = window_height - 1
+    last_col = window_width - 1
+    # the votes filtered by each distinct pair of kernels
+    x_filtered = dict((id(k), (_correlate(votes, k, 1),
+                               _correlate(bottom, k, 1)))
+                      for k, _, _ in x_cells)
+    y_filtered = dict((id(k), _correlate(right, k, 0))
+                      for k, _, _ in y_cells)
+    yx_filtered = dict(((id(ky), id(kx)),
+                        _correlate(x_filtered[id(kx)][0], ky, 0))
+                       for ky, _, _ in y_cells for kx, _, _ in x_cells)
+
+    histograms = np.empty((n_rows, n_cols, n_cells_y, n_cells_x, num_bins),
+                          dtype=np.float32)
+    for i, (y_kernel, y_offset, y_weight) in enumerate(y_cells):
+        for j, (x_kernel, x_offset, x_weight) in enumerate(x_cells):
+            h = histograms[:, :, i, j]
+            h[...] = windows(yx_filtered[id(y_kernel), id(x_kernel)],
+                             y_offset, x_offset)
+            # replace the votes of the last row and column of each window
+            if y_weight:
+                h += y_weight * windows(x_filtered[id(x_kernel)][1],
+                                        last_row, x_offset)
+            if x_weight:
+                h += x_weight * windows(y_filtered[id(y_kernel)], y_offset,
+                                        last_col)
+            if x_weight and y_weight:
+                h += x_weight * y_weight * windows(corner, last_row, last_col)
+    return histograms
+
+
+def _normalize(blocks):
+    # in place L2 normalization of the blocks, which are left to zero if
+    # their norm is zero. The norm is single precision as in C++.
+    norm = np.sqrt(np.sum(blocks ** 2, axis=(-3, -2, -1),
+                          keepdims=True)).astype(np.float32)
+    zero = np.broadcast_to(norm == 0, blocks.shape)
+    np.divide(blocks, norm, out=blocks, where=~zero)
+    blocks[zero] = 0
+
+
+def _normalize_blocks(histograms, block_size, l2_norm_clip):
+    # block normalization, clipping and renormalization as in the C++
+    # implementation, with blocks ordered column-major in the descriptor
+    n_cells_y, n_cells_x = histograms.shape[2:4]
+    n_blocks_y = n_cells_y - block_size + 1
+    n_blocks_x = n_cells_x - block_size + 1
+    blocks = np.empty(histograms.shape[:2] + (n_blocks_x, n_blocks_y,
+                                              block_size, block_size,
+                                              histograms.shape[-1]),
+                      dtype=np.float32)
+    for x in range(n_blocks_x):
+        for y in range(n_blocks_y):
+            blocks[:, :, x, y] = histograms[:, :, y:y + block_size,
+                                            x:x + block_size]
+    _normalize(blocks)
+    np.minimum(blocks, l2_norm_clip, out=blocks)
+    _normalize(blocks)
+    return blocks.reshape(histograms.shape[:2] + (-1,))
+
+
+def dense_dalaltriggs_hog(pixels, window_height, window_width,
+                          window_step_vertical, window_step_horizontal,
+                          padding, num_bins, cell_size, block_size,
+                          signed_gradient, l2_norm_clip, image_scale=1.):
+    r"""
+    Dense Dalal & Triggs HOG features that are numerically equivalent to
+    ``WindowIterator.HOG`` but share the cell histograms of overlapping
+    windows.
+
+    The orientation votes of every pixel are computed once and the (linearly
+    interpolated) cell histograms of all the windows are obtained by
+    separable filtering of the votes. Only the votes of the last row and
+    column of each window differ from those of the image, since the window is
+    zero padded, and they are corrected in the same manner.
+
+    Parameters
+    ----------
+    pixels : ``(X, Y, C)`` `ndarray`
+        The image.
+    window_height : `int`
+        The height of the windows in pixels.
+    window_width : `int`
+        The width of the windows in pixels.
+    window_step_vertical : `int`
+        The vertical step of the windows in pixels.
+    window_step_horizontal : `int`
+        The horizontal step of the windows in pixels.
+    padding : `bool`
+        Whether the windows are centred on every step of the image (``True``)
+        or must fit in the image.
+    num_bins : `int`
+        The number of orientation bins.
+    cell_size : `int`
+        The cell size in pixels.
+    block_size : `int`
+        The block size in cells.
+    signed_gradient : `bool`
+        Whether the gradient angles are signed.
+    l2_norm_clip : `float`
+        The clipping value of the normalized blocks.
+    image_scale : `float`, optional
+        The factor that the pixels are multiplied with.
+
+    Returns
+    -------
+    descriptors : ``(n_windows_vertical, n_windows_horizontal, K)`` `ndarray`
+        The HOG descriptor of every window.
+    centres : ``(n_windows_vertical, n_windows_horizontal, 2)`` `ndarray`
+        The centre of every window.
+    """
+    height, width, n_channels = pixels.shape
+    signed_gradient = int(bool(signed_gradient))
+    row_origins, row_centres = _window_origins(height, window_height,
+                                               window_step_vertical, padding)
+    col_origins, col_centres = _window_origins(width, window_width,
+                                               window_step_horizontal, padding)
+    # zero pad the image to fit every window, plus an extra pixel on every
+    # side for the gradients
+    top = max(0, -row_origins[0]) + 1
+    left = max(0, -col_origins[0]) + 1
+    bottom = max(0, row_origins[-1] + window_height - height) + 1
+    right = max(0, col_origins[-1] + window_width - width) + 1
+    image = np.zeros((n_channels, height + top + bottom,
+                      width + left + right))
+    image[:, top:top + height, left:left + width] = np.rollaxis(pixels, -1)
+    image *= image_scale
+    # origins relative to the padded image, without the gradient border
+    first_row = row_origins[0] + top - 1
+    first_col = col_origins[0] + left - 1
+    image = image[:, first_row:, first_col:]
+
+    n_rows = len(row_origins)
+    n_cols = len(col_origins)
+    n_rows_per_strip = max(
+        (_MAX_STRIP_SIZE // (image.shape[2] * num_bins) - window_height) //
+        window_step_vertical, 1)
+    descriptors = []
+    for start in range(0, n_rows, n_rows_per_strip):
+        n_strip_rows = min(n_rows_per_strip, n_rows - start)
+        first = start * window_step_vertical
+        last = first + (n_strip_rows - 1) * window_step_vertical + window_height
+        histograms = _strip_histograms(
+            image[:, first:last + 2], n_strip_rows, n_cols,
+            window_step_vertical, window_step_horizontal, window_height,
+            window_width, num_bins, cell_size, signed_gradient)
+        descriptors.append(_normalize_blocks(histograms, block_size,
+                                             l2_norm_clip))
+    centres = np.empty((len(row_centres), len(col_centres), 2),
+                       dtype=np.int32)
+    centres[..., 0] = row_centres[:, None]
+    centres[..., 1] = col_centres[None, :]
+    return np.concatenate(descriptors), centres
@@ -0,0 +1,42 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+
+cdef extern from "cpp/gaussian_filter.h":
+    void gaussian_filter[T](const T* input, const long long n_channels,
+                            const long long rows, const long long cols,
+                            const T* row_kernel, const long long row_radius,
+                            const T* col_kernel, const long long col_radius,
+                            T* output, const int n_threads) nogil
+
+
+cpdef gaussian_filter_cython(pixels, row_kernel, col_kernel, output,
+                             int n_threads=1):
+    # filters the C-contiguous (C, X, Y) float32 or float64 pixels with the
+    # symmetric 1D row and column kernels, into the C-contiguous output of
+    # the same shape and dtype
+    dtype = pixels.dtype
+    row_kernel = np.ascontiguousarray(row_kernel, dtype=dtype)
+    col_kernel = np.ascontiguousarray(col_kernel, dtype=dtype)
+    cdef long long n_channels = pixels.shape[0]
+    cdef long long rows = pixels.shape[1]
+    cdef long long cols = pixels.shape[2]
+    cdef long long row_radius = row_kernel.shape[0] // 2
+    cdef long long col_radius = col_kernel.shape[0] // 2
+    cdef void* input_data = np.PyArray_DATA(<np.ndarray> pixels)
+    cdef void* output_data = np.PyArray_DATA(<np.ndarray> output)
+    cdef void* row_data = np.PyArray_DATA(<np.ndarray> row_kernel)
+    cdef void* col_data = np.PyArray_DATA(<np.ndarray> col_kernel)
+    if dtype == np.float32:
+        with nogil:
+            gaussian_filter(<float*> input_data, n_channels, rows, cols,
+                            <float*> row_data, row_radius, <float*> col_data,
+                            col_radius, <float*> output_data, n_threads)
+    else:
+        with nogil:
+            gaussian_filter(<double*> input_data, n_channels, rows, cols,
+                            <double*> row_data, row_radius,
+                            <double*> col_data, col_radius,
+                            <double*> output_data, n_threads)
+    return output
@@ -9,25 +9,77 @@ ctypedef fused DOUBLE_TYPES:
 
 
 cdef extern from "cpp/central_difference.h":
-    void central_difference[T](const T* input, const Py_ssize_t rows,
-                               const Py_ssize_t cols, const Py_ssize_t n_channels,
-                               T* output)
+    void central_difference[T](const T* input, const long long n_channels,
+                               const long long n_dims, const long long* shape,
+                               const long long* strides, T* output,
+                               const int n_threads) nogil
 
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-cpdef gradient_cython(np.ndarray[DOUBLE_TYPES, ndim=3] input):
+cdef extern from "cpp/gradient_orientation.h":
+    void gradient_orientation[T](const T* gradient, const long long n_pixels,
+                                 const long long n_channels, T* magnitude,
+                                 T* components)
 
-    cdef Py_ssize_t n_channels = input.shape[0]
-    cdef Py_ssize_t rows = input.shape[1]
-    cdef Py_ssize_t cols = input.shape[2]
-    # Maintain the dtype that was passed in (float or double)
+
+cpdef gradient_cython(input, output=None, int n_threads=1):
+    # the derivatives of the (C, X, Y) or (C, X, Y, Z) float32 or float64
+    # input along every axis, which is read in place whatever its strides. They
+    # are written in the C-contiguous (n_dims * C, X, Y, ...) output, which is
+    # allocated if it is not given.
+    cdef long long n_dims = input.ndim - 1
+    if n_dims not in (2, 3):
+        raise ValueError("Only 2D and 3D images are supported")
     dtype = input.dtype
-    cdef np.ndarray[DOUBLE_TYPES, ndim=3] output = np.zeros((n_channels * 2,
-                                                            rows, cols),
-                                                            dtype=dtype)
+    if dtype != np.float32 and dtype != np.float64:
+        raise TypeError("Only float32 and float64 images are supported")
+    output_shape = (input.shape[0] * n_dims,) + input.shape[1:]
+    if output is None:
+        output = np.empty(output_shape, dtype=dtype)
+    elif (output.shape != output_shape or output.dtype != dtype or
+            not output.flags.c_contiguous or not output.flags.writeable):
+        raise ValueError("The output must be a writeable C-contiguous {} "
+                         "array of shape {}".format(dtype, output_shape))
+    cdef long long n_channels = input.shape[0]
+    cdef long long shape[3]
+    cdef long long strides[4]
+    cdef Py_ssize_t i
+    for i in range(n_dims):
+        shape[i] = input.shape[i + 1]
+    for i in range(n_dims + 1):
+        strides[i] = input.strides[i] // input.itemsize
+    cdef void* input_data = np.PyArray_DATA(<np.ndarray> input)
+    cdef void* output_data = np.PyArray_DATA(<np.ndarray> output)
+    if dtype == np.float32:
+        with nogil:
+            central_difference(<float*> input_data, n_channels, n_dims, shape,
+                               strides, <float*> output_data, n_threads)
+    else:
+        with nogil:
+            central_difference(<double*> input_data, n_channels, n_dims,
+                               shape, strides, <double*> output_data,
+                               n_threads)
+    return output
 
-    central_difference(&input[0,0,0], rows, cols, n_channels,
-                       &output[0,0,0])
 
-    return output
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef gradient_orientation_cython(
+        np.ndarray[DOUBLE_TYPES, ndim=3, mode='c'] gradient,
+        bint components=True):
+    # the magnitude and (optionally) the orientation sine and cosine
+    # components of the C-contiguous (2 * C, X, Y) output of gradient_cython
+    cdef Py_ssize_t n_channels = gradient.shape[0] // 2
+    cdef Py_ssize_t n_pixels = gradient.shape[1] * gradient.shape[2]
+    dtype = gradient.dtype
+    cdef np.ndarray[DOUBLE_TYPES, ndim=3] magnitude = np.empty(
+        (n_channels, gradient.shape[1], gradient.shape[2]), dtype=dtype)
+    cdef np.ndarray[DOUBLE_TYPES, ndim=3] orientation = None
+    if components:
+        orientation = np.empty((n_channels * 2, gradient.shape[1],
+                                gradient.shape[2]), dtype=dtype)
+        gradient_orientation(&gradient[0, 0, 0], n_pixels, n_channels,
+                             &magnitude[0, 0, 0], &orientation[0, 0, 0])
+    else:
+        gradient_orientation(&gradient[0, 0, 0], n_pixels, n_channels,
+                             &magnitude[0, 0, 0], <DOUBLE_TYPES*> NULL)
+    return magnitude, orientation
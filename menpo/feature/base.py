@@ -1,8 +1,12 @@
 from __future__ import division
-from functools import wraps
+from functools import wraps, partial
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from menpo.image import Image, MaskedImage, BooleanImage
 from menpo.transform import Translation, NonUniformScale
+from menpo.visualize import print_progress
+from .cache import _compute
 
 
 def lm_centres_correction(centres):
@@ -107,10 +111,13 @@ def ndfeature(wrapped):
         if not isinstance(image, np.ndarray):
             # Image supplied to ndarray feature -
             # extract pixels and go
-            feature = wrapped(image.pixels, *args, **kwargs)
+            feature = _compute(wrapped, image.pixels, args, kwargs)[0]
             return rebuild_feature_image(image, feature)
         else:
-            return wrapped(image, *args, **kwargs)
+            return _compute(wrapped, image, args, kwargs)[0]
+    # the kernel over raw arrays, for composing features (see Pipeline)
+    wrapper._kernel = wrapped
+    wrapper._returns_centres = False
     return wrapper
 
 
@@ -121,10 +128,183 @@ def winitfeature(wrapped):
         if not isinstance(image, np.ndarray):
             # Image supplied to ndarray feature -
             # extract pixels and go
-            feature, centres = wrapped(image.pixels, *args, **kwargs)
+            if isinstance(kwargs.get('patch_centres'), str):
+                # patches around one of the landmark groups of the image
+                kwargs['patch_centres'] = image.landmarks[
+                    kwargs['patch_centres']]
+            feature, centres = _compute(wrapped, image.pixels, args, kwargs)
+            if centres is None:
+                # features of patches - there is no image to rebuild
+                return feature
             return rebuild_feature_image_with_centres(image, feature, centres)
         else:
             # user just supplied ndarray - give them ndarray back
-            return wrapped(image, *args, **kwargs)[0]
-
+            return _compute(wrapped, image, args, kwargs)[0]
+    # the kernel also returns the window centres
+    wrapper._kernel = wrapped
+    wrapper._returns_centres = True
     return wrapper
+
+
+def _stage(feature):
+    # the function of a (possibly partial) feature and its bound arguments
+    args, kwargs = (), {}
+    while isinstance(feature, partial):
+        args = feature.args + args
+        kwargs = dict(feature.keywords or {}, **kwargs)
+        feature = feature.func
+    return feature, args, kwargs
+
+
+def _pixels(image):
+    # the pixels of an image or the array itself
+    return image.pixels if isinstance(image, Image) else image
+
+
+def _feature_pixels(feature, pixels):
+    # the feature pixels and, for the features that are computed in windows,
+    # the window centres. Module level so that it can be sent to worker
+    # processes.
+    function, args, kwargs = _stage(feature)
+    if getattr(function, '_returns_centres', False):
+        return _compute(function._kernel, pixels, args, kwargs)
+    return feature(pixels), None
+
+
+def _image_features(feature, images, i):
+    # the loaded image and its features
+    image = images[i]
+    return image, _feature_pixels(feature, _pixels(image))
+
+
+def _imap_batches(feature, images, n_workers, backend, batch_size):
+    # lazily computes the features of every image, along with the loaded
+    # image. Batches of images are distributed to the workers so that at
+    # most batch_size images are loaded at once. Threads load the images
+    # themselves, whilst the pixels are sent to the processes.
+    pool = None
+    if n_workers > 1:
+        pool = (ThreadPool if backend == 'threading' else Pool)(n_workers)
+    try:
+        for start in range(0, len(images), batch_size):
+            indices = range(start, min(start + batch_size, len(images)))
+            if pool is None:
+                results = [_image_features(feature, images, i)
+                           for i in indices]
+            elif backend == 'threading':
+                results = pool.map(
+                    lambda i: _image_features(feature, images, i), indices)
+            else:
+                loaded = [images[i] for i in indices]
+                results = zip(loaded, pool.map(
+                    partial(_feature_pixels, feature),
+                    [_pixels(image) for image in loaded]))
+            for result in results:
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def batch(feature, images, n_workers=1, backend='threading', batch_size=64,
+          verbose=False):
+    r"""
+    Computes a feature for every image of a collection, optionally in
+    parallel.
+
+    The feature is applied directly on the pixels of each image. If the
+    features of all the images have the same shape, they are written in a
+    single preallocated array, thus no feature image is rebuilt and no
+    landmarks are transformed per image. Otherwise, the feature image of
+    every image is rebuilt as if the feature was called on it.
+
+    Parameters
+    ----------
+    feature : `callable`
+        The feature to compute, e.g. :map:`hog` or a partial of it. It must
+        accept and return a ``(C, X, Y, ..., Z)`` `ndarray`.
+    images : `list` or :map:`LazyList` of :map:`Image` or `ndarray`
+        The images (or their pixels).
+    n_workers : `int`, optional
+        The number of workers that the images are distributed to. If ``1``,
+        the images are processed serially.
+    backend : {``threading``, ``multiprocessing``}, optional
+        Whether the workers are threads or processes. Threads load the
+        images themselves and are efficient for the features that release
+        the GIL, such as :map:`hog` and :map:`lbp`. Processes require the
+        feature to be picklable (e.g. a module level function or a partial of
+        it) and the pixels are sent to them.
+    batch_size : `int`, optional
+        The number of images that are distributed to the workers at once,
+        which bounds the number of images that are loaded at the same time.
+    verbose : `bool`, optional
+        If ``True``, the progress is printed.
+
+    Returns
+    -------
+    features : ``(n_images, C, X, Y, ..., Z)`` `ndarray` or `list`
+        The features of all the images in a single array or, if the shapes
+        of the features differ, a `list` with the features of each image as
+        if the feature was called on it. Thus, the features of an
+        :map:`Image` are an image with its mask and landmarks, whilst the
+        features of an `ndarray` are wrapped in an :map:`Image`. The
+        descriptors of patches (e.g. :map:`hog` with ``patch_centres``) are
+        returned as arrays.
+
+    Raises
+    ------
+    ValueError
+        The number of workers must be > 0
+    ValueError
+        Backend must be either threading or multiprocessing
+    ValueError
+        Batch size must be > 0
+    """
+    if n_workers < 1:
+        raise ValueError("The number of workers must be > 0")
+    if backend not in ['threading', 'multiprocessing']:
+        raise ValueError("Backend must be either threading or "
+                         "multiprocessing")
+    if batch_size < 1:
+        raise ValueError("Batch size must be > 0")
+    n_images = len(images)
+    results = _imap_batches(feature, images, n_workers, backend, batch_size)
+    if verbose:
+        results = print_progress(results, n_items=n_images,
+                                 prefix='Computing features')
+    # whether the feature is computed in windows
+    window = getattr(_stage(feature)[0], '_returns_centres', False)
+    output = None
+    # the window centres are kept in case the shapes differ
+    all_centres = []
+    feature_images = []
+    for i, (image, (pixels, centres)) in enumerate(results):
+        if i == 0:
+            output = np.empty((n_images,) + pixels.shape, dtype=pixels.dtype)
+        elif output is not None and pixels.shape != output.shape[1:]:
+            # the shapes differ - fall back to the features of each image,
+            # reloading the previous images to rebuild them
+            feature_images = [_feature_image(images[j], output[j].copy(), c,
+                                             window)
+                              for j, c in enumerate(all_centres)]
+            output = None
+        if output is not None:
+            output[i] = pixels
+            all_centres.append(centres)
+        else:
+            feature_images.append(_feature_image(image, pixels, centres,
+                                                 window))
+    return output if output is not None else feature_images
+
+
+def _feature_image(image, pixels, centres, window):
+    # the features as returned by calling an ndfeature or a winitfeature on
+    # the image
+    if window and centres is None:
+        # features of patches - there is no image to rebuild
+        return pixels
+    if not isinstance(image, Image):
+        return Image(pixels, copy=False)
+    if not window:
+        return rebuild_feature_image(image, pixels)
+    return rebuild_feature_image_with_centres(image, pixels, centres)
@@ -0,0 +1,282 @@
+from __future__ import division
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import os
+import pickle
+import re
+import shutil
+import threading
+import numpy as np
+
+
+# the stack of the active feature caches
+_feature_caches = []
+# the subdirectory of the cache directory that the features are stored in.
+# Only its subdirectories that are named after a key are cache entries.
+_ENTRIES_DIR = 'menpo_features'
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+
+def _as_tuple(result):
+    # the result of a feature as a tuple of arrays (and Nones)
+    return tuple(result) if isinstance(result, tuple) else (result,)
+
+
+def _compute(wrapped, pixels, args, kwargs):
+    # the result of the feature as a tuple, via the innermost active cache
+    if _feature_caches:
+        return _feature_caches[-1]._compute(wrapped, pixels, args, kwargs)
+    return _as_tuple(wrapped(pixels, *args, **kwargs))
+
+
+def _nbytes(entry):
+    return sum(a.nbytes for a in entry if a is not None)
+
+
+def _copy(entry):
+    return tuple(None if a is None else np.array(a) for a in entry)
+
+
+class FeatureCache(object):
+    r"""
+    A cache of the features that are computed within its context, so that
+    computing a feature again on the same pixels with the same arguments
+    returns the stored result.
+
+    The features are identified by a hash of their pixels, the name of the
+    feature and its arguments, thus any feature decorated by
+    :map:`ndfeature` (e.g. :map:`igo`, :map:`es`) or computed in windows
+    (:map:`hog`, :map:`lbp` and :map:`daisy`) is cached, whether it is
+    applied on an :map:`Image` or an `ndarray`. The arguments must be
+    picklable, otherwise the feature is not cached, and neither are the
+    features that are written in a given ``out`` array. Every call returns a
+    new copy of the stored features.
+
+    The most recently used features are kept in memory. If a ``cache_dir`` is
+    given, the features are also stored there, so that they are shared by
+    different caches and sessions, and they are memory-mapped when they are
+    read back. Each tier discards its least recently used features to stay
+    within its size budget.
+
+    Parameters
+    ----------
+    max_memory : `int`, optional
+        The size budget of the in-memory features in bytes.
+    cache_dir : `Path` or `str`, optional
+        The directory that the features are stored in. It is created if it
+        does not exist. The features are kept in its ``menpo_features``
+        subdirectory, thus any other content of the directory is never
+        modified. If ``None``, the features are only kept in memory.
+    max_disk : `int`, optional
+        The size budget of the features that are stored in ``cache_dir`` in
+        bytes.
+
+    Raises
+    ------
+    ValueError
+        The size budgets must be >= 0
+
+    Examples
+    --------
+    >>> cache = FeatureCache(cache_dir='~/.menpo_features')
+    >>> with cache:
+    >>>     features = [hog(image) for image in images]
+    >>> print(cache)
+    """
+    def __init__(self, max_memory=2 ** 28, cache_dir=None, max_disk=2 ** 32):
+        if max_memory < 0 or max_disk < 0:
+            raise ValueError("The size budgets must be >= 0")
+        # a feature that is stored on disk by an older version may differ
+        from menpo import __version__
+        self._version = __version__
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.cache_dir = None
+        self._entries_dir = None
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.RLock()
+        self.n_memory_hits = 0
+        self.n_disk_hits = 0
+        self.n_misses = 0
+        if cache_dir is not None:
+            self.cache_dir = Path(cache_dir).expanduser()
+            self._entries_dir = self.cache_dir / _ENTRIES_DIR
+            if not self._entries_dir.exists():
+                self._entries_dir.mkdir(parents=True)
+            self._scan_disk()
+
+    @property
+    def n_hits(self):
+        r"""
+        The number of features that were found in the cache.
+
+        :type: `int`
+        """
+        return self.n_memory_hits + self.n_disk_hits
+
+    @property
+    def memory_size(self):
+        r"""
+        The size of the features that are kept in memory in bytes.
+
+        :type: `int`
+        """
+        return self._memory_size
+
+    @property
+    def disk_size(self):
+        r"""
+        The size of the features that are stored on disk in bytes.
+
+        :type: `int`
+        """
+        return self._disk_size
+
+    def clear(self):
+        r"""
+        Discards all the cached features, including the ones on disk.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            for key in list(self._disk):
+                self._remove_from_disk(key)
+
+    def _key(self, wrapped, pixels, args, kwargs):
+        arguments = pickle.dumps((args, sorted(kwargs.items())), protocol=2)
+        pixels = np.ascontiguousarray(pixels)
+        h = hashlib.sha1()
+        h.update('{}.{} {} {} {}'.format(
+            wrapped.__module__, wrapped.__name__, self._version,
+            pixels.dtype.str, pixels.shape).encode('utf-8'))
+        h.update(arguments)
+        h.update(pixels.data)
+        return h.hexdigest()
+
+    def _compute(self, wrapped, pixels, args, kwargs):
+        if kwargs.get('out') is not None:
+            # the features must be written in the given array
+            return _as_tuple(wrapped(pixels, *args, **kwargs))
+        try:
+            key = self._key(wrapped, pixels, args, kwargs)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # the arguments cannot be identified
+            return _as_tuple(wrapped(pixels, *args, **kwargs))
+        with self._lock:
+            entry = self._get(key)
+        if entry is None:
+            entry = _as_tuple(wrapped(pixels, *args, **kwargs))
+            self._put(key, entry)
+        return _copy(entry)
+
+    def _get(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory[key] = entry
+            self.n_memory_hits += 1
+            return entry
+        if key in self._disk:
+            entry = self._load(key)
+            if entry is not None:
+                self._disk[key] = self._disk.pop(key)
+                self._keep_in_memory(key, entry)
+                self.n_disk_hits += 1
+                return entry
+        self.n_misses += 1
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._keep_in_memory(key, entry)
+        if (self.cache_dir is not None and key not in self._disk and
+                _nbytes(entry) <= self.max_disk):
+            self._save(key, entry)
+
+    def _keep_in_memory(self, key, entry):
+        nbytes = _nbytes(entry)
+        if key in self._memory or nbytes > self.max_memory:
+            return
+        self._memory[key] = entry
+        self._memory_size += nbytes
+        while self._memory_size > self.max_memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= _nbytes(old)
+
+    def _scan_disk(self):
+        # the stored features, from the least to the most recently used
+        entries = []
+        for path in self._entries_dir.iterdir():
+            if path.is_dir() and _KEY_PATTERN.match(path.name):
+                entries.append((path.stat().st_mtime, path.name,
+                                sum(f.stat().st_size
+                                    for f in path.iterdir())))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def _save(self, key, entry):
+        # the arrays are written in a temporary directory that is then
+        # renamed, so that a partially stored feature is never read
+        tmp = self._entries_dir / '.{}-{}-{}'.format(
+            key, os.getpid(), threading.current_thread().ident)
+        tmp.mkdir()
+        for i, a in enumerate(entry):
+            if a is None:
+                (tmp / '{}.none'.format(i)).touch()
+            else:
+                np.save(str(tmp / '{}.npy'.format(i)), np.ascontiguousarray(a))
+        size = sum(f.stat().st_size for f in tmp.iterdir())
+        try:
+            tmp.rename(self._entries_dir / key)
+        except OSError:
+            # stored by another cache in the meantime
+            shutil.rmtree(str(tmp))
+            return
+        with self._lock:
+            self._disk[key] = size
+            self._disk_size += size
+            while self._disk_size > self.max_disk:
+                self._remove_from_disk(next(iter(self._disk)))
+
+    def _load(self, key):
+        path = self._entries_dir / key
+        entry = []
+        try:
+            while True:
+                npy = path / '{}.npy'.format(len(entry))
+                if npy.exists():
+                    entry.append(np.load(str(npy), mmap_mode='r'))
+                elif (path / '{}.none'.format(len(entry))).exists():
+                    entry.append(None)
+                else:
+                    break
+            os.utime(str(path), None)
+        except (IOError, OSError, ValueError):
+            entry = []
+        if not entry:
+            # removed by another cache
+            self._disk_size -= self._disk.pop(key)
+            return None
+        return tuple(entry)
+
+    def _remove_from_disk(self, key):
+        self._disk_size -= self._disk.pop(key)
+        shutil.rmtree(str(self._entries_dir / key), ignore_errors=True)
+
+    def __enter__(self):
+        _feature_caches.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _feature_caches.remove(self)
+
+    def __str__(self):
+        return ('Feature cache with {} features in memory ({} bytes) and {} '
+                'on disk ({} bytes): {} memory hits, {} disk hits and {} '
+                'misses'.format(len(self._memory), self._memory_size,
+                                len(self._disk), self._disk_size,
+                                self.n_memory_hits, self.n_disk_hits,
+                                self.n_misses))
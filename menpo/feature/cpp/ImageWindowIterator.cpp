@@ -3,7 +3,9 @@
 #include <math.h>
 #include <stdlib.h>
 
-ImageWindowIterator::ImageWindowIterator(double *image, unsigned int imageHeight, unsigned int imageWidth, unsigned int numberOfChannels,
+ImageWindowIterator::ImageWindowIterator(const void *image, ImageType imageType,
+        unsigned int imageHeight, unsigned int imageWidth, unsigned int numberOfChannels,
+        long rowStride, long columnStride, long channelStride,
 		unsigned int windowHeight, unsigned int windowWidth, unsigned int windowStepHorizontal,
 		unsigned int windowStepVertical, bool enablePadding) {
     unsigned int numberOfWindowsHorizontally, numberOfWindowsVertically;
@@ -19,6 +21,10 @@ ImageWindowIterator::ImageWindowIterator(double *image, unsigned int imageHeight
     }
 
 	this->_image = image;
+	this->_imageType = imageType;
+	this->_rowStride = rowStride;
+	this->_columnStride = columnStride;
+	this->_channelStride = channelStride;
 	this->_imageHeight = imageHeight;
 	this->_imageWidth = imageWidth;
 	this->_numberOfChannels = numberOfChannels;
@@ -35,63 +41,110 @@ ImageWindowIterator::~ImageWindowIterator() {
 }
 
 
-void ImageWindowIterator::apply(double *outputImage, int *windowsCenters, WindowFeature *windowFeature) {
-	int rowCenter, rowFrom, rowTo, columnCenter, columnFrom, columnTo, i, j, k;
-	unsigned int windowIndexHorizontal, windowIndexVertical, d;
+void ImageWindowIterator::apply(double *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+        unsigned int numberOfThreads, double imageScale) {
+    applyTyped(outputImage, windowsCenters, windowFeature, numberOfThreads, imageScale);
+}
+
+
+void ImageWindowIterator::apply(float *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+        unsigned int numberOfThreads, double imageScale) {
+    applyTyped(outputImage, windowsCenters, windowFeature, numberOfThreads, imageScale);
+}
+
+
+template <typename OutputType>
+void ImageWindowIterator::applyTyped(OutputType *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+        unsigned int numberOfThreads, double imageScale) {
+    int windowIndexVertical;
+    int numberOfWindowsVertically = (int)_numberOfWindowsVertically;
+
+    // Rows of windows are split across the threads. Without OpenMP the
+    // pragmas are ignored and the rows are processed serially.
+    #pragma omp parallel num_threads(numberOfThreads)
+    {
+        // Initialize temporary matrices (one set per thread)
+        double* windowImage = new double[_windowHeight*_windowWidth*_numberOfChannels];
+        double* descriptorVector = new double[windowFeature->descriptorLengthPerWindow];
+
+        // Main loop
+        #pragma omp for schedule(dynamic)
+        for (windowIndexVertical = 0; windowIndexVertical < numberOfWindowsVertically; windowIndexVertical++)
+            applyOnRow(outputImage, windowsCenters, windowFeature, (unsigned int)windowIndexVertical,
+                       imageScale, windowImage, descriptorVector);
+
+        // Free temporary matrices
+        delete[] windowImage;
+        delete[] descriptorVector;
+    }
+}
+
+
+template <typename ImageElementType>
+void ImageWindowIterator::copyWindow(const ImageElementType *image, int rowFrom, int columnFrom,
+        double imageScale, double *windowImage) {
+	int i, j, k;
+	int rowTo = rowFrom + (int)_windowHeight - 1;
+	int columnTo = columnFrom + (int)_windowWidth - 1;
 	int imageHeight = (int)_imageHeight;
 	int imageWidth = (int)_imageWidth;
 	int numberOfChannels = (int)_numberOfChannels;
 
-    // Initialize temporary matrices
-	double* windowImage = new double[_windowHeight*_windowWidth*_numberOfChannels];
-	double* descriptorVector = new double[windowFeature->descriptorLengthPerWindow];
-
-    // Main loop
-    for (windowIndexVertical = 0; windowIndexVertical < _numberOfWindowsVertically; windowIndexVertical++) {
-        for (windowIndexHorizontal = 0; windowIndexHorizontal < _numberOfWindowsHorizontally; windowIndexHorizontal++) {
-            // Find window limits
-            if (!_enablePadding) {
-                rowFrom = windowIndexVertical*_windowStepVertical;
-                rowTo = rowFrom + _windowHeight - 1;
-                rowCenter = rowFrom + (int)round((double)_windowHeight / 2.0) - 1;
-                columnFrom = windowIndexHorizontal*_windowStepHorizontal;
-                columnTo = columnFrom + _windowWidth - 1;
-                columnCenter = columnFrom + (int)round((double)_windowWidth / 2.0) - 1;
-            }
-            else {
-                rowCenter = windowIndexVertical*_windowStepVertical;
-                rowFrom = rowCenter - (int)round((double)_windowHeight / 2.0) + 1;
-                rowTo = rowFrom + _windowHeight - 1;
-                columnCenter = windowIndexHorizontal*_windowStepHorizontal;
-                columnFrom = columnCenter - (int)ceil((double)_windowWidth / 2.0) + 1;
-                columnTo = columnFrom + _windowWidth - 1;
-            }
-
-            // Copy window image
-			for (i = rowFrom; i <= rowTo; i++) {
-				for (j = columnFrom; j <= columnTo; j++) {
-					if (i < 0 || i > imageHeight-1 || j < 0 || j > imageWidth-1)
-						for (k = 0; k < numberOfChannels; k++)
-							windowImage[(i-rowFrom)+_windowHeight*((j-columnFrom)+_windowWidth*k)] = 0;
-					else
-						for (k=0; k < numberOfChannels; k++)
-							windowImage[(i-rowFrom)+_windowHeight*((j-columnFrom)+_windowWidth*k)] = _image[i+imageHeight*(j+imageWidth*k)];
-				}
-			}
-
-            // Compute descriptor of window
-            windowFeature->apply(windowImage, descriptorVector);
-
-            // Store results
-            for (d = 0; d < windowFeature->descriptorLengthPerWindow; d++)
-            	outputImage[windowIndexVertical+_numberOfWindowsVertically*(windowIndexHorizontal+_numberOfWindowsHorizontally*d)] = descriptorVector[d];
-            windowsCenters[windowIndexVertical+_numberOfWindowsVertically*windowIndexHorizontal] = rowCenter;
-            windowsCenters[windowIndexVertical+_numberOfWindowsVertically*(windowIndexHorizontal+_numberOfWindowsHorizontally)] = columnCenter;
+	for (i = rowFrom; i <= rowTo; i++) {
+		for (j = columnFrom; j <= columnTo; j++) {
+			if (i < 0 || i > imageHeight-1 || j < 0 || j > imageWidth-1)
+				for (k = 0; k < numberOfChannels; k++)
+					windowImage[(i-rowFrom)+_windowHeight*((j-columnFrom)+_windowWidth*k)] = 0;
+			else
+				for (k = 0; k < numberOfChannels; k++)
+					windowImage[(i-rowFrom)+_windowHeight*((j-columnFrom)+_windowWidth*k)] =
+					    imageScale * (double)image[i*_rowStride + j*_columnStride + k*_channelStride];
+		}
+	}
+}
+
+
+template <typename OutputType>
+void ImageWindowIterator::applyOnRow(OutputType *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+        unsigned int windowIndexVertical, double imageScale, double *windowImage, double *descriptorVector) {
+	int rowCenter, rowFrom, columnCenter, columnFrom;
+	unsigned int windowIndexHorizontal, d;
+
+    for (windowIndexHorizontal = 0; windowIndexHorizontal < _numberOfWindowsHorizontally; windowIndexHorizontal++) {
+        // Find window limits
+        if (!_enablePadding) {
+            rowFrom = windowIndexVertical*_windowStepVertical;
+            rowCenter = rowFrom + (int)round((double)_windowHeight / 2.0) - 1;
+            columnFrom = windowIndexHorizontal*_windowStepHorizontal;
+            columnCenter = columnFrom + (int)round((double)_windowWidth / 2.0) - 1;
+        }
+        else {
+            rowCenter = windowIndexVertical*_windowStepVertical;
+            rowFrom = rowCenter - (int)round((double)_windowHeight / 2.0) + 1;
+            columnCenter = windowIndexHorizontal*_windowStepHorizontal;
+            columnFrom = columnCenter - (int)ceil((double)_windowWidth / 2.0) + 1;
         }
-    }
 
-    // Free temporary matrices
-    delete[] windowImage;
-    delete[] descriptorVector;
-}
+        // Copy window image
+        switch (_imageType) {
+            case UINT8_IMAGE:
+                copyWindow((const unsigned char *)_image, rowFrom, columnFrom, imageScale, windowImage);
+                break;
+            case FLOAT_IMAGE:
+                copyWindow((const float *)_image, rowFrom, columnFrom, imageScale, windowImage);
+                break;
+            default:
+                copyWindow((const double *)_image, rowFrom, columnFrom, imageScale, windowImage);
+        }
 
+        // Compute descriptor of window
+        windowFeature->apply(windowImage, descriptorVector);
+
+        // Store results
+        for (d = 0; d < windowFeature->descriptorLengthPerWindow; d++)
+        	outputImage[windowIndexVertical+_numberOfWindowsVertically*(windowIndexHorizontal+_numberOfWindowsHorizontally*d)] =
+        	    (OutputType)descriptorVector[d];
+        windowsCenters[windowIndexVertical+_numberOfWindowsVertically*windowIndexHorizontal] = rowCenter;
+        windowsCenters[windowIndexVertical+_numberOfWindowsVertically*(windowIndexHorizontal+_numberOfWindowsHorizontally)] = columnCenter;
+    }
+}
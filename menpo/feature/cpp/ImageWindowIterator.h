@@ -1,6 +1,9 @@
 #pragma once
 #include "WindowFeature.h"
 
+// The element types of the images that can be iterated
+enum ImageType { UINT8_IMAGE, FLOAT_IMAGE, DOUBLE_IMAGE };
+
 class ImageWindowIterator {
 public:
 	unsigned int _numberOfWindowsHorizontally, _numberOfWindowsVertically, _numberOfWindows;
@@ -8,11 +11,32 @@ public:
     unsigned int _windowHeight, _windowWidth;
     unsigned int _windowStepHorizontal, _windowStepVertical;
     bool _enablePadding;
-	ImageWindowIterator(double *image, unsigned int imageHeight, unsigned int imageWidth, unsigned int numberOfChannels,
+    // The image is read in place with the given strides (in elements), thus
+    // any memory layout is supported without copying it
+	ImageWindowIterator(const void *image, ImageType imageType,
+	        unsigned int imageHeight, unsigned int imageWidth, unsigned int numberOfChannels,
+	        long rowStride, long columnStride, long channelStride,
 	        unsigned int windowHeight, unsigned int windowWidth, unsigned int windowStepHorizontal,
 			unsigned int windowStepVertical, bool enablePadding);
 	virtual ~ImageWindowIterator();
-	void apply(double *outputImage, int *windowsCenters, WindowFeature *windowFeature);
+	// The values of the image are multiplied by imageScale when they are
+	// copied in the window
+	void apply(double *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+	        unsigned int numberOfThreads = 1, double imageScale = 1.0);
+	void apply(float *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+	        unsigned int numberOfThreads = 1, double imageScale = 1.0);
 private:
-	double *_image;
+	const void *_image;
+	ImageType _imageType;
+	long _rowStride, _columnStride, _channelStride;
+	template <typename OutputType>
+	void applyTyped(OutputType *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+	        unsigned int numberOfThreads, double imageScale);
+	template <typename OutputType>
+	void applyOnRow(OutputType *outputImage, int *windowsCenters, WindowFeature *windowFeature,
+	        unsigned int windowIndexVertical, double imageScale, double *windowImage,
+	        double *descriptorVector);
+	template <typename ImageElementType>
+	void copyWindow(const ImageElementType *image, int rowFrom, int columnFrom,
+	        double imageScale, double *windowImage);
 };
@@ -13,32 +13,30 @@ using namespace std;
 
 class LBP: public WindowFeature {
 public:
+	// The codes of the radius/samples combinations that share a samples
+	// value are mapped with the same table (mappingTables[whichMappingTable[i]]),
+	// which are owned by the caller. A NULL table leaves the codes unmapped.
 	LBP(unsigned int windowHeight, unsigned int windowWidth,
 	    unsigned int numberOfChannels, unsigned int *radius,
 	    unsigned int *samples, unsigned int numberOfRadiusSamplesCombinations,
-	    unsigned int mapping_type, unsigned int *uniqueSamples,
-	    unsigned int *whichMappingTable, unsigned int numberOfUniqueSamples);
+	    unsigned int **mappingTables, unsigned int *whichMappingTable);
 	virtual ~LBP();
 	void apply(double *windowImage, double *descriptorVector);
 private:
     unsigned int *samples, *whichMappingTable, **mapping_tables;
     unsigned int numberOfRadiusSamplesCombinations, windowHeight, windowWidth,
                  numberOfChannels;
-    double **samples_x_tables, **samples_y_tables;
+    // the (up to) four pixels that each sample of all the radius/samples
+    // combinations is interpolated from and their weights
+    unsigned int *samplesOffsets;
+    double *samplesWeights;
+    unsigned int centreOffset;
 };
 
 void LBPdescriptor(double *inputImage, unsigned int *samples,
                    unsigned int numberOfRadiusSamplesCombinations,
-                   double **samples_x_tables, double **samples_y_tables,
-                   unsigned int *whichMappingTable,
+                   unsigned int *samplesOffsets, double *samplesWeights,
+                   unsigned int centreOffset, unsigned int *whichMappingTable,
                    unsigned int **mapping_tables, unsigned int imageHeight,
                    unsigned int imageWidth, unsigned int numberOfChannels,
                    double *descriptorVector);
-int power2(int index);
-void generate_codes_mapping_table(unsigned int *mapping_table,
-                                  unsigned int mapping_type,
-                                  unsigned int n_samples);
-int count_bit_transitions(int a, unsigned int n_samples);
-int count_bits(int n);
-int leftRotate(int num, unsigned int len_bits, unsigned int move_bits);
-
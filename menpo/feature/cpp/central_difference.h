@@ -1,55 +1,76 @@
-#include <stdio.h>
+#pragma once
 
-static inline long long SUB2IND(const long long j, const long long i, const long long k,
-                                const long long row_size, const long long col_size,
-                                const long long n_channels) {
-    //return ((i + col_size * j) * n_channels) + k;
-    return (i + col_size * j) + (row_size * col_size * k);
+// The difference between the next and the previous element of every column
+// of a line of the image along an axis, i.e. the central difference in the
+// interior of the axis, the one-sided difference at its boundaries and zero
+// if it has a single element.
+template<typename T>
+static inline void axis_difference(const T* line, const long long axis_stride,
+                                   const long long position, const long long size,
+                                   const long long cols, const long long col_stride,
+                                   T* out) {
+    const T* previous = position > 0 ? line - axis_stride : line;
+    const T* next = position < size - 1 ? line + axis_stride : line;
+    const T scale = (position > 0 && position < size - 1) ? T(0.5) : T(1);
+    if (col_stride == 1) {
+        for (long long i = 0; i < cols; ++i)
+            out[i] = (next[i] - previous[i]) * scale;
+    }
+    else {
+        for (long long i = 0; i < cols; ++i)
+            out[i] = (next[i * col_stride] - previous[i * col_stride]) * scale;
+    }
 }
 
+// The difference along the line itself
 template<typename T>
-void central_difference(const T* in, const long long rows,
-                        const long long cols, const long long n_channels,
-                        T* out) {
-    const long long n_output_channels = n_channels * 2;
-    long long output_index = 0;
+static inline void line_difference(const T* line, const long long cols,
+                                   const long long col_stride, T* out) {
+    if (cols == 1) {
+        out[0] = 0;
+        return;
+    }
+    out[0] = line[col_stride] - line[0];
+    for (long long i = 1; i < cols - 1; ++i)
+        out[i] = (line[(i + 1) * col_stride] - line[(i - 1) * col_stride]) * T(0.5);
+    out[cols - 1] = line[(cols - 1) * col_stride] - line[(cols - 2) * col_stride];
+}
 
-    #pragma omp for
-    for (long long k = 0; k < n_channels; ++k) {
-        // row-derivative
-        for (long long i = 0; i < cols; ++i) {
-            for (long long j = 0; j < rows; ++j) {
-                if (j == 0) {
-                    output_index = SUB2IND(0, i, k, rows, cols, n_output_channels);
-                    out[output_index] = in[SUB2IND(1, i, k, rows, cols, n_channels)] - in[SUB2IND(0, i, k, rows, cols, n_channels)];
-                }
-                else if (j == rows - 1) {
-                    output_index = SUB2IND(j, i, k, rows, cols, n_output_channels);
-                    out[output_index] = in[SUB2IND(j, i, k, rows, cols, n_channels)] - in[SUB2IND(j - 1, i, k, rows, cols, n_channels)];
-                }
-                else {
-                    output_index = SUB2IND(j, i, k, rows, cols, n_output_channels);
-                    out[output_index] = (in[SUB2IND(j + 1, i, k, rows, cols, n_channels)] - in[SUB2IND(j - 1, i, k, rows, cols, n_channels)]) / 2.0;
-                }
-            }
-        }
+// The derivatives along every axis of every channel of an image with 2 or 3
+// spatial dimensions. The image is read in place with the given strides (in
+// elements, channels first) and the output is C-contiguous, with the
+// derivatives of all the channels along the first axis, then those along the
+// second axis, etc. The lines of the image are split across the threads.
+template<typename T>
+void central_difference(const T* in, const long long n_channels,
+                        const long long n_dims, const long long* shape,
+                        const long long* strides, T* out,
+                        const int n_threads) {
+    // the image is a (n_channels, depth, rows, cols) volume
+    const long long depth = n_dims == 3 ? shape[0] : 1;
+    const long long rows = shape[n_dims - 2];
+    const long long cols = shape[n_dims - 1];
+    const long long depth_stride = n_dims == 3 ? strides[1] : 0;
+    const long long row_stride = strides[n_dims - 1];
+    const long long col_stride = strides[n_dims];
+    const long long plane_size = depth * rows * cols;
+    const long long n_lines = n_channels * depth * rows;
 
-        // column-derivative
-        for (long long j = 0; j < rows; ++j) {
-            for (long long i = 0; i < cols; ++i) {
-                if (i == 0) {
-                    output_index = SUB2IND(j, 0, n_channels + k , rows, cols, n_output_channels);
-                    out[output_index] = in[SUB2IND(j, 1, k, rows, cols, n_channels)] - in[SUB2IND(j, 0, k, rows, cols, n_channels)];
-                }
-                else if (i == cols - 1) {
-                    output_index = SUB2IND(j, cols - 1, n_channels + k, rows, cols, n_output_channels);
-                    out[output_index] = in[SUB2IND(j, i, k, rows, cols, n_channels)] - in[SUB2IND(j, i - 1, k, rows, cols, n_channels)];
-                }
-                else {
-                    output_index = SUB2IND(j, i, n_channels + k, rows, cols, n_output_channels);
-                    out[output_index] = (in[SUB2IND(j, i + 1, k, rows, cols, n_channels)] - in[SUB2IND(j, i - 1, k, rows, cols, n_channels)]) / 2.0;
-                }
-            }
+    #pragma omp parallel for num_threads(n_threads) schedule(static)
+    for (long long line = 0; line < n_lines; ++line) {
+        const long long k = line / (depth * rows);
+        const long long d = (line / rows) % depth;
+        const long long r = line % rows;
+        const T* in_line = in + k * strides[0] + d * depth_stride + r * row_stride;
+        // the position of the line within an output channel
+        const long long offset = (d * rows + r) * cols;
+        if (n_dims == 3) {
+            axis_difference(in_line, depth_stride, d, depth, cols, col_stride,
+                            out + k * plane_size + offset);
         }
+        axis_difference(in_line, row_stride, r, rows, cols, col_stride,
+                        out + ((n_dims - 2) * n_channels + k) * plane_size + offset);
+        line_difference(in_line, cols, col_stride,
+                        out + ((n_dims - 1) * n_channels + k) * plane_size + offset);
     }
 }
@@ -0,0 +1,76 @@
+#pragma once
+#include <vector>
+
+// The index of the element of an axis of the given size that is read at
+// position i, when the axis is extended by reflection about the edges of its
+// first and last elements (scipy.ndimage's 'reflect' mode)
+static inline long long reflect_index(long long i, const long long size) {
+    const long long period = 2 * size;
+    i %= period;
+    if (i < 0)
+        i += period;
+    return i < size ? i : period - 1 - i;
+}
+
+// The separable filtering of every channel of a C-contiguous
+// (n_channels, rows, cols) image with the symmetric 1D kernels of the given
+// radii along the rows and the columns. Every output row is obtained by
+// filtering the input rows around it along the first axis into a buffer,
+// which is extended by reflection, and filtering the buffer along the second
+// axis, thus no intermediate image is stored. The rows of all the channels
+// are split across the threads.
+template<typename T>
+void gaussian_filter(const T* in, const long long n_channels,
+                     const long long rows, const long long cols,
+                     const T* row_kernel, const long long row_radius,
+                     const T* col_kernel, const long long col_radius,
+                     T* out, const int n_threads) {
+    const long long n_lines = n_channels * rows;
+    const long long plane_size = rows * cols;
+
+    #pragma omp parallel num_threads(n_threads)
+    {
+        std::vector<T> buffer(cols + 2 * col_radius);
+        std::vector<const T*> previous(row_radius + 1), next(row_radius + 1);
+
+        #pragma omp for schedule(static)
+        for (long long line = 0; line < n_lines; ++line) {
+            const long long k = line / rows;
+            const long long r = line % rows;
+            const T* channel = in + k * plane_size;
+            for (long long i = 0; i <= row_radius; ++i) {
+                previous[i] = channel + reflect_index(r - i, rows) * cols;
+                next[i] = channel + reflect_index(r + i, rows) * cols;
+            }
+            // filter along the first axis
+            T* filtered = &buffer[col_radius];
+            const T centre = row_kernel[row_radius];
+            for (long long c = 0; c < cols; ++c)
+                filtered[c] = centre * next[0][c];
+            for (long long i = 1; i <= row_radius; ++i) {
+                const T weight = row_kernel[row_radius + i];
+                const T* p = previous[i];
+                const T* n = next[i];
+                for (long long c = 0; c < cols; ++c)
+                    filtered[c] += weight * (p[c] + n[c]);
+            }
+            // extend the filtered row by reflection
+            for (long long i = 1; i <= col_radius; ++i) {
+                filtered[-i] = filtered[reflect_index(-i, cols)];
+                filtered[cols - 1 + i] = filtered[reflect_index(cols - 1 + i, cols)];
+            }
+            // filter along the second axis
+            T* out_row = out + k * plane_size + r * cols;
+            const T col_centre = col_kernel[col_radius];
+            for (long long c = 0; c < cols; ++c)
+                out_row[c] = col_centre * filtered[c];
+            for (long long i = 1; i <= col_radius; ++i) {
+                const T weight = col_kernel[col_radius + i];
+                const T* left = filtered - i;
+                const T* right = filtered + i;
+                for (long long c = 0; c < cols; ++c)
+                    out_row[c] += weight * (left[c] + right[c]);
+            }
+        }
+    }
+}
@@ -0,0 +1,38 @@
+#pragma once
+#include <math.h>
+
+// Given the gradient of an image, i.e. the row derivatives of all the
+// channels followed by the column derivatives, computes the gradient
+// magnitude of each channel and, if components is not NULL, the sine and
+// cosine of the angle of each complex number (row + i * column), i.e. the
+// normalized column and row derivatives. The angle of a zero gradient is 0.
+template<typename T>
+void gradient_orientation(const T* gradient, const long long n_pixels,
+                          const long long n_channels, T* magnitude,
+                          T* components) {
+    for (long long k = 0; k < n_channels; ++k) {
+        const T* row_derivative = gradient + k * n_pixels;
+        const T* column_derivative = gradient + (n_channels + k) * n_pixels;
+        T* channel_magnitude = magnitude + k * n_pixels;
+        for (long long i = 0; i < n_pixels; ++i) {
+            const T dy = row_derivative[i];
+            const T dx = column_derivative[i];
+            channel_magnitude[i] = sqrt(dy * dy + dx * dx);
+        }
+        if (components == NULL)
+            continue;
+        T* sine = components + k * n_pixels;
+        T* cosine = components + (n_channels + k) * n_pixels;
+        for (long long i = 0; i < n_pixels; ++i) {
+            const T m = channel_magnitude[i];
+            if (m > 0) {
+                sine[i] = column_derivative[i] / m;
+                cosine[i] = row_derivative[i] / m;
+            }
+            else {
+                sine[i] = 0;
+                cosine[i] = 1;
+            }
+        }
+    }
+}
@@ -1,12 +1,16 @@
 from __future__ import division
 import itertools
 import warnings
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 import numpy as np
-scipy_gaussian_filter = None  # expensive
+scipy_correlate1d = None  # expensive
 
 from .base import ndfeature, winitfeature, imgfeature
-from ._gradient import gradient_cython
+from ._gradient import gradient_cython, gradient_orientation_cython
+from ._gaussian import gaussian_filter_cython
 from .windowiterator import WindowIterator, WindowIteratorResult
+from ._dense_hog import dense_dalaltriggs_hog
 
 
 def _np_gradient(pixels):
@@ -39,7 +43,7 @@ def _np_gradient(pixels):
 
 
 @ndfeature
-def gradient(pixels):
+def gradient(pixels, out=None, n_threads=1):
     r"""
     Calculates the gradient of an input image. The image is assumed to have
     channel information on the first axis. In the case of multiple channels,
@@ -56,7 +60,18 @@ def gradient(pixels):
         is interpreted as channels. This means an N-dimensional image is
         represented by an N+1 dimensional array.
         If the image is 2-dimensional the pixels should be of type
-        float/double (int is not supported).
+        float/double (int is not supported). 2D and 3D float/double images
+        are read in place, whatever their memory layout.
+    out : ``(N * C, X, Y, ..., Z)`` `ndarray`, optional
+        The C-contiguous array that the gradient of the pixels is written
+        into, for instance to reuse it across the iterations of a fitting
+        loop. It must have the dtype of the gradient. If an :map:`Image` is
+        given, the pixels of the gradient image are this array.
+    n_threads : `int`, optional
+        The number of threads that the rows of 2D and 3D images are split
+        across. The result is identical to the serial computation. Note that
+        threads are only used if menpo was built with OpenMP support, which
+        is not the case with the default compiler on OSX.
 
     Returns
     -------
@@ -68,42 +83,253 @@ def gradient(pixels):
         ``I[:, 0, 0] = [R0_y, G0_y, B0_y, R0_x, G0_x, B0_x]``. To be clear,
         all the ``y``-gradients are returned over each channel, then all
         the ``x``-gradients.
+
+    Raises
+    ------
+    ValueError
+        The number of threads must be > 0
+    ValueError
+        The output must be a writeable C-contiguous array of the shape and
+        dtype of the gradient
     """
-    if (pixels.ndim - 1) == 2:  # 2D Image
-        return gradient_cython(pixels)
-    else:
-        return _np_gradient(pixels)
+    if n_threads < 1:
+        raise ValueError("The number of threads must be > 0")
+    if pixels.ndim == 3 or (pixels.ndim == 4 and
+                            pixels.dtype in (np.float32, np.float64)):
+        return gradient_cython(pixels, output=out, n_threads=n_threads)
+    grad = _np_gradient(pixels)
+    if out is not None:
+        if (out.shape != grad.shape or out.dtype != grad.dtype or
+                not out.flags.c_contiguous or not out.flags.writeable):
+            raise ValueError("The output must be a writeable C-contiguous {} "
+                             "array of shape {}".format(grad.dtype,
+                                                        grad.shape))
+        out[...] = grad
+        grad = out
+    return grad
+
+
+# the stack of the caches of the active gradient_cache contexts
+_gradient_caches = []
+
+
+@contextmanager
+def gradient_cache():
+    r"""
+    Context manager within which the gradient, its magnitude and its
+    orientation are computed once per image and shared by the gradient based
+    features (:map:`igo`, :map:`es` and :map:`daisy`) that are applied to it.
+
+    The images are identified by their pixels, thus they must not be modified
+    in place within the context.
+
+    Examples
+    --------
+    >>> with gradient_cache():
+    >>>     igo_image = igo(image, double_angles=True)
+    >>>     es_image = es(image)
+    """
+    cache = {}
+    _gradient_caches.append(cache)
+    try:
+        yield
+    finally:
+        _gradient_caches.remove(cache)
+
+
+def _gradient_orientation(pixels, components=False):
+    # the gradient of the 2D pixels, its magnitude per channel and, if
+    # components is True, the sine and cosine of the angles of the complex
+    # (row derivative + 1j * column derivative) gradients, which are computed
+    # in a single native pass. They are shared within gradient_cache(), so
+    # they must not be modified.
+    cache = _gradient_caches[-1] if _gradient_caches else {}
+    # the pixels are kept so that their id cannot be reused
+    _, grad, magnitude, orientation = cache.get(id(pixels),
+                                                (pixels, None, None, None))
+    if grad is None:
+        grad = gradient_cython(pixels)
+        grad.flags.writeable = False
+    if magnitude is None or (components and orientation is None):
+        new_magnitude, orientation = gradient_orientation_cython(grad,
+                                                                 components)
+        # the magnitude that may have already been shared is kept
+        if magnitude is None:
+            magnitude = new_magnitude
+            magnitude.flags.writeable = False
+        if orientation is not None:
+            orientation.flags.writeable = False
+    cache[id(pixels)] = (pixels, grad, magnitude, orientation)
+    return grad, magnitude, orientation
 
 
 @ndfeature
-def gaussian_filter(pixels, sigma):
+def gaussian_filter(pixels, sigma, n_threads=1):
     r"""
     Calculates the convolution of the input image with a multidimensional
     Gaussian filter.
 
+    The filter is separable, thus all the channels are filtered at once by
+    one-dimensional kernels along each axis, which are computed once per
+    standard deviation. 2D images of type float/double are filtered natively
+    along both axes in a single pass, without intermediate images. The result
+    is the same as filtering each channel with
+    `scipy.ndimage.gaussian_filter` (in ``reflect`` mode), up to floating
+    point rounding. A stack of images of the same shape is filtered in a
+    single pass as well by giving its ``(N * C, X, Y, ..., Z)`` pixels.
+
     Parameters
     ----------
     pixels : :map:`Image` or subclass or ``(C, X, Y, ..., Z)`` `ndarray`
         Either the image object itself or an array with the pixels. The first
         dimension is interpreted as channels. This means an N-dimensional image
-        is represented by an N+1 dimensional array.
+        is represented by an N+1 dimensional array. The filtered pixels are
+        of the same type, e.g. float32 pixels are filtered in float32.
     sigma : `float` or `list` of `float`
         The standard deviation for Gaussian kernel. The standard deviations of
         the Gaussian filter are given for each axis as a `list`, or as a single
         `float`, in which case it is equal for all axes.
+    n_threads : `int`, optional
+        The number of threads that the rows (or the channels, if the image is
+        not 2D) are split across. Note that 2D images are only filtered in
+        parallel if menpo was built with OpenMP support, which is not the
+        case with the default compiler on OSX.
 
     Returns
     -------
     output_image : :map:`Image` or subclass or ``(X, Y, ..., Z, C)`` `ndarray`
         The filtered image has the same type and size as the input ``pixels``.
+
+    Raises
+    ------
+    ValueError
+        The number of threads must be > 0
     """
-    global scipy_gaussian_filter
-    if scipy_gaussian_filter is None:
-        from scipy.ndimage import gaussian_filter as scipy_gaussian_filter
-    output = np.empty(pixels.shape, dtype=pixels.dtype)
-    for dim in range(pixels.shape[0]):
-        scipy_gaussian_filter(pixels[dim], sigma, output=output[dim])
-    return output
+    if n_threads < 1:
+        raise ValueError("The number of threads must be > 0")
+    return _gaussian_filter(pixels, sigma, n_threads=n_threads)
+
+
+# the 1D Gaussian kernels per standard deviation (and truncation)
+_gaussian_kernels = {}
+_MAX_GAUSSIAN_KERNELS = 256
+# the kernel of the axes that are not filtered
+_IDENTITY = np.ones(1)
+
+
+def _gaussian_kernel(sigma, truncate=4.0):
+    # the same kernel as scipy.ndimage.gaussian_filter1d, which is symmetric
+    key = (sigma, truncate)
+    kernel = _gaussian_kernels.get(key)
+    if kernel is None:
+        radius = int(truncate * sigma + 0.5)
+        x = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 / (sigma * sigma) * x ** 2)
+        kernel /= kernel.sum()
+        kernel.flags.writeable = False
+        if len(_gaussian_kernels) >= _MAX_GAUSSIAN_KERNELS:
+            _gaussian_kernels.clear()
+        _gaussian_kernels[key] = kernel
+    return kernel
+
+
+def _gaussian_filter(pixels, sigma, out=None, n_threads=1):
+    # filters every channel of the pixels into out, which must not be the
+    # pixels themselves
+    global scipy_correlate1d
+    if scipy_correlate1d is None:
+        from scipy.ndimage import correlate1d as scipy_correlate1d
+    n_dims = pixels.ndim - 1
+    try:
+        if len(sigma) != n_dims:
+            raise ValueError('Must provide a sigma per dimension. {} sigmas '
+                             'were provided, {} were expected.'.format(
+                                 len(sigma), n_dims))
+    except TypeError:  # Thrown when len() is called on a float
+        sigma = [sigma] * n_dims
+    if out is None:
+        out = np.empty(pixels.shape, dtype=pixels.dtype)
+    if (n_dims == 2 and pixels.dtype in (np.float32, np.float64) and
+            out.flags.c_contiguous):
+        # both axes are filtered natively in a single pass
+        kernels = [_gaussian_kernel(float(s)) if s > 1e-15 else _IDENTITY
+                   for s in sigma]
+        return gaussian_filter_cython(np.ascontiguousarray(pixels),
+                                      kernels[0], kernels[1], out,
+                                      n_threads=n_threads)
+    # the axes with a negligible sigma are not filtered
+    axes = [(axis + 1, _gaussian_kernel(float(s)))
+            for axis, s in enumerate(sigma) if s > 1e-15]
+    if len(axes) == 0:
+        out[...] = pixels
+        return out
+
+    def filter_channels(channels):
+        source, output = pixels[channels], out[channels]
+        for axis, kernel in axes:
+            scipy_correlate1d(source, kernel, axis=axis, output=output,
+                              mode='reflect')
+            source = output
+
+    n_threads = min(n_threads, pixels.shape[0])
+    if n_threads == 1:
+        filter_channels(slice(None))
+    else:
+        bounds = np.linspace(0, pixels.shape[0], n_threads + 1).astype(int)
+        pool = ThreadPool(n_threads)
+        try:
+            pool.map(filter_channels, [slice(start, end) for start, end
+                                       in zip(bounds[:-1], bounds[1:])])
+        finally:
+            pool.close()
+    return out
+
+
+def _patch_windows(pixels, patch_centres, patch_shape, window_height,
+                   window_width):
+    # for every patch, the (zero padded) region of the ``(X, Y, C)`` pixels
+    # that is covered by the windows centred on each pixel of the patch and
+    # the pixels of the patch that lie within the image. The patches are
+    # placed as in extract_patches.
+    patch_shape = np.asarray(patch_shape, dtype=np.intp)
+    window_shape = np.array([window_height, window_width], dtype=np.intp)
+    image_shape = np.array(pixels.shape[:2], dtype=np.intp)
+    region_shape = patch_shape + window_shape - 1
+    starts = patch_centres.points.astype(np.intp) - patch_shape // 2
+    for start in starts:
+        origin = start - (window_shape + 1) // 2 + 1
+        region = np.zeros(tuple(region_shape) + pixels.shape[2:],
+                          dtype=pixels.dtype)
+        low = np.maximum(origin, 0)
+        high = np.minimum(origin + region_shape, image_shape)
+        if np.all(high > low):
+            region[low[0] - origin[0]:high[0] - origin[0],
+                   low[1] - origin[1]:high[1] - origin[1]] = \
+                pixels[low[0]:high[0], low[1]:high[1]]
+        # as in extract_patches, the last row (column) of the image is not
+        # part of the patches that extend past the bottom (right) edge
+        end = start + patch_shape
+        limit = np.where(end > image_shape, image_shape - 1, image_shape)
+        rows = np.arange(start[0], end[0])
+        cols = np.arange(start[1], end[1])
+        inside = (((rows >= 0) & (rows < limit[0]))[:, None] &
+                  ((cols >= 0) & (cols < limit[1]))[None, :])
+        yield region, inside
+
+
+def _patch_descriptors(pixels, patch_centres, patch_shape, window_height,
+                       window_width, compute):
+    # the descriptors of the windows centred on every pixel of each patch, in
+    # the (n_centres, 1, n_channels, patch_shape) layout of extract_patches
+    patches = []
+    for region, inside in _patch_windows(pixels, patch_centres, patch_shape,
+                                         window_height, window_width):
+        iterator = WindowIterator(region, window_height, window_width, 1, 1,
+                                  False)
+        descriptors = compute(iterator).pixels
+        descriptors[~inside] = 0
+        patches.append(np.rollaxis(descriptors, -1))
+    return np.array(patches)[:, None]
 
 
 @winitfeature
@@ -111,7 +337,9 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
         cell_size=8, block_size=2, signed_gradient=True, l2_norm_clip=0.2,
         window_height=1, window_width=1, window_unit='blocks',
         window_step_vertical=1, window_step_horizontal=1,
-        window_step_unit='pixels', padding=True, verbose=False):
+        window_step_unit='pixels', padding=True, n_threads=1,
+        share_cell_histograms=False, patch_centres=None, patch_shape=(16, 16),
+        dtype=np.float64, verbose=False):
     r"""
     Extracts Histograms of Oriented Gradients (HOG) features from the input
     image.
@@ -121,7 +349,9 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
     pixels : :map:`Image` or subclass or ``(C, X, Y, ..., Z)`` `ndarray`
         Either the image object itself or an array with the pixels. The first
         dimension is interpreted as channels. This means an N-dimensional image
-        is represented by an N+1 dimensional array.
+        is represented by an N+1 dimensional array. ``uint8``, ``float32`` and
+        ``float64`` pixels are read in place, with floating point values in
+        the range ``[0, 1]``.
     mode : {``dense``, ``sparse``}, optional
         The ``sparse`` case refers to the traditional usage of HOGs, so
         predefined parameters values are used.
@@ -180,6 +410,32 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
     l2_norm_clip : `float`, optional
         Defines the clipping value of the gradients' L2-norm. This option is
         valid only for the ``dalaltriggs`` algorithm.
+    n_threads : `int`, optional
+        The number of threads that the rows of windows are split across. The
+        result is identical to the serial computation. Note that threads are
+        only used if menpo was built with OpenMP support, which is not the
+        case with the default compiler on OSX.
+    share_cell_histograms : `bool`, optional
+        If ``True``, the ``dense`` ``dalaltriggs`` features are computed by
+        voting the gradient orientation of every pixel once and sharing the
+        cell histograms between the overlapping windows, rather than by
+        computing every window independently. The result is the same up to
+        single precision rounding and it is an order of magnitude faster
+        when the window steps are small compared to the cell size. The
+        descriptors are always computed in double precision and converted
+        to `dtype`, and `n_threads` and `verbose` do not apply.
+    patch_centres : :map:`PointCloud` or `str` or ``None``, optional
+        If not ``None``, the features are only computed within the patches
+        of shape `patch_shape` around these centres, rather than over the
+        whole image. The result is the same as calling ``extract_patches``
+        on the dense features image with ``padding=True`` and window steps of
+        one pixel, thus the window steps and `padding` are ignored. If
+        ``pixels`` is an :map:`Image`, this can also be the label of one of
+        its landmark groups.
+    patch_shape : ``(2,)`` `tuple` or `ndarray`, optional
+        The shape of the patches, only used if `patch_centres` is provided.
+    dtype : {``np.float64``, ``np.float32``}, optional
+        The data type of the descriptors.
     verbose : `bool`, optional
         Flag to print HOG related information.
 
@@ -189,7 +445,8 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
         The HOG features image. It has the same type as the input ``pixels``.
         The output number of channels in the case of ``dalaltriggs`` is
         ``K = num_bins * block_size *block_size`` and ``K = 31`` in the case of
-        ``zhuramanan``.
+        ``zhuramanan``. If `patch_centres` is provided, it is an
+        ``(n_centres, 1, K, patch_shape)`` `ndarray` instead.
 
     Raises
     ------
@@ -217,6 +474,8 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
         Vertical window step must be > 0
     ValueError
         Window step unit must be either pixels or cells
+    ValueError
+        The number of threads must be > 0
 
     References
     ----------
@@ -244,6 +503,8 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
         raise ValueError("Block size (in cells) must be > 0")
     if l2_norm_clip <= 0.0:
         raise ValueError("Value for L2-norm clipping must be > 0.0")
+    if n_threads < 1:
+        raise ValueError("The number of threads must be > 0")
     if mode == 'dense':
         if window_unit not in ['pixels', 'blocks']:
             raise ValueError("Window unit must be either pixels or blocks")
@@ -267,9 +528,9 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
         if window_step_unit not in ['pixels', 'cells']:
             raise ValueError("Window step unit must be either pixels or cells")
 
-    # Correct input image_data
-    pixels = np.asfortranarray(pixels)
-    pixels *= 255.
+    # The pixels are read in place by the iterator, with floating point
+    # values in [0, 1] scaled to the [0, 255] range of uint8 images
+    image_scale = 1. if pixels.dtype == np.uint8 else 255.
 
     # Dense case
     if mode == 'dense':
@@ -296,28 +557,42 @@ def hog(pixels, mode='dense', algorithm='dalaltriggs', num_bins=9,
                                                  cell_size)
                 window_step_horizontal = np.uint32(window_step_horizontal *
                                                    cell_size)
-        iterator = WindowIterator(pixels, window_height, window_width,
-                                  window_step_horizontal,
-                                  window_step_vertical, padding)
     # Sparse case
     else:
-        # Create iterator
         if algorithm == 'dalaltriggs':
             algorithm = 1
-            window_size = cell_size * block_size
-            step = cell_size
+            window_height = window_width = cell_size * block_size
         else:
             algorithm = 2
-            window_size = 3 * cell_size
-            step = cell_size
-        iterator = WindowIterator(pixels, window_size, window_size, step,
-                                  step, False)
-    # Print iterator's info
-    if verbose:
-        print(iterator)
+            window_height = window_width = 3 * cell_size
+        window_step_vertical = window_step_horizontal = cell_size
+        padding = False
+
+    def compute(iterator):
+        return iterator.HOG(algorithm, num_bins, cell_size, block_size,
+                            signed_gradient, l2_norm_clip, verbose, n_threads,
+                            image_scale, dtype)
+
+    if patch_centres is not None:
+        return WindowIteratorResult(
+            _patch_descriptors(pixels, patch_centres, patch_shape,
+                               window_height, window_width, compute), None)
     # Compute HOG
-    hog_descriptor = iterator.HOG(algorithm, num_bins, cell_size, block_size,
-                                  signed_gradient, l2_norm_clip, verbose)
+    if share_cell_histograms and mode == 'dense' and algorithm == 1:
+        descriptors, centres = dense_dalaltriggs_hog(
+            pixels, window_height, window_width, window_step_vertical,
+            window_step_horizontal, padding, num_bins, cell_size, block_size,
+            signed_gradient, l2_norm_clip, image_scale=image_scale)
+        hog_descriptor = WindowIteratorResult(descriptors.astype(dtype),
+                                              centres)
+    else:
+        iterator = WindowIterator(pixels, window_height, window_width,
+                                  window_step_horizontal,
+                                  window_step_vertical, padding)
+        # Print iterator's info
+        if verbose:
+            print(iterator)
+        hog_descriptor = compute(iterator)
     # TODO: This is a temporal fix
     # flip axis
     hog_descriptor = WindowIteratorResult(
@@ -380,27 +655,30 @@ def igo(pixels, double_angles=False, verbose=False):
     if double_angles:
         feat_chnls = 4
 
-    # compute gradients
-    grad = gradient(pixels)
-    # compute angles
-    grad_orient = np.angle(grad[:n_img_chnls] + 1j * grad[n_img_chnls:])
+    # compute the sines and cosines of the angles of the gradients
+    _, _, orientation = _gradient_orientation(pixels, components=True)
+    sin_orient = orientation[:n_img_chnls]
+    cos_orient = orientation[n_img_chnls:]
     # compute igo image
     igo_pixels = np.empty((n_img_chnls * feat_chnls,
                            pixels.shape[1], pixels.shape[2]),
-                          dtype=pixels.dtype)
+                          dtype=orientation.dtype)
 
     if double_angles:
-        dbl_grad_orient = 2 * grad_orient
         # y angles
-        igo_pixels[:n_img_chnls] = np.sin(grad_orient)
-        igo_pixels[n_img_chnls:n_img_chnls*2] = np.sin(dbl_grad_orient)
+        igo_pixels[:n_img_chnls] = sin_orient
+        dbl_sin_orient = igo_pixels[n_img_chnls:n_img_chnls*2]
+        np.multiply(sin_orient, cos_orient, out=dbl_sin_orient)
+        dbl_sin_orient *= 2
 
         # x angles
-        igo_pixels[n_img_chnls*2:n_img_chnls*3] = np.cos(grad_orient)
-        igo_pixels[n_img_chnls*3:] = np.cos(dbl_grad_orient)
+        igo_pixels[n_img_chnls*2:n_img_chnls*3] = cos_orient
+        dbl_cos_orient = igo_pixels[n_img_chnls*3:]
+        np.multiply(cos_orient, cos_orient, out=dbl_cos_orient)
+        dbl_cos_orient *= 2
+        dbl_cos_orient -= 1
     else:
-        igo_pixels[:n_img_chnls] = np.sin(grad_orient)  # y
-        igo_pixels[n_img_chnls:] = np.cos(grad_orient)  # x
+        igo_pixels[:] = orientation
 
     # print information
     if verbose:
@@ -455,18 +733,16 @@ def es(pixels, verbose=False):
     n_img_chnls = pixels.shape[0]
     # feature channels per image channel
     feat_channels = 2
-    # compute gradients
-    grad = gradient(pixels)
-    # compute magnitude
-    grad_abs = np.abs(grad[:n_img_chnls] + 1j * grad[n_img_chnls:])
+    # compute gradients and their magnitude
+    grad, grad_abs, _ = _gradient_orientation(pixels)
     # compute es image
     grad_abs = grad_abs + np.median(grad_abs)
     es_pixels = np.empty((pixels.shape[0] * feat_channels,
                           pixels.shape[1], pixels.shape[2]),
-                         dtype=pixels.dtype)
+                         dtype=grad.dtype)
 
-    es_pixels[:n_img_chnls] = grad[:n_img_chnls] / grad_abs
-    es_pixels[n_img_chnls:] = grad[n_img_chnls:] / grad_abs
+    np.divide(grad[:n_img_chnls], grad_abs, out=es_pixels[:n_img_chnls])
+    np.divide(grad[n_img_chnls:], grad_abs, out=es_pixels[n_img_chnls:])
 
     # print information
     if verbose:
@@ -479,14 +755,20 @@ def es(pixels, verbose=False):
     return es_pixels
 
 
-@ndfeature
+@winitfeature
 def daisy(pixels, step=1, radius=15, rings=2, histograms=2, orientations=8,
-          normalization='l1', sigmas=None, ring_radii=None, verbose=False):
+          normalization='l1', sigmas=None, ring_radii=None,
+          patch_centres=None, verbose=False):
     r"""
-    Extracts Daisy features from the input image. The output image has ``N * C``
-    number of channels, where ``N`` is the number of channels of the original
-    image and ``C`` is the feature channels determined by the input options.
-    Specifically, ``C = (rings * histograms + 1) * orientations``.
+    Extracts Daisy features from the input image. The output image has ``C``
+    number of channels, determined by the input options. Specifically,
+    ``C = (rings * histograms + 1) * orientations``. At each pixel, the
+    gradient of the channel with the highest magnitude is used.
+
+    The orientation histograms are computed once for all the descriptors and
+    smoothed natively, and the descriptors are sampled from them at the step
+    of the grid. Thus the descriptors at a few points are computed by
+    giving them as `patch_centres`, without computing the whole grid.
 
     Parameters
     ----------
@@ -527,15 +809,24 @@ def daisy(pixels, step=1, radius=15, rings=2, histograms=2, orientations=8,
             len(ring_radii) == len(sigmas) + 1
 
         since no radius is needed for the centre histogram.
+    patch_centres : :map:`PointCloud` or `str` or ``None``, optional
+        If provided, a descriptor is only computed at each of these centres,
+        which are rounded to the nearest pixels, rather than over the grid. If
+        a `str` is given, the centres are the landmarks of the image with that
+        group label. The histograms that lie outside the image are zero.
     verbose : `bool`
         Flag to print Daisy related information.
 
     Returns
     -------
-    daisy : :map:`Image` or subclass or ``(X, Y, ..., Z, C)`` `ndarray`
-        The ES features image. It has the same type and shape as the input
-        ``pixels``. The output number of channels is
-        ``C = (rings * histograms + 1) * orientations``.
+    daisy : :map:`Image` or subclass or ``(C, X, Y)`` `ndarray`
+        The Daisy features image. It has the same type as the input
+        ``pixels``. The descriptor at ``(i, j)`` is centred at the pixel
+        ``(radius + i * step, radius + j * step)`` and the landmarks and the
+        mask of an image are sampled accordingly. The output number of
+        channels is ``C = (rings * histograms + 1) * orientations``. If
+        `patch_centres` is provided, it is an ``(n_centres, 1, C, 1, 1)``
+        `ndarray` instead, in the layout of ``extract_patches``.
 
     Raises
     ------
@@ -570,11 +861,26 @@ def daisy(pixels, step=1, radius=15, rings=2, histograms=2, orientations=8,
     if normalization not in ['l1', 'l2', 'daisy', 'off']:
         raise ValueError('Invalid normalization method.')
 
+    if patch_centres is not None:
+        descriptors = _daisy(pixels, step=step, radius=radius, rings=rings,
+                             histograms=histograms, orientations=orientations,
+                             normalization=normalization, sigmas=sigmas,
+                             ring_radii=ring_radii,
+                             centres=patch_centres.points)
+        return WindowIteratorResult(descriptors[:, None, :, None, None], None)
+
     # Compute daisy features
     daisy_descriptor = _daisy(pixels, step=step, radius=radius, rings=rings,
                               histograms=histograms, orientations=orientations,
                               normalization=normalization, sigmas=sigmas,
                               ring_radii=ring_radii)
+    # the pixels that the descriptors are centred at
+    row_centres = radius + step * np.arange(daisy_descriptor.shape[1])
+    col_centres = radius + step * np.arange(daisy_descriptor.shape[2])
+    centres = np.empty((len(row_centres), len(col_centres), 2),
+                       dtype=np.int32)
+    centres[..., 0] = row_centres[:, None]
+    centres[..., 1] = col_centres[None, :]
 
     # print information
     if verbose:
@@ -595,14 +901,15 @@ def daisy(pixels, step=1, radius=15, rings=2, histograms=2, orientations=8,
             daisy_descriptor.shape[0])
         print(info_str)
 
-    return daisy_descriptor
+    return WindowIteratorResult(daisy_descriptor, centres)
 
 
 # TODO: Needs fixing ...
 @winitfeature
 def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
         window_step_vertical=1, window_step_horizontal=1,
-        window_step_unit='pixels', padding=True, verbose=False,
+        window_step_unit='pixels', padding=True, patch_centres=None,
+        patch_shape=(16, 16), dtype=np.float64, verbose=False,
         skip_checks=False):
     r"""
     Extracts Local Binary Pattern (LBP) features from the input image. The
@@ -615,7 +922,8 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
     pixels : :map:`Image` or subclass or ``(C, X, Y, ..., Z)`` `ndarray`
         Either the image object itself or an array with the pixels. The first
         dimension is interpreted as channels. This means an N-dimensional image
-        is represented by an N+1 dimensional array.
+        is represented by an N+1 dimensional array. ``uint8``, ``float32`` and
+        ``float64`` pixels are read in place.
     radius : `int` or `list` of `int` or ``None``, optional
         It defines the radius of the circle (or circles) at which the sampling
         points will be extracted. The radius (or radii) values must be greater
@@ -645,6 +953,18 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
     padding : `bool`, optional
         If ``True``, the output image is padded with zeros to match the input
         image's size.
+    patch_centres : :map:`PointCloud` or `str` or ``None``, optional
+        If not ``None``, the features are only computed within the patches
+        of shape `patch_shape` around these centres, rather than over the
+        whole image. The result is the same as calling ``extract_patches``
+        on the dense features image with ``padding=True`` and window steps of
+        one pixel, thus the window steps and `padding` are ignored. If
+        ``pixels`` is an :map:`Image`, this can also be the label of one of
+        its landmark groups.
+    patch_shape : ``(2,)`` `tuple` or `ndarray`, optional
+        The shape of the patches, only used if `patch_centres` is provided.
+    dtype : {``np.float64``, ``np.float32``}, optional
+        The data type of the descriptors.
     verbose : `bool`, optional
         Flag to print LBP related information.
     skip_checks : `bool`, optional
@@ -655,7 +975,8 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
     lbp : :map:`Image` or subclass or ``(X, Y, ..., Z, C)`` `ndarray`
         The ES features image. It has the same type and shape as the input
         ``pixels``. The output number of channels is
-        ``C = len(radius) * len(samples)``.
+        ``C = len(radius) * len(samples)``. If `patch_centres` is provided,
+        it is an ``(n_centres, 1, C, patch_shape)`` `ndarray` instead.
 
     Raises
     ------
@@ -729,9 +1050,6 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
             raise ValueError("Window step unit must be either pixels or "
                              "window")
 
-    # Correct input image_data
-    pixels = np.asfortranarray(pixels)
-
     # Parse options
     radius = np.asfortranarray(radius)
     samples = np.asfortranarray(samples)
@@ -750,6 +1068,14 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
     else:
         mapping_type = 0
 
+    def compute(iterator):
+        return iterator.LBP(radius, samples, mapping_type, verbose, dtype)
+
+    if patch_centres is not None:
+        return WindowIteratorResult(
+            _patch_descriptors(pixels, patch_centres, patch_shape,
+                               window_height, window_width, compute), None)
+
     # Create iterator object
     iterator = WindowIterator(pixels, window_height, window_width,
                               window_step_horizontal, window_step_vertical,
@@ -760,7 +1086,7 @@ def lbp(pixels, radius=None, samples=None, mapping_type='riu2',
         print(iterator)
 
     # Compute LBP
-    lbp_descriptor = iterator.LBP(radius, samples, mapping_type, verbose)
+    lbp_descriptor = compute(iterator)
 
     # TODO: This is a temporary fix
     # flip axis
@@ -814,16 +1140,31 @@ def normalize(img, scale_func=None, mode='all',
             return np.array([1.0])
 
     pixels = img.as_vector(keep_channels=True)
+    return img.from_vector(_normalize_pixels(pixels, scale_func, mode,
+                                             error_on_divide_by_zero))
+
 
+def _normalize_pixels(pixels, scale_func, mode, error_on_divide_by_zero,
+                      out=None):
+    # normalizes the (C, X, Y, ..., Z) pixels into out, which may be the
+    # pixels themselves. out must be C-contiguous.
+    vectors = pixels.reshape(pixels.shape[0], -1)
     if mode == 'all':
-        centered_pixels = pixels - np.mean(pixels)
-        scale_factor = scale_func(centered_pixels)
+        mean = np.mean(vectors)
     elif mode == 'per_channel':
-        centered_pixels = pixels - np.mean(pixels, axis=1, keepdims=1)
-        scale_factor = scale_func(centered_pixels, axis=1).reshape([-1, 1])
+        mean = np.mean(vectors, axis=1, keepdims=1)
     else:
         raise ValueError("Supported modes are {{'all', 'per_channel'}} - '{}' "
                          "is not known".format(mode))
+    if out is None:
+        centered_pixels = vectors - mean
+    else:
+        centered_pixels = np.subtract(vectors, mean,
+                                      out=out.reshape(vectors.shape))
+    if mode == 'all':
+        scale_factor = scale_func(centered_pixels)
+    else:
+        scale_factor = scale_func(centered_pixels, axis=1).reshape([-1, 1])
 
     zero_denom = (scale_factor == 0).ravel()
     any_non_zero = np.any(zero_denom)
@@ -835,9 +1176,21 @@ def normalize(img, scale_func=None, mode='all',
         non_zero_denom = ~zero_denom
         centered_pixels[non_zero_denom] = (centered_pixels[non_zero_denom] /
                                            scale_factor[non_zero_denom])
-        return img.from_vector(centered_pixels)
     else:
-        return img.from_vector(centered_pixels / scale_factor)
+        centered_pixels /= scale_factor
+    return centered_pixels.reshape(pixels.shape)
+
+
+def _unit_norm(x, axis=None):
+    return np.linalg.norm(x, axis=axis)
+
+
+def _unit_std(x, axis=None):
+    return np.std(x, axis=axis)
+
+
+def _unit_var(x, axis=None):
+    return np.var(x, axis=axis)
 
 
 @ndfeature
@@ -873,11 +1226,7 @@ def normalize_norm(pixels, mode='all', error_on_divide_by_zero=True):
         If any of the denominators are 0 and ``error_on_divide_by_zero`` is
         ``True``.
     """
-    def unit_norm(x, axis=None):
-        return np.linalg.norm(x, axis=axis)
-
-    return normalize(pixels, scale_func=unit_norm, mode=mode,
-                     error_on_divide_by_zero=error_on_divide_by_zero)
+    return _normalize_pixels(pixels, _unit_norm, mode, error_on_divide_by_zero)
 
 
 @ndfeature
@@ -913,11 +1262,7 @@ def normalize_std(pixels, mode='all', error_on_divide_by_zero=True):
         If any of the denominators are 0 and ``error_on_divide_by_zero`` is
         ``True``.
     """
-    def unit_std(x, axis=None):
-        return np.std(x, axis=axis)
-
-    return normalize(pixels, scale_func=unit_std, mode=mode,
-                     error_on_divide_by_zero=error_on_divide_by_zero)
+    return _normalize_pixels(pixels, _unit_std, mode, error_on_divide_by_zero)
 
 
 @ndfeature
@@ -954,11 +1299,7 @@ def normalize_var(pixels, mode='all', error_on_divide_by_zero=True):
         If any of the denominators are 0 and ``error_on_divide_by_zero`` is
         ``True``.
     """
-    def unit_var(x, axis=None):
-        return np.var(x, axis=axis)
-
-    return normalize(pixels, scale_func=unit_var, mode=mode,
-                     error_on_divide_by_zero=error_on_divide_by_zero)
+    return _normalize_pixels(pixels, _unit_var, mode, error_on_divide_by_zero)
 
 
 @ndfeature
@@ -0,0 +1,190 @@
+from __future__ import division
+import numpy as np
+from menpo.base import name_of_callable
+from menpo.image import Image, MaskedImage
+from menpo.transform import NonUniformScale
+from .base import (lm_centres_correction, sample_mask_for_centres,
+                   rebuild_feature_image, _stage)
+from .cache import _compute, _feature_caches
+from .features import (gaussian_filter, normalize_norm, normalize_std,
+                       normalize_var, no_op, _gradient_caches,
+                       _gaussian_filter, _normalize_pixels, _unit_norm,
+                       _unit_std, _unit_var)
+
+
+def _normalize_kernel(scale_func):
+    def kernel(pixels, out, mode='all', error_on_divide_by_zero=True):
+        return _normalize_pixels(pixels, scale_func, mode,
+                                 error_on_divide_by_zero, out=out)
+    return kernel
+
+
+def _gaussian_filter_kernel(pixels, out, sigma, n_threads=1):
+    return _gaussian_filter(pixels, sigma, out=out, n_threads=n_threads)
+
+
+def _no_op_kernel(pixels, out):
+    return pixels
+
+
+# the kernels of the features that write their result in a given buffer and
+# whether the buffer can be their input. They are applied on the arrays that
+# are owned by the pipeline.
+_OUT_KERNELS = {
+    gaussian_filter: (_gaussian_filter_kernel, False),
+    normalize_norm: (_normalize_kernel(_unit_norm), True),
+    normalize_std: (_normalize_kernel(_unit_std), True),
+    normalize_var: (_normalize_kernel(_unit_var), True),
+    no_op: (_no_op_kernel, True)
+}
+
+
+def _owned(pixels, source):
+    # whether the array was allocated by the pipeline and can be overwritten
+    return (pixels is not source and pixels.dtype.kind == 'f' and
+            pixels.flags.c_contiguous and pixels.flags.writeable and
+            not np.may_share_memory(pixels, source))
+
+
+def _landmarks_transform(geometry):
+    # the transform of the landmarks of the image to the features
+    transform = None
+    for kind, value in geometry:
+        if kind == 'shape':
+            t = NonUniformScale(value[1], skip_checks=True)
+        else:
+            t = lm_centres_correction(value)
+        transform = t if transform is None else transform.compose_before(t)
+    return transform
+
+
+class Pipeline(object):
+    r"""
+    A feature that is the composition of a sequence of features, e.g. ::
+
+        pipeline = Pipeline(normalize_std, igo, partial(gaussian_filter,
+                                                        sigma=2))
+
+    The features are applied on the raw pixels one after the other and, if
+    an :map:`Image` is given, the feature image, its mask and its landmarks
+    are only rebuilt once at the end, exactly as if the features had been
+    applied to images one after the other. Moreover, the intermediate arrays
+    are reused as the outputs of :map:`normalize_norm`,
+    :map:`normalize_std`, :map:`normalize_var`, :map:`gaussian_filter` and
+    :map:`no_op`. Thus the cost of a pipeline is essentially the sum of the
+    costs of its features on arrays.
+
+    Any callable that accepts and returns a ``(C, X, Y, ..., Z)`` `ndarray`
+    can be a stage of a pipeline, including another pipeline. Features that
+    change the shape of the pixels (e.g. :map:`hog`) rescale the mask and the
+    landmarks accordingly. If :map:`hog`, :map:`lbp` or :map:`daisy` computes
+    the descriptors of patches, the pipeline returns them as an `ndarray`.
+
+    Parameters
+    ----------
+    features : `callable`
+        The features in the order that they are applied. They can be partial
+        functions of features.
+
+    Raises
+    ------
+    ValueError
+        A pipeline needs at least one feature
+    """
+    def __init__(self, *features):
+        if len(features) == 0:
+            raise ValueError('A pipeline needs at least one feature')
+        self.features = features
+        self._stages = [_stage(f) for f in features]
+
+    def __call__(self, image):
+        r"""
+        Computes the features of the pipeline.
+
+        Parameters
+        ----------
+        image : :map:`Image` or subclass or ``(C, X, Y, ..., Z)`` `ndarray`
+            Either the image object itself or an array with the pixels.
+
+        Returns
+        -------
+        features : :map:`Image` or subclass or ``(C, X, Y, ..., Z)`` `ndarray`
+            The features, of the same type as the input.
+        """
+        if isinstance(image, np.ndarray):
+            return self._apply(image)[0]
+        pixels, geometry = self._apply(image.pixels, image=image)
+        if any(kind == 'patches' for kind, _ in geometry):
+            # features of patches - there is no image to rebuild
+            return pixels
+        if len(geometry) == 0:
+            return rebuild_feature_image(image, pixels)
+        mask = getattr(image, 'mask', None)
+        for kind, value in geometry:
+            if mask is None:
+                break
+            elif kind == 'shape':
+                mask = mask.resize(value[0])
+            else:
+                mask = sample_mask_for_centres(mask.mask, value)
+        if mask is not None:
+            new_image = MaskedImage(pixels, mask=mask, copy=False)
+        else:
+            new_image = Image(pixels, copy=False)
+        if image.has_landmarks:
+            new_image.landmarks = _landmarks_transform(geometry).apply(
+                image.landmarks)
+        return new_image
+
+    def _apply(self, pixels, image=None):
+        # the features of the pixels and the changes of their geometry
+        source, spare = pixels, None
+        geometry = []
+        # the arrays may be shared within the caches
+        use_kernels = not (_feature_caches or _gradient_caches)
+        for feature, args, kwargs in self._stages:
+            kernel, in_place = _OUT_KERNELS.get(feature, (None, False))
+            if getattr(feature, '_returns_centres', False):
+                if (image is not None and
+                        isinstance(kwargs.get('patch_centres'), str)):
+                    # patches around the (transformed) landmarks
+                    landmarks = image.landmarks[kwargs['patch_centres']]
+                    if geometry:
+                        landmarks = _landmarks_transform(geometry).apply(
+                            landmarks)
+                    kwargs = dict(kwargs, patch_centres=landmarks)
+                new_pixels, centres = _compute(feature._kernel, pixels, args,
+                                               kwargs)
+                geometry.append(('centres', centres) if centres is not None
+                                else ('patches', None))
+            else:
+                if (use_kernels and kernel is not None and
+                        _owned(pixels, source)):
+                    if in_place:
+                        out = pixels
+                    elif (spare is not None and
+                          spare.shape == pixels.shape and
+                          spare.dtype == pixels.dtype):
+                        out = spare
+                    else:
+                        out = None
+                    new_pixels = kernel(pixels, out, *args, **kwargs)
+                elif hasattr(feature, '_kernel'):
+                    new_pixels = _compute(feature._kernel, pixels, args,
+                                          kwargs)[0]
+                else:
+                    new_pixels = feature(pixels, *args, **kwargs)
+                if new_pixels.shape[1:] != pixels.shape[1:]:
+                    sf = (np.array(new_pixels.shape[1:]) /
+                          np.array(pixels.shape[1:]))
+                    geometry.append(('shape', (new_pixels.shape[1:], sf)))
+            if (_owned(pixels, source) and
+                    not np.may_share_memory(new_pixels, pixels)):
+                # the previous array can be the output of a later feature
+                spare = pixels
+            pixels = new_pixels
+        return pixels, geometry
+
+    def __str__(self):
+        return 'Pipeline: {}'.format(' -> '.join(name_of_callable(f)
+                                                 for f in self.features))
@@ -0,0 +1,153 @@
+from __future__ import division
+import numpy as np
+from menpo.image import Image
+from menpo.image.base import round_image_shape
+
+
+def _channel_means(feature, image, scale):
+    # the mean of every channel of the feature of the rescaled image
+    if scale != 1:
+        image = image.rescale(scale)
+    pixels = feature(image.pixels)
+    return pixels.reshape(pixels.shape[0], -1).mean(axis=1)
+
+
+def estimate_power_law(feature, images, scales=None):
+    r"""
+    Estimates the power law that relates the channels of a feature computed
+    at different scales of an image, so that :map:`feature_pyramid` can
+    approximate the feature at the intermediate scales of its levels.
+
+    For many features, the mean of each channel over an image rescaled by a
+    factor ``s`` is approximately the mean over the original image multiplied
+    by ``s ** -lambda`` [1]_. The exponent ``lambda`` of every channel is
+    estimated by least squares from the ratios of the means at the given
+    scales, which are averaged over the images.
+
+    Parameters
+    ----------
+    feature : `callable`
+        The feature, e.g. :map:`hog` or a partial of it. It must accept and
+        return a ``(C, X, Y)`` `ndarray`.
+    images : `list` of :map:`Image` or `ndarray`
+        The (natural) images that the power law is estimated from.
+    scales : `list` of `float`, optional
+        The scales that the features are compared at, relative to the
+        original images. If ``None``, the scales of a quarter, a half and
+        three quarters of an octave below the images, as well as the octave
+        itself, are used.
+
+    Returns
+    -------
+    lambdas : ``(C,)`` `ndarray`
+        The exponent of the power law of each channel of the feature.
+
+    Raises
+    ------
+    ValueError
+        Scales must be > 0 and != 1
+
+    References
+    ----------
+    .. [1] P. Dollar, R. Appel, S. Belongie and P. Perona. "Fast Feature
+       Pyramids for Object Detection", IEEE Transactions on Pattern Analysis
+       and Machine Intelligence, 36(8):1532-1545, 2014.
+    """
+    if scales is None:
+        scales = 2 ** -(np.arange(1, 5) / 4.)
+    scales = np.asarray(scales, dtype=np.float64)
+    if np.any(scales <= 0) or np.any(scales == 1):
+        raise ValueError("Scales must be > 0 and != 1")
+    ratios = []
+    for image in images:
+        if not isinstance(image, Image):
+            image = Image(image, copy=False)
+        means = _channel_means(feature, image, 1)
+        ratios.append([_channel_means(feature, image, s) / means
+                       for s in scales])
+    # the channels that are zero over an image do not contribute to the
+    # estimate of that image
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.array(ratios)
+        valid = np.isfinite(ratios) & (ratios > 0)
+        ratios = (np.where(valid, ratios, 0).sum(axis=0) /
+                  valid.sum(axis=0))
+        log_ratios = np.log(ratios)
+    log_ratios[~np.isfinite(log_ratios)] = 0
+    log_scales = np.log(scales)
+    return -log_scales.dot(log_ratios) / log_scales.dot(log_scales)
+
+
+def _approximate_level(exact, exact_scale, scale, image, lambdas):
+    # resample the channels of the closest exact level to the shape of the
+    # level and correct them by the power law
+    ratio = scale / exact_scale
+    image_shape = np.array(image.shape)
+    if exact.shape == round_image_shape(image_shape * exact_scale, 'ceil'):
+        # the feature has the shape of the image - so will the level
+        shape = round_image_shape(image_shape * scale, 'ceil')
+    else:
+        shape = round_image_shape(np.array(exact.shape) * ratio, 'ceil')
+    level = exact.resize(shape)
+    level.pixels *= (ratio ** -lambdas).reshape((-1,) +
+                                                (1,) * (level.pixels.ndim - 1))
+    return level
+
+
+def feature_pyramid(image, feature, n_levels=3, downscale=2, lambdas=None):
+    r"""
+    Return the pyramid of the features of an image, i.e. the feature
+    computed on the image rescaled by ``downscale ** -i`` at every level
+    ``i``.
+
+    If ``lambdas`` are given, the feature is only computed exactly at the
+    first level and at every level that is at least an octave (half the
+    scale) below the last exactly computed level. The features of the
+    intermediate levels are approximated from the closest exact level above
+    them, by resampling its channels and correcting them with the power law
+    of :map:`estimate_power_law` [1]_. This is far cheaper for pyramids
+    with many levels per octave.
+
+    Parameters
+    ----------
+    image : :map:`Image`
+        The image.
+    feature : `callable`
+        The feature, e.g. :map:`hog` or a partial of it.
+    n_levels : `int`, optional
+        Total number of levels in the pyramid, including the original
+        scale.
+    downscale : `float`, optional
+        Downscale factor between consecutive levels.
+    lambdas : `float` or ``(C,)`` `ndarray`, optional
+        The exponents of the power law of the channels of the feature, as
+        returned by :map:`estimate_power_law`. If ``None``, the feature is
+        computed exactly at every level.
+
+    Yields
+    ------
+    feature_pyramid : `generator`
+        Generator yielding the features of the levels as :map:`Image`
+        objects.
+
+    References
+    ----------
+    .. [1] P. Dollar, R. Appel, S. Belongie and P. Perona. "Fast Feature
+       Pyramids for Object Detection", IEEE Transactions on Pattern Analysis
+       and Machine Intelligence, 36(8):1532-1545, 2014.
+    """
+    if lambdas is not None:
+        lambdas = np.atleast_1d(np.asarray(lambdas, dtype=np.float64))
+    exact, exact_scale = None, None
+    for level in range(n_levels):
+        scale = downscale ** -level
+        # (up to rounding errors of the scales)
+        if (lambdas is None or exact is None or
+                2 * scale <= exact_scale * (1 + 1e-10)):
+            exact_scale = scale
+            exact = feature(image.copy() if level == 0
+                            else image.rescale(scale))
+            yield exact
+        else:
+            yield _approximate_level(exact, exact_scale, scale, image,
+                                     lambdas)
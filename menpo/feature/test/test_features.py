@@ -1,6 +1,10 @@
 from __future__ import division
+import os
 import random
 import warnings
+from shutil import rmtree
+from tempfile import mkdtemp
+from functools import partial
 
 import numpy as np
 from numpy.testing import assert_allclose, raises
@@ -8,8 +12,13 @@ from nose.plugins.attrib import attr
 
 from menpo.testing import is_same_array
 from menpo.image import Image, MaskedImage
+from menpo.shape import PointCloud
+from menpo.base import LazyList
 from menpo.feature import (hog, lbp, es, igo, daisy, no_op, normalize,
-                           normalize_norm, normalize_std, normalize_var)
+                           normalize_norm, normalize_std, normalize_var,
+                           batch, gradient, gradient_cache, feature_pyramid,
+                           estimate_power_law, FeatureCache, Pipeline,
+                           gaussian_filter)
 import menpo.io as mio
 
 
@@ -152,6 +161,92 @@ def test_hog_channels_zhuramanan():
         assert_allclose(hog_img.n_channels, n_channels)
 
 
+def test_hog_n_threads():
+    image = np.random.rand(2, 60, 50)
+    for algorithm in ['dalaltriggs', 'zhuramanan']:
+        serial = hog(image, algorithm=algorithm, cell_size=4,
+                     window_step_vertical=2, window_step_horizontal=3)
+        parallel = hog(image, algorithm=algorithm, cell_size=4,
+                       window_step_vertical=2, window_step_horizontal=3,
+                       n_threads=4)
+        assert_allclose(parallel, serial)
+
+
+@raises(ValueError)
+def test_hog_n_threads_zero():
+    hog(np.random.rand(1, 30, 30), n_threads=0)
+
+
+def test_hog_share_cell_histograms():
+    image = np.random.rand(3, 45, 38)
+    for padding in [True, False]:
+        for step in [1, 3]:
+            windowed = hog(image, cell_size=4, window_height=2,
+                           window_width=1, window_step_vertical=step,
+                           window_step_horizontal=step, padding=padding)
+            shared = hog(image, cell_size=4, window_height=2,
+                         window_width=1, window_step_vertical=step,
+                         window_step_horizontal=step, padding=padding,
+                         share_cell_histograms=True)
+            assert_allclose(shared, windowed, atol=1e-5)
+
+
+def test_hog_share_cell_histograms_default_window():
+    image = np.random.RandomState(0).rand(3, 60, 50)
+    assert_allclose(hog(image, share_cell_histograms=True), hog(image),
+                    atol=2e-6)
+
+
+def test_hog_uint8_input():
+    pixels = (np.random.rand(2, 40, 35) * 255).astype(np.uint8)
+    image = pixels / 255.
+    original = image.copy()
+    assert_allclose(hog(pixels), hog(image))
+    # the input pixels must not be modified
+    assert_allclose(image, original)
+
+
+def test_hog_float32():
+    image = np.random.rand(2, 40, 35).astype(np.float32)
+    descriptors = hog(image, dtype=np.float32)
+    assert descriptors.dtype == np.float32
+    assert_allclose(descriptors, hog(image.astype(np.float64)), atol=1e-6)
+
+
+def test_lbp_uint8_input():
+    pixels = (np.random.rand(2, 40, 35) * 255).astype(np.uint8)
+    assert_allclose(lbp(pixels, dtype=np.float32),
+                    lbp(pixels.astype(np.float64)))
+
+
+def test_hog_patch_centres():
+    image = Image(np.random.rand(2, 60, 50))
+    # the patches of the last centres extend past the bottom and right edges
+    centres = PointCloud(np.array([[3., 4.], [30.6, 20.2], [40., 25.],
+                                   [3.7, 47.2], [59., 49.], [57., 2.]]))
+    patches = hog(image, cell_size=4, patch_centres=centres,
+                  patch_shape=(9, 8))
+    dense = hog(image, cell_size=4)
+    assert_allclose(patches, dense.extract_patches(centres, (9, 8)))
+
+
+def test_hog_patch_centres_landmark_group():
+    image = Image(np.random.rand(1, 40, 40))
+    image.landmarks['centres'] = PointCloud(np.array([[20., 20.]]))
+    patches = hog(image, mode='sparse', cell_size=4,
+                  patch_centres='centres', patch_shape=(5, 5))
+    assert patches.shape == (1, 1, 36, 5, 5)
+
+
+def test_lbp_patch_centres():
+    image = Image(np.random.rand(1, 40, 45))
+    centres = PointCloud(np.array([[1., 2.], [20., 20.], [3.7, 43.2],
+                                   [39., 44.], [37., 1.]]))
+    patches = lbp(image, patch_centres=centres, patch_shape=(7, 6))
+    dense = lbp(image)
+    assert_allclose(patches, dense.extract_patches(centres, (7, 6)))
+
+
 @attr('cyvlfeat')
 def test_dsift_channels():
     from menpo.feature import dsift
@@ -229,6 +324,29 @@ def test_daisy_channels():
                         ((rings[i, 0]*histograms[i, 0]+1)*orientations[i, 0]))
 
 
+def test_daisy_patch_centres():
+    image = Image(np.random.rand(2, 40, 45))
+    dense = daisy(image, step=3, radius=6, histograms=4)
+    # the pixels of the descriptors at (0, 0) and (4, 5) and outside the
+    # image
+    centres = PointCloud(np.array([[6., 6.], [17.8, 20.7], [-30., 10.]]))
+    patches = daisy(image, step=3, radius=6, histograms=4,
+                    patch_centres=centres)
+    assert patches.shape == (3, 1, dense.n_channels, 1, 1)
+    assert_allclose(patches[0, 0, :, 0, 0], dense.pixels[:, 0, 0])
+    assert_allclose(patches[1, 0, :, 0, 0], dense.pixels[:, 4, 5])
+    assert_allclose(patches[2, 0, :, 0, 0], 1. / dense.n_channels)
+
+
+def test_daisy_landmarks():
+    image = Image(np.random.rand(1, 40, 40))
+    image.landmarks['centre'] = PointCloud(np.array([[20., 26.]]))
+    daisy_img = daisy(image, step=2, radius=8)
+    assert_allclose(daisy_img.landmarks['centre'].lms.points, [[6., 9.]])
+    patches = daisy(image, step=2, radius=8, patch_centres='centre')
+    assert_allclose(patches[0, 0, :, 0, 0], daisy_img.pixels[:, 6, 9])
+
+
 def test_igo_values():
     image = Image([[1., 2.], [2., 1.]])
     igo_img = igo(image)
@@ -244,6 +362,33 @@ def test_igo_values():
     assert_allclose(igo_img.pixels, res)
 
 
+def test_igo_double_angles_values():
+    image = np.random.randn(2, 20, 25)
+    image[:, :5, :5] = 0
+    grad = gradient(image)
+    angles = np.angle(grad[:2] + 1j * grad[2:])
+    assert_allclose(igo(image, double_angles=True),
+                    np.concatenate([np.sin(angles), np.sin(2 * angles),
+                                    np.cos(angles), np.cos(2 * angles)]),
+                    atol=1e-12)
+
+
+def test_gradient_cache():
+    from menpo.feature.features import _gradient_orientation
+    image = np.random.randn(2, 20, 25)
+    with gradient_cache():
+        grad, magnitude, _ = _gradient_orientation(image)
+        igo_pixels = igo(image)
+        es_pixels = es(image)
+        grad2, magnitude2, orientation = _gradient_orientation(image)
+        assert grad2 is grad
+        assert magnitude2 is magnitude
+        assert orientation is not None
+    assert _gradient_orientation(image)[0] is not grad
+    assert_allclose(igo_pixels, igo(image))
+    assert_allclose(es_pixels, es(image))
+
+
 def test_es_values():
     image = Image([[1., 2.], [2., 1.]])
     es_img = es(image)
@@ -296,6 +441,33 @@ def test_lbp_values():
     assert_allclose(lbp_img.pixels, 4.)
 
 
+def test_lbp_multiple_radii():
+    image = np.random.rand(2, 30, 30)
+    radius, samples = [1, 2, 3], [8, 12, 8]
+    lbp_img = lbp(image, radius=radius, samples=samples, mapping_type='u2')
+    for i, (r, s) in enumerate(zip(radius, samples)):
+        single = lbp(image, radius=r, samples=s, mapping_type='u2')
+        assert_allclose(lbp_img[i::3], single)
+
+
+def test_lbp_mapping_table():
+    from menpo.feature.windowiterator import _lbp_mapping_table
+    table, new_max = _lbp_mapping_table(8, 'ri')
+    # the number of binary necklaces of length 8
+    assert new_max == 36
+    assert_allclose(np.unique(table), np.arange(36))
+    table, new_max = _lbp_mapping_table(8, 'u2')
+    assert new_max == 59
+    assert_allclose(np.unique(table), np.arange(59))
+    table, new_max = _lbp_mapping_table(8, 'riu2')
+    assert new_max == 10
+    assert table[0b00111000] == 3
+    assert table[0b01010000] == 9
+    # the tables are computed once
+    assert _lbp_mapping_table(8, 'riu2')[0] is table
+    assert not table.flags.writeable
+
+
 def test_constrain_landmarks():
     breaking_bad = mio.import_builtin_asset('breakingbad.jpg').as_masked()
     breaking_bad = breaking_bad.crop_to_landmarks(boundary=20)
@@ -435,3 +607,248 @@ def test_normalize_0_variance_warning():
                               mode='per_channel')
     assert_allclose(new_image.pixels[0], [[-0.75, -0.25], [0.25, 0.75]])
     assert_allclose(new_image.pixels[1], [[-1.5, -0.5], [0.5, 1.5]])
+
+
+def test_batch():
+    images = [Image(np.random.rand(2, 30, 25)) for _ in range(5)]
+    for n_workers in [1, 2]:
+        features = batch(igo, images, n_workers=n_workers, batch_size=2)
+        assert features.shape == (5, 4, 30, 25)
+        for f, image in zip(features, images):
+            assert_allclose(f, igo(image.pixels))
+
+
+def test_batch_lazy_list():
+    pixels = [np.random.rand(1, 40, 40) for _ in range(3)]
+    images = LazyList([lambda p=p: Image(p) for p in pixels])
+    features = batch(hog, images, n_workers=2)
+    assert_allclose(features, np.array([hog(p) for p in pixels]))
+
+
+def test_batch_multiprocessing():
+    pixels = [np.random.rand(1, 20, 20) for _ in range(3)]
+    features = batch(es, pixels, n_workers=2, backend='multiprocessing')
+    assert_allclose(features, np.array([es(p) for p in pixels]))
+
+
+def test_batch_different_shapes():
+    images = [Image(np.random.rand(1, 20, 20)),
+              Image(np.random.rand(1, 20, 20)),
+              Image(np.random.rand(1, 25, 20))]
+    features = batch(no_op, images)
+    assert len(features) == 3
+    for f, image in zip(features, images):
+        assert isinstance(f, Image)
+        assert_allclose(f.pixels, image.pixels)
+
+
+def test_batch_different_shapes_landmarks():
+    images = [Image(np.random.rand(1, 40, 40)).as_masked(),
+              Image(np.random.rand(1, 40, 40)),
+              Image(np.random.rand(1, 48, 40))]
+    for image in images:
+        image.landmarks['centre'] = PointCloud(np.array([[20., 16.]]))
+    for feature in [igo, partial(hog, cell_size=4, window_step_vertical=2)]:
+        for n_workers in [1, 2]:
+            features = batch(feature, images, n_workers=n_workers,
+                             batch_size=2)
+            for f, image in zip(features, images):
+                expected = feature(image)
+                assert type(f) == type(expected)
+                assert_allclose(f.pixels, expected.pixels)
+                assert_allclose(f.landmarks['centre'].lms.points,
+                                expected.landmarks['centre'].lms.points)
+                if hasattr(expected, 'mask'):
+                    assert_allclose(f.mask.pixels, expected.mask.pixels)
+
+
+@raises(ValueError)
+def test_batch_invalid_backend():
+    batch(no_op, [np.random.rand(1, 10, 10)], backend='mpi')
+
+
+def test_feature_pyramid_exact():
+    image = mio.import_builtin_asset('breakingbad.jpg').as_greyscale()
+    image = image.rescale(0.2)
+    levels = list(feature_pyramid(image, es, n_levels=3, downscale=1.5))
+    assert len(levels) == 3
+    for i, f in enumerate(levels):
+        assert_allclose(f.pixels, es(image.rescale(1.5 ** -i)).pixels)
+
+
+def test_feature_pyramid_approximation():
+    image = mio.import_builtin_asset('takeo.ppm').as_greyscale()
+    lambdas = estimate_power_law(hog, [image])
+    assert lambdas.shape == (36,)
+    downscale = 2 ** 0.5
+    approximate = list(feature_pyramid(image, hog, n_levels=4,
+                                       downscale=downscale, lambdas=lambdas))
+    exact = list(feature_pyramid(image, hog, n_levels=4,
+                                 downscale=downscale))
+    for i, (a, e) in enumerate(zip(approximate, exact)):
+        assert a.shape == e.shape
+        if i % 2 == 0:
+            # octaves are computed exactly
+            assert_allclose(a.pixels, e.pixels)
+        else:
+            a_means = a.pixels.mean(axis=(1, 2))
+            e_means = e.pixels.mean(axis=(1, 2))
+            assert np.abs(a_means - e_means).sum() / e_means.sum() < 0.05
+
+
+def test_estimate_power_law_no_op():
+    rng = np.random.RandomState(0)
+    images = [rng.rand(2, 60, 60) for _ in range(2)]
+    assert_allclose(estimate_power_law(no_op, images), 0, atol=0.01)
+
+
+@raises(ValueError)
+def test_estimate_power_law_invalid_scales():
+    estimate_power_law(no_op, [np.random.rand(1, 10, 10)], scales=[1])
+
+
+def test_feature_cache():
+    image = Image(np.random.rand(1, 40, 40))
+    cache = FeatureCache()
+    with cache:
+        igo_image = igo(image, double_angles=True)
+        igo_image.pixels[:] = 0
+        cached_image = igo(image, double_angles=True)
+        igo(image.pixels, double_angles=False)
+    assert cache.n_misses == 2
+    assert cache.n_hits == 1
+    assert_allclose(cached_image.pixels, igo(image, double_angles=True).pixels)
+    igo(image, double_angles=True)
+    assert cache.n_hits == 1
+
+
+def test_feature_cache_disk():
+    pixels = np.random.rand(1, 50, 50)
+    path = mkdtemp()
+    try:
+        with FeatureCache(max_memory=0, cache_dir=path) as cache:
+            hog(pixels)
+            hog(pixels, patch_centres=PointCloud(np.array([[20., 20.]])))
+        assert cache.n_misses == 2
+        assert cache.memory_size == 0
+        with FeatureCache(cache_dir=path) as cache:
+            hog_image = hog(Image(pixels))
+            hog_patches = hog(pixels,
+                              patch_centres=PointCloud(np.array([[20., 20.]])))
+        assert cache.n_disk_hits == 2
+        assert not isinstance(hog_image.pixels, np.memmap)
+        assert_allclose(hog_image.pixels, hog(Image(pixels)).pixels)
+        assert_allclose(hog_patches, hog(
+            pixels, patch_centres=PointCloud(np.array([[20., 20.]]))))
+    finally:
+        rmtree(path)
+
+
+def test_feature_cache_disk_budget():
+    path = mkdtemp()
+    try:
+        with FeatureCache(cache_dir=path, max_disk=30000) as cache:
+            for _ in range(5):
+                es(np.random.rand(1, 40, 40))
+        assert 0 < cache.disk_size <= 30000
+        assert FeatureCache(cache_dir=path).disk_size == cache.disk_size
+        cache.clear()
+        assert cache.disk_size == 0
+    finally:
+        rmtree(path)
+
+
+def test_feature_cache_keeps_foreign_files():
+    path = mkdtemp()
+    try:
+        foreign = os.path.join(path, 'my_project', 'src')
+        os.makedirs(foreign)
+        open(os.path.join(foreign, 'important.py'), 'w').close()
+        # a directory that is named like a key, outside the cache entries
+        os.makedirs(os.path.join(path, '0' * 40))
+        with FeatureCache(cache_dir=path, max_disk=30000) as cache:
+            for _ in range(5):
+                es(np.random.rand(1, 40, 40))
+        cache = FeatureCache(cache_dir=path)
+        assert 0 < cache.disk_size <= 30000
+        cache.clear()
+        assert os.path.exists(os.path.join(foreign, 'important.py'))
+        assert os.path.isdir(os.path.join(path, '0' * 40))
+    finally:
+        rmtree(path)
+
+
+def test_pipeline_image():
+    image = mio.import_builtin_asset('takeo.ppm').as_masked()
+    image.mask.pixels[:, :20] = False
+    pipeline = Pipeline(normalize_std, igo, partial(gaussian_filter, sigma=2),
+                        partial(hog, cell_size=4), no_op, normalize_norm)
+    feature_image = pipeline(image)
+    expected = normalize_norm(no_op(hog(gaussian_filter(
+        igo(normalize_std(image)), sigma=2), cell_size=4)))
+    assert isinstance(feature_image, MaskedImage)
+    assert_allclose(feature_image.pixels, expected.pixels)
+    assert np.all(feature_image.mask.pixels == expected.mask.pixels)
+    assert_allclose(feature_image.landmarks[None].lms.points,
+                    expected.landmarks[None].lms.points)
+
+
+def test_pipeline_ndarray():
+    pixels = np.random.rand(2, 30, 30)
+    original = pixels.copy()
+    pipeline = Pipeline(no_op, partial(gaussian_filter, sigma=1),
+                        partial(normalize_var, mode='per_channel'),
+                        partial(gaussian_filter, sigma=3), es)
+    expected = es(gaussian_filter(normalize_var(gaussian_filter(
+        pixels, 1), mode='per_channel'), 3))
+    assert_allclose(pipeline(pixels), expected)
+    assert_allclose(pixels, original)
+
+
+def test_pipeline_patches():
+    image = mio.import_builtin_asset('breakingbad.jpg').as_greyscale()
+    image = image.rescale(0.5)
+    pipeline = Pipeline(normalize_std, partial(hog, patch_centres='PTS'))
+    patches = pipeline(image)
+    assert isinstance(patches, np.ndarray)
+    assert_allclose(patches, hog(normalize_std(image), patch_centres='PTS'))
+
+
+@raises(ValueError)
+def test_pipeline_empty():
+    Pipeline()
+
+
+def _scipy_gaussian_filter(pixels, sigma):
+    from scipy.ndimage import gaussian_filter as scipy_gaussian_filter
+    return np.array([scipy_gaussian_filter(p, sigma) for p in pixels])
+
+
+def test_gaussian_filter_scipy():
+    for dtype in [np.float32, np.float64]:
+        for shape, sigma in [((3, 40, 50), 2), ((2, 30, 20), (1.5, 0.5)),
+                             ((1, 4, 3), 3), ((2, 20, 20), (0, 2))]:
+            pixels = np.random.rand(*shape).astype(dtype)
+            filtered = gaussian_filter(pixels, sigma)
+            assert filtered.dtype == dtype
+            assert_allclose(filtered, _scipy_gaussian_filter(pixels, sigma),
+                            rtol=1e-5)
+
+
+def test_gaussian_filter_threads_strided():
+    pixels = np.random.rand(30, 40, 3).transpose(2, 0, 1)
+    assert_allclose(gaussian_filter(pixels, 2, n_threads=2),
+                    _scipy_gaussian_filter(pixels, 2))
+
+
+def test_gaussian_filter_stack():
+    stack = np.random.rand(4, 2, 20, 25)
+    filtered = gaussian_filter(stack.reshape(-1, 20, 25), 1.5)
+    for f, pixels in zip(filtered.reshape(stack.shape), stack):
+        assert_allclose(f, gaussian_filter(pixels, 1.5))
+
+
+def test_gaussian_filter_3d():
+    pixels = np.random.rand(2, 8, 9, 10)
+    assert_allclose(gaussian_filter(pixels, 1, n_threads=2),
+                    _scipy_gaussian_filter(pixels, 1))
@@ -58,6 +58,32 @@ def test_gradient_takeo_double():
     assert_allclose(grad_image.pixels, np_grad)
 
 
+def test_gradient_3d_volume():
+    for dtype in [np.float32, np.float64]:
+        pixels = np.random.rand(2, 6, 7, 8).astype(dtype)
+        grad = gradient(pixels)
+        assert grad.dtype == dtype
+        assert_allclose(grad, _np_gradient(pixels), rtol=1e-5)
+
+
+def test_gradient_out():
+    pixels = np.random.rand(3, 20, 30)
+    out = np.empty((6, 20, 30))
+    grad_image = gradient(Image(pixels), out=out)
+    assert grad_image.pixels is out
+    assert_allclose(out, _np_gradient(pixels))
+
+
+def test_gradient_strided_threads():
+    pixels = np.random.rand(25, 30, 3).transpose(2, 0, 1)
+    assert_allclose(gradient(pixels, n_threads=3), _np_gradient(pixels))
+
+
+@raises(ValueError)
+def test_gradient_out_wrong_shape():
+    gradient(np.random.rand(1, 10, 10), out=np.empty((1, 10, 10)))
+
+
 @raises(TypeError)
 def test_gradient_uint8_exception():
     image = Image(example_image.astype(np.uint8))
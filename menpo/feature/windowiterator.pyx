@@ -1,23 +1,33 @@
 import numpy as np
 cimport numpy as np
 from libcpp cimport bool
+from libcpp.vector cimport vector
 from collections import namedtuple
 
 WindowIteratorResult = namedtuple('WindowInteratorResult', ('pixels',
                                                             'centres'))
 
 cdef extern from "cpp/ImageWindowIterator.h":
+    cdef enum ImageType:
+        UINT8_IMAGE, FLOAT_IMAGE, DOUBLE_IMAGE
     cdef cppclass ImageWindowIterator:
-        ImageWindowIterator(double *image, unsigned int imageHeight,
+        ImageWindowIterator(const void *image, ImageType imageType,
+                            unsigned int imageHeight,
                             unsigned int imageWidth,
                             unsigned int numberOfChannels,
+                            long rowStride, long columnStride,
+                            long channelStride,
                             unsigned int windowHeight,
                             unsigned int windowWidth,
                             unsigned int windowStepHorizontal,
                             unsigned int windowStepVertical,
                             bool enablePadding)
         void apply(double *outputImage, int *windowsCenters,
-                   WindowFeature *windowFeature)
+                   WindowFeature *windowFeature,
+                   unsigned int numberOfThreads, double imageScale) nogil
+        void apply(float *outputImage, int *windowsCenters,
+                   WindowFeature *windowFeature,
+                   unsigned int numberOfThreads, double imageScale) nogil
         unsigned int _numberOfWindowsHorizontally, \
             _numberOfWindowsVertically, _numberOfWindows, _imageWidth, \
             _imageHeight, _numberOfChannels, _windowHeight, _windowWidth, \
@@ -48,23 +58,38 @@ cdef extern from "cpp/LBP.h":
             unsigned int numberOfChannels, unsigned int *radius,
             unsigned int *samples,
             unsigned int numberOfRadiusSamplesCombinations,
-            unsigned int mapping_type, unsigned int *uniqueSamples,
-            unsigned int *whichMappingTable, unsigned int numberOfUniqueSamples)
+            unsigned int **mappingTables, unsigned int *whichMappingTable)
         void apply(double *windowImage, double *descriptorVector)
 
+cdef object _IMAGE_TYPES = {np.dtype(np.uint8): UINT8_IMAGE,
+                            np.dtype(np.float32): FLOAT_IMAGE,
+                            np.dtype(np.float64): DOUBLE_IMAGE}
+
+
 cdef class WindowIterator:
     cdef ImageWindowIterator* iterator
+    # the iterator reads the pixels in place, so they are kept alive here
+    cdef object image
 
-    def __cinit__(self, np.ndarray[np.float64_t, ndim=3] image,
-                  unsigned int windowHeight, unsigned int windowWidth,
-                  unsigned int windowStepHorizontal,
+    def __cinit__(self, np.ndarray image, unsigned int windowHeight,
+                  unsigned int windowWidth, unsigned int windowStepHorizontal,
                   unsigned int windowStepVertical, bool enablePadding):
-        cdef np.ndarray[np.float64_t, ndim=3, mode='fortran'] image_f = \
-            np.require(image, requirements='F')
-        self.iterator = new ImageWindowIterator(&image_f[0, 0, 0],
+        # (X, Y, C) images of uint8, float32 or float64 are read in place
+        # with any memory layout, the rest are converted to float64
+        if image.ndim != 3:
+            raise ValueError("The image must have 3 dimensions.")
+        if image.dtype not in _IMAGE_TYPES:
+            image = image.astype(np.float64)
+        self.image = image
+        cdef np.npy_intp itemsize = image.itemsize
+        self.iterator = new ImageWindowIterator(np.PyArray_DATA(image),
+                                                _IMAGE_TYPES[image.dtype],
                                                 image.shape[0], image.shape[1],
-                                                image.shape[2], windowHeight,
-                                                windowWidth,
+                                                image.shape[2],
+                                                image.strides[0] // itemsize,
+                                                image.strides[1] // itemsize,
+                                                image.strides[2] // itemsize,
+                                                windowHeight, windowWidth,
                                                 windowStepHorizontal,
                                                 windowStepVertical,
                                                 enablePadding)
@@ -73,6 +98,39 @@ cdef class WindowIterator:
             raise ValueError("The window-related options are wrong. "
                              "The number of windows is 0.")
 
+    def __dealloc__(self):
+        del self.iterator
+
+    cdef _apply(self, WindowFeature *windowFeature, unsigned int numberOfThreads,
+                double imageScale, dtype):
+        # computes the descriptors of all the windows as dtype (float32 or
+        # float64). The rows of windows are split across the threads (if
+        # menpo was built with OpenMP support), which do not need the GIL.
+        cdef double[:, :, :] outputDouble
+        cdef float[:, :, :] outputFloat
+        cdef int[:, :, :] windowsCenters = np.zeros(
+            [self.iterator._numberOfWindowsVertically,
+             self.iterator._numberOfWindowsHorizontally,
+             2], order='F', dtype=np.int32)
+        outputImage = np.zeros(
+            [self.iterator._numberOfWindowsVertically,
+             self.iterator._numberOfWindowsHorizontally,
+             windowFeature.descriptorLengthPerWindow], order='F', dtype=dtype)
+        if outputImage.dtype == np.float32:
+            outputFloat = outputImage
+            with nogil:
+                self.iterator.apply(&outputFloat[0, 0, 0],
+                                    &windowsCenters[0, 0, 0], windowFeature,
+                                    numberOfThreads, imageScale)
+        else:
+            outputDouble = outputImage
+            with nogil:
+                self.iterator.apply(&outputDouble[0, 0, 0],
+                                    &windowsCenters[0, 0, 0], windowFeature,
+                                    numberOfThreads, imageScale)
+        return WindowIteratorResult(np.ascontiguousarray(outputImage),
+                                    np.ascontiguousarray(windowsCenters))
+
     def __str__(self):
         info_str = "Window Iterator:\n" \
                    "  - Input image is {}W x {}H with {} channels.\n" \
@@ -95,7 +153,11 @@ cdef class WindowIterator:
 
     def HOG(self, method, numberOfOrientationBins, cellHeightAndWidthInPixels,
             blockHeightAndWidthInCells, enableSignedGradients,
-            l2normClipping, verbose):
+            l2normClipping, verbose, unsigned int numberOfThreads=1,
+            double imageScale=1., dtype=np.float64):
+        if numberOfThreads < 1:
+            raise ValueError("The number of threads must be > 0")
+        _check_output_dtype(dtype)
         cdef HOG *hog = new HOG(self.iterator._windowHeight,
                                 self.iterator._windowWidth,
                                 self.iterator._numberOfChannels, method,
@@ -107,14 +169,6 @@ cdef class WindowIterator:
                 hog.numberOfBlocksPerWindowHorizontally == 0:
             raise ValueError("The window-related options are wrong. "
                              "The number of blocks per window is 0.")
-        cdef double[:, :, :] outputImage = np.zeros(
-            [self.iterator._numberOfWindowsVertically,
-             self.iterator._numberOfWindowsHorizontally,
-             hog.descriptorLengthPerWindow], order='F')
-        cdef int[:, :, :] windowsCenters = np.zeros(
-            [self.iterator._numberOfWindowsVertically,
-             self.iterator._numberOfWindowsHorizontally,
-             2], order='F', dtype=np.int32)
         if verbose:
             info_str = "HOG features:\n"
             if method == 1:
@@ -158,38 +212,37 @@ cdef class WindowIterator:
                 <int>self.iterator._numberOfWindowsVertically,
                 <int>hog.descriptorLengthPerWindow)
             print(info_str)
-        self.iterator.apply(&outputImage[0,0,0], &windowsCenters[0,0,0], hog)
+        result = self._apply(hog, numberOfThreads, imageScale, dtype)
         del hog
-        return WindowIteratorResult(np.ascontiguousarray(outputImage),
-                                    np.ascontiguousarray(windowsCenters))
+        return result
 
-    def LBP(self, radius, samples, mapping_type, verbose):
+    def LBP(self, radius, samples, mapping_type, verbose, dtype=np.float64):
+        _check_output_dtype(dtype)
         # find unique samples (thus lbp codes mappings)
         uniqueSamples, whichMappingTable = np.unique(samples,
                                                      return_inverse=True)
-        numberOfUniqueSamples = uniqueSamples.size
+        # the (cached) mapping tables are kept alive until the end
+        mappingTables = [
+            _lbp_mapping_table(n, _MAPPING_TYPES[mapping_type])[0]
+            for n in uniqueSamples]
+        cdef vector[unsigned int *] cmappingTables
+        for table in mappingTables:
+            if table is None:
+                cmappingTables.push_back(NULL)
+            else:
+                cmappingTables.push_back(
+                    <unsigned int *> np.PyArray_DATA(table))
         cdef unsigned int[:] cradius = np.ascontiguousarray(radius,
                                                             dtype=np.uint32)
         cdef unsigned int[:] csamples = np.ascontiguousarray(samples,
                                                              dtype=np.uint32)
-        cdef unsigned int[:] cuniqueSamples = np.ascontiguousarray(
-            uniqueSamples, dtype=np.uint32)
         cdef unsigned int[:] cwhichMappingTable = np.ascontiguousarray(
             whichMappingTable, dtype=np.uint32)
         cdef LBP *lbp = new LBP(self.iterator._windowHeight,
                                 self.iterator._windowWidth,
                                 self.iterator._numberOfChannels, &cradius[0],
-                                &csamples[0], radius.size, mapping_type,
-                                &cuniqueSamples[0], &cwhichMappingTable[0],
-                                numberOfUniqueSamples)
-        cdef double[:, :, :] outputImage = np.zeros(
-            [self.iterator._numberOfWindowsVertically,
-             self.iterator._numberOfWindowsHorizontally,
-             lbp.descriptorLengthPerWindow], order='F')
-        cdef int[:, :, :] windowsCenters = np.zeros(
-            [self.iterator._numberOfWindowsVertically,
-             self.iterator._numberOfWindowsHorizontally,
-             2], order='F', dtype=np.int32)
+                                &csamples[0], radius.size,
+                                cmappingTables.data(), &cwhichMappingTable[0])
         if verbose:
             info_str = "LBP features:\n"
             if radius.size == 1:
@@ -230,15 +283,37 @@ cdef class WindowIterator:
                 <int>self.iterator._numberOfWindowsVertically,
                 <int>lbp.descriptorLengthPerWindow)
             print(info_str)
-        self.iterator.apply(&outputImage[0,0,0], &windowsCenters[0,0,0], lbp)
+        result = self._apply(lbp, 1, 1., dtype)
         del lbp
-        return WindowIteratorResult(np.ascontiguousarray(outputImage),
-                                    np.ascontiguousarray(windowsCenters))
+        return result
+
+
+def _check_output_dtype(dtype):
+    if np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError("The descriptors dtype must be float32 or float64")
+
+# the names of the LBP codes mapping types of the C++ implementation
+_MAPPING_TYPES = {0: 'none', 1: 'u2', 2: 'ri', 3: 'riu2'}
+
+# mapping tables that have been computed, by number of samples and mapping
+# type. They are immutable, thus can be shared by all the computations.
+_mapping_tables = {}
+
+
+def _bit_counts(n_bits):
+    # the number of set bits of every n_bits code, as the codes with the
+    # k-th bit set have one more bit set than the codes below 2 ** k
+    counts = np.zeros(2 ** n_bits, dtype=np.uint8)
+    for k in range(n_bits):
+        counts[2 ** k:2 ** (k + 1)] = counts[:2 ** k] + 1
+    return counts
+
 
 def _lbp_mapping_table(n_samples, mapping_type='riu2'):
     r"""
     Returns the mapping table for LBP codes in a neighbourhood of n_samples
-    number of sampling points.
+    number of sampling points. The tables are computed once per number of
+    samples and mapping type.
 
     Parameters
     ----------
@@ -251,59 +326,62 @@ def _lbp_mapping_table(n_samples, mapping_type='riu2'):
 
         Default: 'riu2'
 
+    Returns
+    -------
+    table : ``(2 ** n_samples,)`` `ndarray` of uint32 or ``None``
+        The (read-only) mapped value of each code or ``None`` if there is no
+        mapping.
+    new_max : int
+        The number of mapped values.
+
     Raises
     -------
     ValueError
         mapping_type can be 'u2' or 'ri' or 'riu2' or 'none'.
     """
-    # initialize the output lbp codes mapping table
-    table = range(2**n_samples)
+    if mapping_type not in ['u2', 'ri', 'riu2', 'none']:
+        raise ValueError('Wrong mapping type.')
+    n_samples = int(n_samples)
+    key = (n_samples, mapping_type)
+    if key not in _mapping_tables:
+        _mapping_tables[key] = _compute_lbp_mapping_table(n_samples,
+                                                          mapping_type)
+    return _mapping_tables[key]
+
+
+def _compute_lbp_mapping_table(n_samples, mapping_type):
+    if mapping_type == 'none':
+        return None, 0
+    codes = np.arange(2 ** n_samples, dtype=np.uint32)
+    # number of 1->0 and 0->1 transitions in a binary string x is equal
+    # to the number of 1-bits in XOR(x, rotate_left(x))
+    if mapping_type in ['u2', 'riu2']:
+        bit_counts = _bit_counts(n_samples)
+        uniform = bit_counts[
+            codes ^ circural_rotation_left(codes, 1, n_samples)] <= 2
     # uniform-2 mapping
     if mapping_type == 'u2':
-        # initialize the number of patterns in the mapping table
         new_max = n_samples * (n_samples - 1) + 3
-        index = 0
-        for c in range(2**n_samples):
-            # number of 1->0 and 0->1 transitions in a binary string x is equal
-            # to the number of 1-bits in XOR(x, rotate_left(x))
-            num_trans = bin(c ^ circural_rotation_left(c, 1, n_samples)).\
-                count('1')
-            if num_trans <= 2:
-                table[c] = index
-                index += 1
-            else:
-                table[c] = new_max - 1
+        table = np.full(codes.shape, new_max - 1, dtype=np.uint32)
+        table[uniform] = np.arange(np.count_nonzero(uniform))
     # rotation-invariant mapping
     elif mapping_type == 'ri':
-        new_max = 0
-        tmp_map = np.zeros((2**n_samples, 1), dtype=np.int) - 1
-        for c in range(2**n_samples):
-            rm = c
-            r = c
-            for j in range(1, n_samples):
-                r = circural_rotation_left(r, 1, n_samples)
-                rm = min(rm, r)
-            if tmp_map[rm, 0] < 0:
-                tmp_map[rm, 0] = new_max
-                new_max += 1
-            table[c] = tmp_map[rm, 0]
+        # the smallest rotation of each code, which is numbered in the order
+        # that it first appears, i.e. at its own position
+        smallest = codes.copy()
+        rotated = codes
+        for j in range(1, n_samples):
+            rotated = circural_rotation_left(rotated, 1, n_samples)
+            np.minimum(smallest, rotated, out=smallest)
+        representatives = np.flatnonzero(smallest == codes)
+        new_max = representatives.size
+        table = np.searchsorted(representatives, smallest).astype(np.uint32)
     # uniform-2 and rotation-invariant mapping
-    elif mapping_type == 'riu2':
-        new_max = n_samples + 2
-        for c in range(2**n_samples):
-            # number of 1->0 and 0->1 transitions in a binary string x is equal
-            # to the number of 1-bits in XOR(x, rotate_left(x))
-            num_trans = bin(c ^ circural_rotation_left(c, 1, n_samples)).\
-                count('1')
-            if num_trans <= 2:
-                table[c] = bin(c).count('1')
-            else:
-                table[c] = n_samples + 1
-    elif mapping_type == 'none':
-        table = 0
-        new_max = 0
     else:
-        raise ValueError('Wrong mapping type.')
+        new_max = n_samples + 2
+        table = np.where(uniform, bit_counts,
+                         n_samples + 1).astype(np.uint32)
+    table.flags.writeable = False
     return table, new_max
 
 
@@ -1,3 +1,4 @@
-from .convolution import log_gabor
+from .convolution import log_gabor, LogGaborBank
 from .decomposition import eigenvalue_decomposition, pca, pcacov, ipca
-from .linalg import dot_inplace_left, dot_inplace_right, as_matrix, from_matrix
+from .linalg import (dot_inplace_left, dot_inplace_right, as_matrix,
+                     as_matrix_batches, from_matrix)
@@ -1,4 +1,4 @@
-# log_gabor filter and  __frequency_butterworth_filter are derived from Matlab
+# log_gabor filter and  _frequency_butterworth_filter are derived from Matlab
 # scripts written by Peter Kovesi. We maintain his copyright notice below.
 #
 # Copyright (c) 1999 Peter Kovesi
@@ -16,9 +16,10 @@
 # The Software is provided "as is", without warranty of any kind.
 
 import numpy as np
+from scipy.fftpack import fftn, ifftn
 
 
-def __adjusted_meshgrid(shape):
+def _adjusted_meshgrid(shape):
     """
     Creates an adjusted meshgrid that accounts for odd image sizes. Linearly
     interpolates the values. This meshgrid assumes 'ij' indexing - which is
@@ -44,7 +45,7 @@ def __adjusted_meshgrid(shape):
     return np.meshgrid(*adjust_range, indexing='ij')
 
 
-def __frequency_butterworth_filter(shape, cutoff, order):
+def _frequency_butterworth_filter(shape, cutoff, order):
     r"""
     Builds an N-D butterworth filter
 
@@ -70,7 +71,7 @@ def __frequency_butterworth_filter(shape, cutoff, order):
         shape as was requested.
     """
     # Dimension-free sum of squares
-    grid = __adjusted_meshgrid(shape)
+    grid = _adjusted_meshgrid(shape)
     grid_sq = [g ** 2 for g in grid]
     grid_sq = sum(grid_sq)
 
@@ -78,11 +79,292 @@ def __frequency_butterworth_filter(shape, cutoff, order):
     return np.fft.ifftshift(1.0 / ((radius / cutoff) ** (2 * order) + 1.0))
 
 
-# TODO: merge the 2D and 3D versions if possible
+class LogGaborBank(object):
+    r"""
+    A log-gabor filter bank, including smoothing the images via a low-pass
+    filter at the edges.
+
+    The filters depend only on the shape of the images and the parameters of
+    the bank, so they are computed the first time that an image of a given
+    shape is filtered and cached for all subsequent images of the same shape
+    (e.g. the frames of a video). Stacks of images can be filtered in a
+    single vectorized FFT pass with :meth:`apply_batch`.
+
+    The dimensionality of the filters (2D or 3D) is determined by the images
+    that are filtered. For 3D images, the bank has ``num_orientations`` phi
+    (azimuth) and ``num_theta_orientations`` theta (elevation) orientations.
+
+    This algorithm is directly derived from work by Peter Kovesi.
+
+    Parameters
+    ----------
+    num_scales : `int`, optional
+        Number of wavelet scales.
+    num_orientations : `int`, optional
+        Number of filter orientations in the xy-plane.
+    num_theta_orientations : `int`, optional
+        **Only used for 3D**. Number of filter orientations in the z-plane.
+    min_wavelength : `int`, optional
+        Wavelength of smallest scale filter.
+    scaling_constant : `int`, optional
+        Scaling factor between successive filters.
+    center_sigma : `float`, optional
+        Ratio of the standard deviation of the Gaussian describing the Log
+        Gabor filter's transfer function in the frequency domain to the filter
+        centre frequency.
+    d_phi_sigma : `float` or ``None``, optional
+        Angular bandwidth in xy-plane. If ``None``, ``1.3`` is used for 2D and
+        ``1.5`` for 3D.
+    d_theta_sigma : `float`, optional
+        **Only used for 3D**. Angular bandwidth in z-plane.
+    dtype : {`numpy.float64`, `numpy.float32`}, optional
+        The precision of the filters. If `numpy.float32`, the filters are
+        stored in single precision and the convolution results are
+        `numpy.complex64`, which halves the memory and speeds up the FFTs.
+
+    References
+    ----------
+    .. [1] D. J. Field, "Relations Between the Statistics of Natural Images
+        and the Response Properties of Cortical Cells",
+        Journal of The Optical Society of America A, Vol 4, No. 12,
+        December 1987. pp 2379-2394
+    """
+    def __init__(self, num_scales=4, num_orientations=6,
+                 num_theta_orientations=4, min_wavelength=3,
+                 scaling_constant=2, center_sigma=0.65, d_phi_sigma=None,
+                 d_theta_sigma=1.5, dtype=np.float64):
+        self.num_scales = num_scales
+        self.num_orientations = num_orientations
+        self.num_theta_orientations = num_theta_orientations
+        self.min_wavelength = min_wavelength
+        self.scaling_constant = scaling_constant
+        self.center_sigma = center_sigma
+        self.d_phi_sigma = d_phi_sigma
+        self.d_theta_sigma = d_theta_sigma
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError('dtype must be either float32 or float64 '
+                             '({} given)'.format(self.dtype))
+        self._filters = {}
+
+    @property
+    def complex_dtype(self):
+        r"""
+        The complex type of the convolution results.
+
+        :type: `numpy.dtype`
+        """
+        return np.result_type(self.dtype, np.complex64)
+
+    def filters(self, shape):
+        r"""
+        The filters of the bank for images of the given shape. They are
+        computed the first time a shape is requested and then cached.
+
+        The frequency origin of the filters is at the corners.
+
+        Parameters
+        ----------
+        shape : `tuple`
+            The shape of the images ``(M, N)`` or ``(M, N, K)``.
+
+        Returns
+        -------
+        radial_filters : ``(num_scales, shape)`` `ndarray`
+            The radial (bandpass) component of the filters of every scale.
+        filters : ``(num_scales, num_orientations, shape)`` `ndarray`
+            The log-gabor filters. For 3D, the shape is ``(num_scales,
+            num_theta_orientations, num_orientations, M, N, K)``.
+        S : ``(shape,)`` `ndarray`
+            The sum of the squared magnitudes of the filters.
+
+        Raises
+        ------
+        ValueError
+            Image must be either 2D or 3D
+        """
+        shape = tuple(shape)
+        if shape not in self._filters:
+            if len(shape) == 2:
+                filters = self._build_filters_2d(shape)
+            elif len(shape) == 3:
+                filters = self._build_filters_3d(shape)
+            else:
+                raise ValueError("Image must be either 2D or 3D")
+            self._filters[shape] = tuple(f.astype(self.dtype)
+                                         for f in filters)
+        return self._filters[shape]
+
+    def clear_cache(self):
+        r"""
+        Discards all the cached filters.
+        """
+        self._filters = {}
+
+    def __call__(self, image):
+        r"""
+        Convolves an image with the filter bank.
+
+        Parameters
+        ----------
+        image : ``(M, N, ...)`` `ndarray`
+            Image to be convolved.
+
+        Returns
+        -------
+        complex_conv : ``(num_scales, num_orientations, image.shape)`` `ndarray`
+            Complex valued convolution results. The real part is the
+            result of convolving with the even symmetric filter, the
+            imaginary part is the result from convolution with the
+            odd symmetric filter. For 3D images, the orientation axes are
+            ``(num_theta_orientations, num_orientations)``.
+        bandpass : ``(num_scales, image.shape)`` `ndarray`
+            Bandpass images corresponding to each scale `s`
+        S : ``(image.shape,)`` `ndarray`
+            Sum of the squared magnitudes of the filters
+        """
+        complex_conv, bandpass, S = self.apply_batch(image[None])
+        return complex_conv[0], bandpass[0], S
+
+    def apply_batch(self, images):
+        r"""
+        Convolves a stack of images of the same shape with the filter bank in
+        a single vectorized FFT pass.
+
+        Parameters
+        ----------
+        images : ``(n_images, M, N, ...)`` `ndarray` or `list` of `ndarray`
+            The images to be convolved.
+
+        Returns
+        -------
+        complex_conv : ``(n_images, num_scales, num_orientations, M, N, ...)`` `ndarray`
+            Complex valued convolution results of every image. See
+            :meth:`__call__`.
+        bandpass : ``(n_images, num_scales, M, N, ...)`` `ndarray`
+            Bandpass images of every image corresponding to each scale `s`.
+        S : ``(M, N, ...)`` `ndarray`
+            Sum of the squared magnitudes of the filters
+        """
+        images = np.asarray(images, dtype=self.dtype)
+        shape = images.shape[1:]
+        radial_filters, filters, S = self.filters(shape)
+        axes = tuple(range(-len(shape), 0))
+
+        images_fft = fftn(images, axes=axes)
+        # broadcast the transformed images against the filters
+        n_filter_axes = filters.ndim - len(shape)
+        bandpass = ifftn(images_fft[:, None] * radial_filters, axes=axes,
+                         overwrite_x=True)
+        images_fft = images_fft.reshape((images.shape[0],) +
+                                        (1,) * n_filter_axes + shape)
+        complex_conv = ifftn(images_fft * filters, axes=axes,
+                             overwrite_x=True)
+        return complex_conv, bandpass, S
+
+    def _radial_filters(self, radius, shape):
+        # Compute radial component of filter for all scales at once
+        wavelengths = (self.min_wavelength *
+                       self.scaling_constant ** np.arange(self.num_scales))
+        fo = (1.0 / wavelengths).reshape((-1,) + (1,) * len(shape))
+        radial = np.exp((-(np.log(radius / fo)) ** 2) /
+                        (2.0 * np.log(self.center_sigma) ** 2))
+        radial *= _frequency_butterworth_filter(shape, 0.45, 15)
+        radial[(slice(None),) + (0,) * len(shape)] = 0.0
+        return radial
+
+    def _build_filters_2d(self, shape):
+        d_phi_sigma = 1.3 if self.d_phi_sigma is None else self.d_phi_sigma
+        # Pre-compute phi sigma
+        phi_sigma = np.pi / self.num_orientations / d_phi_sigma
+
+        axis0, axis1 = _adjusted_meshgrid(shape)
+        radius = np.fft.ifftshift(np.sqrt(axis0 ** 2 + axis1 ** 2))
+        radius[0, 0] = 1.0
+        phi = np.fft.ifftshift(np.arctan2(axis0, axis1))
+
+        radial = self._radial_filters(radius, shape)
+
+        # Compute angular component of filter for all orientations at once
+        filter_angles = (np.arange(self.num_orientations) * np.pi /
+                         self.num_orientations)[:, None, None]
+        d_phi = _angular_distance(phi, filter_angles)
+        # Calculate the standard deviation of the angular Gaussian
+        # function used to construct filters in the freq. plane.
+        spread = np.exp((-d_phi ** 2.0) / (2.0 * phi_sigma ** 2))
+
+        filters = radial[:, None] * spread[None]
+        S = np.fft.fftshift(np.sum(filters ** 2, axis=(0, 1)))
+        # TODO: Why is this done??
+        return radial, filters, np.flipud(S)
+
+    def _build_filters_3d(self, shape):
+        d_phi_sigma = 1.5 if self.d_phi_sigma is None else self.d_phi_sigma
+        # Pre-compute sigma values
+        theta_sigma = (np.pi / self.num_theta_orientations /
+                       self.d_theta_sigma)
+        phi_sigma = (2 * np.pi) / self.num_orientations / d_phi_sigma
+
+        axis0, axis1, axis2 = _adjusted_meshgrid(shape)
+        radius = np.sqrt(axis0 ** 2 + axis1 ** 2 + axis2 ** 2)
+        theta = np.arctan2(axis0, axis1)
+        # TODO: Is adding the mean REALLY a good idea?
+        m_ab = np.abs(np.mean(radius))
+        phi = np.arccos(axis2 / (radius + m_ab))
+
+        radius = np.fft.ifftshift(radius)
+        radius[0, 0, 0] = 1.0
+        theta = np.fft.ifftshift(theta)
+        phi = np.fft.ifftshift(phi)
+
+        radial = self._radial_filters(radius, shape)
+
+        # Compute angular component of filter for all orientations at once
+        elevation_angles = (np.arange(self.num_theta_orientations) * np.pi /
+                            self.num_theta_orientations)
+        azimuth_angles = (np.arange(self.num_orientations) * 2 * np.pi /
+                          self.num_orientations)
+        d_theta = _angular_distance(theta, elevation_angles[:, None, None,
+                                                            None])
+        d_phi = _angular_distance(phi, azimuth_angles[:, None, None, None])
+        theta_spread = (-d_theta ** 2) / (2 * theta_sigma ** 2)
+        phi_spread = (-d_phi ** 2) / (2 * phi_sigma ** 2)
+        spread = np.exp(theta_spread[:, None] + phi_spread[None])
+
+        filters = radial[:, None, None] * spread[None]
+        S = np.fft.fftshift(np.sum(filters ** 2, axis=(0, 1, 2)))
+        # TODO: Do we need to flip S as in the 2D version?
+        return radial, filters, S
+
+
+def _angular_distance(angles, reference_angles):
+    r"""
+    Absolute angular distance between each angle and each of the reference
+    angles, computed robustly via the sine and cosine of the difference.
+    """
+    sin_angles = np.sin(angles)
+    cos_angles = np.cos(angles)
+    ds = (sin_angles * np.cos(reference_angles) -
+          cos_angles * np.sin(reference_angles))
+    dc = (cos_angles * np.cos(reference_angles) +
+          sin_angles * np.sin(reference_angles))
+    return np.abs(np.arctan2(ds, dc))
+
+
+# the options of log_gabor for 2D and 3D images
+_LOG_GABOR_OPTIONS = {
+    2: {'num_scales', 'num_orientations', 'min_wavelength',
+        'scaling_constant', 'center_sigma', 'd_phi_sigma', 'dtype'},
+    3: {'num_scales', 'num_phi_orientations', 'num_theta_orientations',
+        'min_wavelength', 'scaling_constant', 'center_sigma', 'd_phi_sigma',
+        'd_theta_sigma', 'dtype'}
+}
+
+
 def log_gabor(image, **kwargs):
     r"""
     Creates a log-gabor filter bank, including smoothing the images via a
-    low-pass filter at the edges.
+    low-pass filter at the edges, and convolves the image with it.
 
     To create a 2D filter bank, simply specify the number of phi
     orientations (orientations in the xy-plane).
@@ -90,7 +372,9 @@ def log_gabor(image, **kwargs):
     To create a 3D filter bank, you must specify both the number of
     phi (azimuth) and theta (elevation) orientations.
 
-    This algorithm is directly derived from work by Peter Kovesi.
+    This algorithm is directly derived from work by Peter Kovesi. Note that
+    the filters are recomputed on every call. In order to filter many images
+    of the same shape, create a :map:`LogGaborBank` once and reuse it.
 
     Parameters
     ----------
@@ -103,11 +387,18 @@ def log_gabor(image, **kwargs):
         Default 2D 4
         Default 3D 4
         ========== ==
-    num_phi_orientations : `int`, optional
-        Number of filter orientations in the xy-plane
+    num_orientations : `int`, optional
+        **Only used for 2D**. Number of filter orientations in the xy-plane
 
         ========== ==
         Default 2D 6
+        Default 3D N/A
+        ========== ==
+    num_phi_orientations : `int`, optional
+        **Only used for 3D**. Number of filter orientations in the xy-plane
+
+        ========== ==
+        Default 2D N/A
         Default 3D 6
         ========== ==
     num_theta_orientations : `int`, optional
@@ -154,6 +445,8 @@ def log_gabor(image, **kwargs):
         Default 2D N/A
         Default 3D 1.5
         ========== ==
+    dtype : {`numpy.float64`, `numpy.float32`}, optional
+        The precision of the filters and the convolution.
 
     Returns
     -------
@@ -167,6 +460,14 @@ def log_gabor(image, **kwargs):
     S : ``(image.shape,)`` `ndarray`
         Convolved image
 
+    Raises
+    ------
+    ValueError
+        Image must be either 2D or 3D
+    TypeError
+        An option that only applies to 3D images is given for a 2D image, or
+        vice versa
+
     Examples
     --------
     Return the magnitude of the convolution over the image at
@@ -189,183 +490,14 @@ def log_gabor(image, **kwargs):
         Journal of The Optical Society of America A, Vol 4, No. 12,
         December 1987. pp 2379-2394
     """
-    if len(image.shape) == 2:    # 2D filter
-        return __log_gabor_2d(image, **kwargs)
-    elif len(image.shape) == 3:  # 3D filter
-        return __log_gabor_3d(image, **kwargs)
-    else:
+    if len(image.shape) not in (2, 3):
         raise ValueError("Image must be either 2D or 3D")
-
-
-def __log_gabor_3d(image, num_scales=4, num_phi_orientations=6,
-                   num_theta_orientations=4, min_wavelength=3,
-                   scaling_constant=2, center_sigma=0.65, d_theta_sigma=1.5,
-                   d_phi_sigma=1.5):
-    # Pre-compute sigma values
-    theta_sigma = np.pi / num_theta_orientations / d_theta_sigma
-    phi_sigma = (2 * np.pi) / num_phi_orientations / d_phi_sigma
-
-    # Allocate space for return structures
-    bandpass = np.empty([num_scales, image.shape[0], image.shape[1],
-                         image.shape[2]], dtype=np.complex)
-    log_gabor = np.empty([num_scales, image.shape[0], image.shape[1],
-                          image.shape[2]])
-    S = np.zeros(image.shape)
-    complex_conv = np.empty([num_scales, num_theta_orientations,
-                             num_phi_orientations, image.shape[0],
-                             image.shape[1], image.shape[2]], dtype=np.complex)
-    tmp_complex_conv = np.empty([num_scales, image.shape[0], image.shape[1],
-                                 image.shape[2]], dtype=np.complex)
-
-    # Pre-compute fourier values
-    image_fft = np.fft.fftn(image)
-
-    axis0, axis1, axis2 = __adjusted_meshgrid(image.shape)
-
-    radius = np.sqrt(axis0 ** 2 + axis1 ** 2 + axis2 ** 2)
-    theta = np.arctan2(axis0, axis1)
-    # TODO: Is adding the mean REALLY a good idea?
-    m_ab = np.abs(np.mean(radius))
-    phi = np.arccos(axis2 / (radius + m_ab))
-
-    radius = np.fft.ifftshift(radius)
-    radius[0, 0, 0] = 1.0
-    theta = np.fft.ifftshift(theta)
-    phi = np.fft.ifftshift(phi)
-
-    sin_theta = np.sin(theta)
-    cos_theta = np.cos(theta)
-    sin_phi = np.sin(phi)
-    cos_phi = np.cos(phi)
-
-    # Compute the lowpass filter
-    butterworth_filter = __frequency_butterworth_filter(image.shape, 0.45, 15)
-
-    # Compute radial component of filter
-    for s in range(num_scales):
-        wavelength = min_wavelength * scaling_constant ** s
-        fo = 1.0 / wavelength
-
-        l = np.exp((-np.log(radius / fo) ** 2) /
-                   (2.0 * np.log(center_sigma) ** 2))
-        l = l * butterworth_filter
-        l[0, 0, 0] = 0.0
-
-        log_gabor[s, :, :, :] = l
-        bandpass[s, :, :, :] = np.fft.ifft2(image_fft * l)
-
-    # Computer angular component of filter
-    for e in range(num_theta_orientations):
-        # Pre-compute filter data specific to this orientation
-        elevation_angle = e * np.pi / num_theta_orientations
-
-        d_theta_sin = (sin_theta * np.cos(elevation_angle) -
-                       cos_theta * np.sin(elevation_angle))
-        d_theta_cos = (cos_theta * np.cos(elevation_angle) +
-                       sin_theta * np.sin(elevation_angle))
-        d_theta = np.abs(np.arctan2(d_theta_sin, d_theta_cos))
-
-        for a in range(num_phi_orientations):
-            azimuth_angle = a * 2 * np.pi / num_phi_orientations
-            d_phi_sin = (sin_phi * np.cos(azimuth_angle) -
-                         cos_phi * np.sin(azimuth_angle))
-            d_phi_cos = (cos_phi * np.cos(azimuth_angle) +
-                         sin_phi * np.sin(azimuth_angle))
-            d_phi = np.abs(np.arctan2(d_phi_sin, d_phi_cos))
-
-            phi_spread = (-d_phi ** 2) / (2 * phi_sigma ** 2)
-            theta_spread = (-d_theta ** 2) / (2 * theta_sigma ** 2)
-            spread = np.exp(phi_spread + theta_spread)
-
-            # For each scale, multiply by the angular spread
-            for s in range(0, num_scales):
-                filter_bank = log_gabor[s] * spread
-
-                shifted_filter = np.fft.fftshift(filter_bank)
-                S += shifted_filter * np.conjugate(shifted_filter)
-
-                tmp_complex_conv[s, :, :] = np.fft.ifft2(image_fft *
-                                                         filter_bank)
-
-            complex_conv[:, e, a, :, :] = tmp_complex_conv[None, None, ...]
-
-    # TODO: Do we need to flip S as in the 2D version?
-    return complex_conv, bandpass, S
-
-
-def __log_gabor_2d(image, num_scales=4, num_orientations=6,
-                   min_wavelength=3, scaling_constant=2, center_sigma=0.65,
-                   d_phi_sigma=1.3):
-    # Allocate space for return structures
-    bandpass = np.empty([num_scales, image.shape[0], image.shape[1]],
-                        dtype=np.complex)
-    log_gabor = np.empty([num_scales, image.shape[0], image.shape[1]])
-    S = np.zeros(image.shape)
-    complex_conv = np.empty([num_scales, num_orientations, image.shape[0],
-                             image.shape[1]], dtype=np.complex)
-    tmp_complex_conv = np.empty([num_scales, image.shape[0], image.shape[1]],
-                                dtype=np.complex)
-
-    # Pre-compute phi sigma
-    phi_sigma = np.pi / num_orientations / d_phi_sigma
-
-    # Pre-compute fourier values
-    image_fft = np.fft.fft2(image)
-
-    axis0, axis1 = __adjusted_meshgrid(image.shape)
-
-    radius = np.sqrt(axis0 ** 2 + axis1 ** 2)
-    phi = np.arctan2(axis0, axis1)
-
-    radius = np.fft.ifftshift(radius)
-    radius[0][0] = 1.0
-    phi = np.fft.ifftshift(phi)
-
-    sin_phi = np.sin(phi)
-    cos_phi = np.cos(phi)
-
-    # Compute the lowpass filter
-    butterworth_filter = __frequency_butterworth_filter(image.shape, 0.45, 15)
-
-    # Compute radial component of filter
-    for s in range(num_scales):
-        wavelength = min_wavelength * scaling_constant ** s
-        fo = 1.0 / wavelength
-
-        l = np.exp((-(np.log(radius / fo)) ** 2) /
-                   (2.0 * np.log(center_sigma) ** 2))
-        l = l * butterworth_filter
-        l[0][0] = 0.0
-
-        log_gabor[s, :, :] = l
-        bandpass[s, :, :] = np.fft.ifft2(image_fft * l)
-
-    # Computer angular component of filter
-    for o in range(num_orientations):
-        # Pre-compute filter data specific to this orientation
-        filter_angle = o * np.pi / num_orientations
-
-        ds = (sin_phi * np.cos(filter_angle) -
-              cos_phi * np.sin(filter_angle))
-        dc = (cos_phi * np.cos(filter_angle) +
-              sin_phi * np.sin(filter_angle))
-
-        d_phi = np.abs(np.arctan2(ds, dc))
-
-        # Calculate the standard deviation of the angular Gaussian
-        # function used to construct filters in the freq. plane.
-        spread = np.exp((-d_phi ** 2.0) / (2.0 * phi_sigma ** 2))
-
-        # For each scale, multiply by the angular spread
-        for s in range(0, num_scales):
-            filter_bank = log_gabor[s] * spread
-
-            shifted_filter = np.fft.fftshift(filter_bank)
-            S += shifted_filter * np.conjugate(shifted_filter)
-
-            tmp_complex_conv[s, :, :] = np.fft.ifft2(image_fft * filter_bank)
-
-        complex_conv[:, o, :, :] = tmp_complex_conv[None, ...]
-
-    # TODO: Why is this done??
-    return complex_conv, bandpass, np.flipud(S)
+    options = _LOG_GABOR_OPTIONS[len(image.shape)]
+    for name in kwargs:
+        if name not in options:
+            raise TypeError("log_gabor() got an unexpected keyword argument "
+                            "'{}' for a {}D image".format(name,
+                                                          len(image.shape)))
+    if 'num_phi_orientations' in kwargs:
+        kwargs['num_orientations'] = kwargs.pop('num_phi_orientations')
+    return LogGaborBank(**kwargs)(image)
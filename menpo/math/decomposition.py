@@ -4,6 +4,20 @@ from scipy.sparse import issparse
 from .linalg import dot_inplace_right
 
 
+def _floating_dtype(X, dtype=None):
+    r"""
+    Returns the floating point dtype that the decompositions should be computed
+    in - either the one explicitly requested or the one of `X`. Non floating
+    point data (e.g. integer matrices) are promoted to `numpy.float64`.
+    """
+    if dtype is None:
+        dtype = X.dtype
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.inexact):
+        dtype = np.dtype(np.float64)
+    return dtype
+
+
 def eigenvalue_decomposition(C, is_inverse=False, eps=1e-10):
     r"""
     Eigenvalue decomposition of a given covariance (or scatter) matrix.
@@ -27,12 +41,18 @@ def eigenvalue_decomposition(C, is_inverse=False, eps=1e-10):
 
             limit = np.max(np.abs(eigenvalues)) * eps
 
+        Note that `eps` is never allowed to be smaller than the machine
+        precision of the dtype of `C`, as eigenvalues below that level are
+        pure round-off noise (this only has an effect on single precision
+        matrices).
+
     Returns
     -------
     pos_eigenvectors : ``(N, p)`` `ndarray`
         The matrix with the eigenvectors corresponding to positive eigenvalues.
+        It has the same dtype as `C`.
     pos_eigenvalues : ``(p,)`` `ndarray`
-        The array of positive eigenvalues.
+        The array of positive eigenvalues. It has the same dtype as `C`.
     """
     # compute eigenvalue decomposition
     if issparse(C):
@@ -46,7 +66,10 @@ def eigenvalue_decomposition(C, is_inverse=False, eps=1e-10):
     eigenvalues = eigenvalues[index]
     eigenvectors = eigenvectors[:, index]
 
-    # set tolerance limit
+    # set tolerance limit - eigenvalues below the machine precision of the
+    # decomposition are not meaningful
+    if np.issubdtype(eigenvalues.dtype, np.floating):
+        eps = max(eps, np.finfo(eigenvalues.dtype).eps)
     limit = np.max(np.abs(eigenvalues)) * eps
 
     # select positive eigenvalues
@@ -67,13 +90,19 @@ def eigenvalue_decomposition(C, is_inverse=False, eps=1e-10):
     return pos_eigenvectors, pos_eigenvalues
 
 
-def pca(X, centre=True, inplace=False, eps=1e-10):
+def pca(X, centre=True, inplace=False, eps=1e-10, dtype=None):
     r"""
     Apply Principal Component Analysis (PCA) on the data matrix `X`. In the case
     where the data matrix is very large, it is advisable to set
     ``inplace = True``. However, note this destructively edits the data matrix
     by subtracting the mean inplace.
 
+    All the outputs have the same floating point dtype as the data matrix
+    (or `dtype`, if provided). Thus, a single precision data matrix produces
+    single precision eigenvectors, eigenvalues and mean, which halves the
+    memory requirements and speeds up the underlying BLAS calls. The mean is
+    accumulated in double precision for numerical stability.
+
     Parameters
     ----------
     X : ``(n_samples, n_dims)`` `ndarray`
@@ -87,6 +116,11 @@ def pca(X, centre=True, inplace=False, eps=1e-10):
         Tolerance value for positive eigenvalue. Those eigenvalues smaller
         than the specified eps value, together with their corresponding
         eigenvectors, will be automatically discarded.
+    dtype : `numpy.dtype` or ``None``, optional
+        The floating point data type of the computation and of the outputs.
+        If ``None``, the dtype of `X` is used (integer data matrices are
+        promoted to `numpy.float64`). If `X` has a different dtype, it is
+        converted (copied) first.
 
     Returns
     -------
@@ -97,14 +131,19 @@ def pca(X, centre=True, inplace=False, eps=1e-10):
     m (mean vector) : ``(n_dimensions,)`` `ndarray`
         Mean that was subtracted from the data matrix.
     """
+    dtype = _floating_dtype(X, dtype=dtype)
+    if X.dtype != dtype:
+        # the conversion creates a copy anyway, so it can always be damaged
+        X = X.astype(dtype)
+        inplace = True
     n, d = X.shape
 
     if centre:
-        # centre data
+        # centre data - accumulate in double precision for stability
         # m (mean vector): d
-        m = np.mean(X, axis=0)
+        m = np.mean(X, axis=0, dtype=np.float64).astype(dtype)
     else:
-        m = np.zeros(d, dtype=X.dtype)
+        m = np.zeros(d, dtype=dtype)
 
     # This is required if the data matrix is very large!
     if inplace:
@@ -145,7 +184,7 @@ def pca(X, centre=True, inplace=False, eps=1e-10):
 
         # compute final eigenvectors
         # U: n x d
-        w = np.sqrt(1.0 / ((n - 1) * l))
+        w = np.sqrt(1.0 / ((n - 1) * l.astype(np.float64))).astype(dtype)
         dot = dot_inplace_right if inplace else np.dot
         U = dot(V.conj().T, X)
         U *= w[:, None]
@@ -183,9 +222,9 @@ def pcacov(C, is_inverse=False, eps=1e-5):
     Returns
     -------
     U (eigenvectors) : ``(n_components, n_dims)`` `ndarray`
-        Eigenvectors of the data matrix.
+        Eigenvectors of the data matrix. It has the same dtype as `C`.
     l (eigenvalues) : ``(n_components,)`` `ndarray`
-        Positive eigenvalues of the data matrix.
+        Positive eigenvalues of the data matrix. It has the same dtype as `C`.
     """
     if C.shape[0] != C.shape[1]:
         raise ValueError('C must be square.')
@@ -212,6 +251,10 @@ def ipca(B, U_a, l_a, n_a, m_a=None, f=1.0, eps=1e-10):
     Perform Incremental PCA on the eigenvectors ``U_a``, eigenvalues ``l_a`` and
     mean vector ``m_a`` (if present) given a new data matrix ``B``.
 
+    The update is computed in the dtype of ``U_a``, so that the dtype of an
+    existing decomposition is preserved regardless of the dtype of the new
+    data (e.g. a single precision model stays single precision).
+
     Parameters
     ----------
     B : ``(n_samples, n_dims)`` `ndarray`
@@ -234,7 +277,9 @@ def ipca(B, U_a, l_a, n_a, m_a=None, f=1.0, eps=1e-10):
     eps : `float`, optional
         Tolerance value for positive eigenvalue. Those eigenvalues smaller
         than the specified eps value, together with their corresponding
-        eigenvectors, will be automatically discarded.
+        eigenvectors, will be automatically discarded. Note that `eps` is
+        never allowed to be smaller than the machine precision of the dtype
+        of `U_a` (this only has an effect on single precision decompositions).
 
     Returns
     -------
@@ -250,6 +295,13 @@ def ipca(B, U_a, l_a, n_a, m_a=None, f=1.0, eps=1e-10):
     .. [1] David Ross, Jongwoo Lim, Ruei-Sung Lin, Ming-Hsuan Yang.
        "Incremental Learning for Robust Visual Tracking". IJCV, 2007.
     """
+    # the dtype of the current decomposition defines the dtype of the update
+    dtype = U_a.dtype
+    B = np.asarray(B, dtype=dtype)
+    l_a = np.asarray(l_a, dtype=dtype)
+    if m_a is not None:
+        m_a = np.asarray(m_a, dtype=dtype)
+
     # multiply current eigenvalues by total number of samples and square
     # root them to obtain singular values of the original data.
     s_a = np.sqrt((n_a - 1) * l_a)
@@ -263,16 +315,18 @@ def ipca(B, U_a, l_a, n_a, m_a=None, f=1.0, eps=1e-10):
     n = n_a + n_b
 
     if m_a is not None and not np.all(m_a == 0):
-        # centred ipca; compute mean of new data
-        m_b = np.mean(B, axis=0)
+        # centred ipca; compute mean of new data (accumulate in double
+        # precision for stability)
+        m_b = np.mean(B, axis=0, dtype=np.float64)
         # compute new mean
-        m = (n_a / n) * m_a + (n_b / n) * m_b
+        m = ((n_a / n) * m_a + (n_b / n) * m_b).astype(dtype)
+        m_b = m_b.astype(dtype)
         # centre new data
         B = B - m_b
         # augment centred data with extra sample
         B = np.vstack((B, np.sqrt((n_a * n_b) / n) * (m_b - m_a)))
     else:
-        m = np.zeros(d, dtype=B.dtype)
+        m = np.zeros(d, dtype=dtype)
 
     # project out current eigenspace out of data matrix
     PB = B - B.dot(U_a.T).dot(U_a)
@@ -291,7 +345,9 @@ def ipca(B, U_a, l_a, n_a, m_a=None, f=1.0, eps=1e-10):
 
     # compute new eigenvalues
     l = s_tilde ** 2 / (n - 1)
-    # keep only positive eigenvalues within tolerance
+    # keep only positive eigenvalues within tolerance - eigenvalues below the
+    # machine precision of the update are not meaningful
+    eps = max(eps, np.finfo(l.dtype).eps)
     l = l[l > eps]
 
     U = Vt_tilde.dot(np.vstack((U_a, B_tilde)))[:len(l), :]
@@ -1,4 +1,10 @@
 from itertools import islice
+from threading import Thread
+try:
+    from queue import Queue
+except ImportError:
+    # Python 2
+    from Queue import Queue
 import numpy as np
 from menpo.visualize import print_progress, bytes_str, print_dynamic
 
@@ -82,7 +88,8 @@ def dot_inplace_right(a, b, block_size=1000):
     return b[:n_small]
 
 
-def as_matrix(vectorizables, length=None, return_template=False, verbose=False):
+def as_matrix(vectorizables, length=None, return_template=False, verbose=False,
+              dtype=None):
     r"""
     Create a matrix from a list/generator of :map:`Vectorizable` objects.
     All the objects in the list **must** be the same size when vectorized.
@@ -103,6 +110,10 @@ def as_matrix(vectorizables, length=None, return_template=False, verbose=False):
         If ``True``, will return the first element of the list/generator, which
         was used as the template. Useful if you need to map back from the
         matrix to a list of vectorizable objects.
+    dtype : `numpy.dtype` or ``None``, optional
+        The data type of the matrix. If ``None``, the dtype of the vectorized
+        template is used. Setting it, e.g. to `numpy.float32`, avoids building
+        a full precision matrix that has to be converted afterwards.
 
     Returns
     -------
@@ -130,7 +141,9 @@ def as_matrix(vectorizables, length=None, return_template=False, verbose=False):
     n_features = template.n_parameters
     template_vector = template.as_vector()
 
-    data = np.zeros((length, n_features), dtype=template_vector.dtype)
+    if dtype is None:
+        dtype = template_vector.dtype
+    data = np.zeros((length, n_features), dtype=dtype)
     if verbose:
         print('Allocated data matrix of size {} '
               '({} samples)'.format(bytes_str(data.nbytes), length))
@@ -186,3 +199,95 @@ def from_matrix(matrix, template):
         Every row of the matrix becomes an element of the list.
     """
     return (template.from_vector(row) for row in matrix)
+
+
+def as_matrix_batches(vectorizables, batch_size, length=None, prefetch=False,
+                      dtype=None):
+    r"""
+    Create a generator of data matrices from a list/generator of
+    :map:`Vectorizable` objects, where each matrix holds (at most)
+    ``batch_size`` consecutive objects. All the objects **must** be the same
+    size when vectorized.
+
+    This allows to process datasets that are too large to be stored in a
+    single data matrix (e.g. a :map:`LazyList` of images), as only
+    one batch needs to be in memory at any time.
+
+    Parameters
+    ----------
+    vectorizables : `list` or `iterable` of :map:`Vectorizable` objects
+        A list, :map:`LazyList` or generator of objects that supports the
+        vectorizable interface.
+    batch_size : `int`
+        The (maximum) number of rows of each data matrix. The last matrix may
+        have fewer rows.
+    length : `int`, optional
+        If provided, at most ``length`` objects are consumed.
+    prefetch : `bool`, optional
+        If ``True``, the next batch is loaded and vectorized in a background
+        thread while the current batch is being processed by the caller.
+    dtype : `numpy.dtype` or ``None``, optional
+        The data type of the matrices. If ``None``, the dtype of the vectorized
+        objects is used.
+
+    Yields
+    ------
+    M : ``(n_batch, n_features)`` `ndarray`
+        Every row is an element of the list.
+    """
+    batches = (as_matrix(batch, dtype=dtype)
+               for batch in _iterate_batches(vectorizables, batch_size,
+                                             length=length))
+    if prefetch:
+        batches = _prefetch(batches)
+    return batches
+
+
+def _iterate_batches(iterable, batch_size, length=None):
+    r"""
+    Generator of lists that contain (at most) ``batch_size`` consecutive items
+    of the given iterable. If ``length`` is provided, at most ``length`` items
+    are consumed.
+    """
+    if batch_size < 1:
+        raise ValueError('batch_size must be >= 1 '
+                         '({} given)'.format(batch_size))
+    iterator = iter(iterable)
+    if length is not None:
+        iterator = islice(iterator, length)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def _prefetch(iterator):
+    r"""
+    Wraps an iterator so that the item following the one that is currently
+    consumed is computed by a background thread. Any exception raised by the
+    wrapped iterator is re-raised in the calling thread.
+    """
+    queue = Queue(maxsize=1)
+    sentinel = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                queue.put((item, None))
+        except Exception as e:
+            queue.put((sentinel, e))
+        else:
+            queue.put((sentinel, None))
+
+    thread = Thread(target=produce)
+    # do not block the interpreter from exiting if the consumer stops early
+    thread.daemon = True
+    thread.start()
+    while True:
+        item, error = queue.get()
+        if error is not None:
+            raise error
+        if item is sentinel:
+            return
+        yield item
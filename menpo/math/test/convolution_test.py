@@ -0,0 +1,86 @@
+import numpy as np
+from nose.tools import raises
+from numpy.testing import assert_allclose
+from menpo.math import log_gabor, LogGaborBank
+
+
+image_2d = np.random.random([20, 17])
+image_3d = np.random.random([8, 9, 7])
+
+
+def test_log_gabor_2d_shapes():
+    complex_conv, bandpass, S = log_gabor(image_2d, num_scales=3,
+                                          num_orientations=5)
+    assert complex_conv.shape == (3, 5, 20, 17)
+    assert bandpass.shape == (3, 20, 17)
+    assert S.shape == (20, 17)
+
+
+def test_log_gabor_3d_shapes():
+    complex_conv, bandpass, S = log_gabor(image_3d, num_scales=2,
+                                          num_phi_orientations=3,
+                                          num_theta_orientations=2)
+    assert complex_conv.shape == (2, 2, 3, 8, 9, 7)
+    assert bandpass.shape == (2, 8, 9, 7)
+    assert S.shape == (8, 9, 7)
+
+
+@raises(ValueError)
+def test_log_gabor_1d_raises():
+    log_gabor(np.random.random(10))
+
+
+@raises(TypeError)
+def test_log_gabor_2d_3d_option_raises():
+    log_gabor(image_2d, num_theta_orientations=2)
+
+
+@raises(TypeError)
+def test_log_gabor_3d_2d_option_raises():
+    log_gabor(image_3d, num_orientations=2)
+
+
+def test_log_gabor_bank_filters_cached():
+    bank = LogGaborBank()
+    filters = bank.filters(image_2d.shape)
+    assert bank.filters(image_2d.shape) is filters
+    bank.clear_cache()
+    assert bank.filters(image_2d.shape) is not filters
+
+
+def test_log_gabor_bank_apply_batch():
+    bank = LogGaborBank(num_scales=2, num_orientations=3)
+    images = np.stack([image_2d, 2 * image_2d])
+    complex_conv, bandpass, S = bank.apply_batch(images)
+    single_conv, single_bandpass, single_S = log_gabor(image_2d,
+                                                       num_scales=2,
+                                                       num_orientations=3)
+    assert complex_conv.shape == (2, 2, 3, 20, 17)
+    assert_allclose(complex_conv[0], single_conv, atol=1e-12)
+    assert_allclose(complex_conv[1], 2 * single_conv, atol=1e-12)
+    assert_allclose(bandpass[1], 2 * single_bandpass, atol=1e-12)
+    assert_allclose(S, single_S)
+
+
+def test_log_gabor_bank_3d_batch():
+    bank = LogGaborBank(num_scales=2, num_orientations=3,
+                        num_theta_orientations=2)
+    complex_conv, bandpass, _ = bank.apply_batch(image_3d[None])
+    single_conv, single_bandpass, _ = bank(image_3d)
+    assert complex_conv.shape == (1, 2, 2, 3, 8, 9, 7)
+    assert_allclose(complex_conv[0], single_conv)
+    assert_allclose(bandpass[0], single_bandpass)
+
+
+def test_log_gabor_bank_float32():
+    bank = LogGaborBank(dtype=np.float32)
+    complex_conv, bandpass, S = bank(image_2d)
+    assert complex_conv.dtype == np.complex64
+    assert bandpass.dtype == np.complex64
+    assert S.dtype == np.float32
+    assert_allclose(complex_conv, log_gabor(image_2d)[0], atol=1e-5)
+
+
+@raises(ValueError)
+def test_log_gabor_bank_invalid_dtype():
+    LogGaborBank(dtype=np.int32)
@@ -169,3 +169,70 @@ def ipca_features_nocentre_test():
     assert_almost_equal(np.abs(i_U), np.abs(b_U))
     assert_almost_equal(i_l, b_l)
     assert_almost_equal(i_m, b_m)
+
+
+def pca_float32_samples_test():
+    X = large_samples_data_matrix.astype(np.float32)
+    eigenvectors, eigenvalues, mean_vector = pca(X, centre=True)
+
+    assert eigenvectors.dtype == np.float32
+    assert eigenvalues.dtype == np.float32
+    assert mean_vector.dtype == np.float32
+    assert_almost_equal(eigenvalues, eigenvalues_centered_s, decimal=5)
+    assert_almost_equal(eigenvectors, centered_eigenvectors_s, decimal=5)
+    assert_almost_equal(mean_vector, mean_vector_s, decimal=5)
+
+
+def pca_float32_features_test():
+    X = large_samples_data_matrix.T.astype(np.float32)
+    eigenvectors, eigenvalues, mean_vector = pca(X, centre=False)
+
+    assert eigenvectors.dtype == np.float32
+    assert eigenvalues.dtype == np.float32
+    assert mean_vector.dtype == np.float32
+    assert_almost_equal(eigenvalues, eigenvalues_no_centre_f, decimal=4)
+    assert_almost_equal(eigenvectors, non_centered_eigenvectors_f, decimal=5)
+
+
+def pca_dtype_conversion_test():
+    X = large_samples_data_matrix.copy()
+    eigenvectors, eigenvalues, mean_vector = pca(X, centre=True,
+                                                 inplace=True,
+                                                 dtype=np.float32)
+
+    assert eigenvectors.dtype == np.float32
+    assert eigenvalues.dtype == np.float32
+    assert mean_vector.dtype == np.float32
+    # the original data matrix must not be touched by the conversion
+    assert_almost_equal(X, large_samples_data_matrix)
+
+
+def ipca_float32_test():
+    X = large_samples_data_matrix.astype(np.float32)
+    n_a = X.shape[0] // 2
+    U_a, l_a, m_a = pca(X[:n_a], centre=True)
+
+    # double precision new data should not promote the model
+    i_U, i_l, i_m = ipca(large_samples_data_matrix[n_a:], U_a, l_a, n_a,
+                         m_a=m_a)
+    b_U, b_l, b_m = pca(large_samples_data_matrix, centre=True)
+
+    assert i_U.dtype == np.float32
+    assert i_l.dtype == np.float32
+    assert i_m.dtype == np.float32
+    assert_almost_equal(np.abs(i_U), np.abs(b_U), decimal=5)
+    assert_almost_equal(i_l, b_l, decimal=5)
+    assert_almost_equal(i_m, b_m, decimal=5)
+
+
+def ipca_float32_rank_deficient_test():
+    # the round-off components of a single precision update are discarded
+    rng = np.random.RandomState(0)
+    X = (100 * rng.randn(60, 3).dot(rng.randn(3, 20))).astype(np.float32)
+    U_a, l_a, m_a = pca(X[:20], centre=True)
+    i_U, i_l, i_m = ipca(X[20:], U_a, l_a, 20, m_a=m_a)
+    b_U, b_l, b_m = pca(X.astype(np.float64), centre=True)
+
+    assert i_U.shape == (3, 20)
+    assert i_l.shape == (3,)
+    assert_almost_equal(i_l / b_l, 1, decimal=4)
@@ -2,8 +2,9 @@ from nose.tools import raises
 import numpy as np
 from numpy.testing import assert_equal, assert_allclose
 from menpo.math import (dot_inplace_left, dot_inplace_right, as_matrix,
-                        from_matrix)
+                        as_matrix_batches, from_matrix)
 from menpo.image import MaskedImage
+from menpo.shape import PointCloud
 
 
 n_big = 9182
@@ -95,3 +96,19 @@ def test_as_matrix_return_template():
 def test_from_matrix():
     images = from_matrix(matrix, template)
     assert isinstance(next(images), MaskedImage)
+
+
+def test_as_matrix_batches():
+    data = [PointCloud(np.random.random([10, 2])) for _ in range(5)]
+    batches = list(as_matrix_batches(data, 2))
+    assert len(batches) == 3
+    assert_equal([b.shape[0] for b in batches], [2, 2, 1])
+    assert_allclose(np.vstack(batches), as_matrix(data))
+
+
+def test_as_matrix_batches_prefetch_length():
+    data = (PointCloud(np.random.random([10, 2])) for _ in range(5))
+    batches = list(as_matrix_batches(data, 3, length=4, prefetch=True,
+                                     dtype=np.float32))
+    assert_equal([b.shape[0] for b in batches], [3, 1])
+    assert batches[0].dtype == np.float32
@@ -1,4 +1,4 @@
 from .linear import (LinearVectorModel, MeanLinearVectorModel, LinearModel,
-                     MeanLinearModel)
+                     MeanLinearModel, OrthonormalBasis)
 from .pca import PCAModel, PCAVectorModel
 from .gmrf import GMRFModel, GMRFVectorModel
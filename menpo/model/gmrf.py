@@ -1,714 +1,237 @@
-from functools import partial
+from __future__ import division
+from itertools import chain
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from scipy.sparse import bsr_matrix
 
 from menpo.base import name_of_callable
-from menpo.math import as_matrix
+from menpo.math import as_matrix, as_matrix_batches
+from menpo.math.linalg import _iterate_batches, _prefetch
 from menpo.shape import UndirectedGraph
 from menpo.visualize import print_progress, bytes_str, print_dynamic
 
 
-def _covariance_matrix_inverse(cov_mat, n_components):
-    if n_components is None:
-        return np.linalg.inv(cov_mat)
-    else:
-        try:
-            s, v, d = np.linalg.svd(cov_mat)
-            s = s[:, :n_components]
-            v = v[:n_components]
-            d = d[:n_components, :]
-            return s.dot(np.diag(1/v)).dot(d)
-        except:
-            return np.linalg.inv(cov_mat)
+# the maximum number of elements of the edge data gathered at once when
+# computing the per-edge statistics
+_MAX_EDGE_DATA_SIZE = 2 ** 24
+# the maximum number of elements of the temporary arrays created per chunk of
+# samples when computing the mahalanobis distance
+_MAX_MAHALANOBIS_CHUNK_SIZE = 2 ** 22
+# the number of matrices that are inverted at once
+_INVERSE_CHUNK_SIZE = 2 ** 12
 
 
-def _create_sparse_precision(X, graph, n_features, n_features_per_vertex,
-                             mode='concatenation', dtype=np.float32,
-                             n_components=None, bias=0,
-                             return_covariances=False, verbose=False):
-    # check mode argument
+def _check_mode(mode):
     if mode not in ['concatenation', 'subtraction']:
         raise ValueError("mode must be either ''concatenation'' "
                          "or ''subtraction''; {} is given.".format(mode))
 
-    # Initialize arrays
-    all_blocks = np.zeros((graph.n_edges * 4,
-                           n_features_per_vertex, n_features_per_vertex),
-                          dtype=dtype)
-    if return_covariances:
-        if mode == 'concatenation':
-            cov_shape = (graph.n_edges,
-                         2 * n_features_per_vertex, 2 * n_features_per_vertex)
-        else:
-            cov_shape = (graph.n_edges,
-                         n_features_per_vertex, n_features_per_vertex)
-        all_covariances = np.zeros(cov_shape, dtype=dtype)
-    columns = np.zeros(graph.n_edges * 4)
-    rows = np.zeros(graph.n_edges * 4)
 
-    # Print information if asked
-    if verbose:
-        edges = print_progress(range(graph.n_edges), n_items=graph.n_edges,
-                               prefix='Precision per edge',
-                               end_with_newline=False)
-    else:
-        edges = range(graph.n_edges)
-
-    # Compute covariance matrix for each edge, invert it and store it
-    count = -1
-    for e in edges:
-        # edge vertices
-        v1 = graph.edges[e, 0]
-        v2 = graph.edges[e, 1]
-
-        # find indices in data matrix
-        v1_from = v1 * n_features_per_vertex
-        v1_to = (v1 + 1) * n_features_per_vertex
-        v2_from = v2 * n_features_per_vertex
-        v2_to = (v2 + 1) * n_features_per_vertex
-
-        # data concatenation
-        if mode == 'concatenation':
-            edge_data = X[:, list(range(v1_from, v1_to)) +
-                             list(range(v2_from, v2_to))]
-        else:
-            edge_data = X[:, v1_from:v1_to] - X[:, v2_from:v2_to]
-
-        # compute covariance matrix
-        covmat = np.cov(edge_data, rowvar=0, bias=bias)
-        if return_covariances:
-            all_covariances[e] = covmat
-
-        # invert it
-        covmat = _covariance_matrix_inverse(covmat, n_components)
-
-        # store it
-        if mode == 'concatenation':
-            # v1, v1
-            count += 1
-            all_blocks[count] = \
-                covmat[:n_features_per_vertex, :n_features_per_vertex]
-            rows[count] = v1
-            columns[count] = v1
-            # v2, v2
-            count += 1
-            all_blocks[count] = \
-                covmat[n_features_per_vertex::, n_features_per_vertex::]
-            rows[count] = v2
-            columns[count] = v2
-            # v1, v2
-            count += 1
-            all_blocks[count] = \
-                covmat[:n_features_per_vertex, n_features_per_vertex::]
-            rows[count] = v1
-            columns[count] = v2
-            # v2, v1
-            count += 1
-            all_blocks[count] = \
-                covmat[n_features_per_vertex::, :n_features_per_vertex]
-            rows[count] = v2
-            columns[count] = v1
-        else:
-            # v1, v1
-            count += 1
-            all_blocks[count] = covmat
-            rows[count] = v1
-            columns[count] = v1
-            # v2, v2
-            count += 1
-            all_blocks[count] = covmat
-            rows[count] = v2
-            columns[count] = v2
-            # v1, v2
-            count += 1
-            all_blocks[count] = -covmat
-            rows[count] = v1
-            columns[count] = v2
-            # v2, v1
-            count += 1
-            all_blocks[count] = -covmat
-            rows[count] = v2
-            columns[count] = v1
-
-    # sort rows, columns and all_blocks
-    rows_arg_sort = rows.argsort()
-    columns = columns[rows_arg_sort]
-    all_blocks = all_blocks[rows_arg_sort]
-    rows = rows[rows_arg_sort]
-
-    # create indptr
-    n_rows = graph.n_vertices
-    indptr = np.zeros(n_rows + 1)
-    for i in range(n_rows):
-        inds, = np.where(rows == i)
-        if inds.size == 0:
-            indptr[i + 1] = indptr[i]
-        else:
-            indptr[i] = inds[0]
-            indptr[i + 1] = inds[-1] + 1
-
-    # create block sparse matrix
-    if return_covariances:
-        return (bsr_matrix((all_blocks, columns, indptr),
-                           shape=(n_features, n_features), dtype=dtype),
-                all_covariances)
+def _covariance_matrix_inverse(cov_mat, n_components):
+    # cov_mat can be a single matrix or a stack of matrices
+    if n_components is None:
+        return np.linalg.inv(cov_mat)
     else:
-        return bsr_matrix((all_blocks, columns, indptr),
-                          shape=(n_features, n_features), dtype=dtype)
+        try:
+            s, v, d = np.linalg.svd(cov_mat)
+            s = s[..., :n_components]
+            v = v[..., :n_components]
+            d = d[..., :n_components, :]
+            return np.matmul(s / v[..., None, :], d)
+        except np.linalg.LinAlgError:
+            return np.linalg.inv(cov_mat)
 
 
-def _create_dense_precision(X, graph, n_features, n_features_per_vertex,
-                            mode='concatenation', dtype=np.float32,
-                            n_components=None, bias=0,
-                            return_covariances=False, verbose=False):
-    # check mode argument
-    if mode not in ['concatenation', 'subtraction']:
-        raise ValueError("mode must be either ''concatenation'' "
-                         "or ''subtraction''; {} is given.".format(mode))
+def _vertex_features_indices(vertices, n_features_per_vertex):
+    # (n_vertices, n_features_per_vertex) indices of the features of each
+    # vertex in the data matrix
+    return (np.asarray(vertices)[:, None] * n_features_per_vertex +
+            np.arange(n_features_per_vertex))
 
-    # Initialize precision
-    precision = np.zeros((n_features, n_features), dtype=dtype)
-    if return_covariances:
-        if mode == 'concatenation':
-            cov_shape = (graph.n_edges,
-                         2 * n_features_per_vertex, 2 * n_features_per_vertex)
-        else:
-            cov_shape = (graph.n_edges,
-                         n_features_per_vertex, n_features_per_vertex)
-        all_covariances = np.zeros(cov_shape, dtype=dtype)
 
-    # Print information if asked
-    if verbose:
-        print_dynamic('Allocated precision matrix of size {}'.format(
-            bytes_str(precision.nbytes)))
-        edges = print_progress(range(graph.n_edges), n_items=graph.n_edges,
-                               prefix='Precision per edge',
-                               end_with_newline=False)
-    else:
-        edges = range(graph.n_edges)
-
-    # Compute covariance matrix for each edge, invert it and store it
-    for e in edges:
-        # edge vertices
-        v1 = graph.edges[e, 0]
-        v2 = graph.edges[e, 1]
-
-        # find indices in data matrix
-        v1_from = v1 * n_features_per_vertex
-        v1_to = (v1 + 1) * n_features_per_vertex
-        v2_from = v2 * n_features_per_vertex
-        v2_to = (v2 + 1) * n_features_per_vertex
-
-        # data concatenation
-        if mode == 'concatenation':
-            edge_data = X[:, list(range(v1_from, v1_to)) +
-                             list(range(v2_from, v2_to))]
-        else:
-            edge_data = X[:, v1_from:v1_to] - X[:, v2_from:v2_to]
-
-        # compute covariance matrix
-        covmat = np.cov(edge_data, rowvar=0, bias=bias)
-        if return_covariances:
-            all_covariances[e] = covmat
-
-        # invert it
-        covmat = _covariance_matrix_inverse(covmat, n_components)
-
-        # store it
-        if mode == 'concatenation':
-            # v1, v1
-            precision[v1_from:v1_to, v1_from:v1_to] += \
-                covmat[:n_features_per_vertex, :n_features_per_vertex]
-            # v2, v2
-            precision[v2_from:v2_to, v2_from:v2_to] += \
-                covmat[n_features_per_vertex::, n_features_per_vertex::]
-            # v1, v2
-            precision[v1_from:v1_to, v2_from:v2_to] = \
-                covmat[:n_features_per_vertex, n_features_per_vertex::]
-            # v2, v1
-            precision[v2_from:v2_to, v1_from:v1_to] = \
-                covmat[n_features_per_vertex::, :n_features_per_vertex]
-        elif mode == 'subtraction':
-            # v1, v2
-            precision[v1_from:v1_to, v2_from:v2_to] = -covmat
-            # v2, v1
-            precision[v2_from:v2_to, v1_from:v1_to] = -covmat
-            # v1, v1
-            precision[v1_from:v1_to, v1_from:v1_to] += covmat
-            # v2, v2
-            precision[v2_from:v2_to, v2_from:v2_to] += covmat
-
-    # return covariances
-    if return_covariances:
-        return precision, all_covariances
-    else:
-        return precision
-
-
-def _create_sparse_diagonal_precision(X, graph, n_features,
-                                      n_features_per_vertex,
-                                      dtype=np.float32, n_components=None,
-                                      bias=0, return_covariances=False,
-                                      verbose=False):
-    # initialize covariances matrix
-    all_blocks = np.zeros((graph.n_vertices,
-                           n_features_per_vertex, n_features_per_vertex),
-                          dtype=dtype)
-    if return_covariances:
-        all_covariances = np.zeros(
-            (graph.n_vertices, n_features_per_vertex, n_features_per_vertex),
-            dtype=dtype)
-    columns = np.zeros(graph.n_vertices)
-    rows = np.zeros(graph.n_vertices)
-
-    # Print information if asked
-    if verbose:
-        vertices = print_progress(
-            range(graph.n_vertices), n_items=graph.n_vertices,
-            prefix='Precision per vertex', end_with_newline=False)
+def _edge_data(X, v1, v2, n_features_per_vertex, mode='concatenation'):
+    # Gathers the data of the given edges as an
+    # (n_samples, n_edges, n_edge_features) array. If v2 is None, the data of
+    # the v1 vertices is returned.
+    i1 = _vertex_features_indices(v1, n_features_per_vertex)
+    if v2 is None:
+        return X[:, i1]
+    i2 = _vertex_features_indices(v2, n_features_per_vertex)
+    if mode == 'concatenation':
+        return X[:, np.hstack((i1, i2))]
     else:
-        vertices = range(graph.n_vertices)
-
-    # Compute covariance matrix for each patch
-    for v in vertices:
-        # find indices in target precision matrix
-        i_from = v * n_features_per_vertex
-        i_to = (v + 1) * n_features_per_vertex
-
-        # compute covariance
-        covmat = np.cov(X[:, i_from:i_to], rowvar=0, bias=bias)
-        if return_covariances:
-            all_covariances[v] = covmat
-
-        # invert it
-        all_blocks[v] = _covariance_matrix_inverse(covmat, n_components)
-
-        # store the inverse covariance and its locations
-        rows[v] = v
-        columns[v] = v
-
-    # sort rows, columns and all_blocks
-    rows_arg_sort = rows.argsort()
-    columns = columns[rows_arg_sort]
-    all_blocks = all_blocks[rows_arg_sort]
-    rows = rows[rows_arg_sort]
-
-    # create indptr
-    n_rows = graph.n_vertices
-    indptr = np.zeros(n_rows + 1)
-    for i in range(n_rows):
-        inds, = np.where(rows == i)
-        if inds.size == 0:
-            indptr[i + 1] = indptr[i]
-        else:
-            indptr[i] = inds[0]
-            indptr[i + 1] = inds[-1] + 1
-
-    # create block sparse matrix
-    if return_covariances:
-        return (bsr_matrix((all_blocks, columns, indptr),
-                           shape=(n_features, n_features), dtype=dtype),
-                all_covariances)
-    else:
-        return bsr_matrix((all_blocks, columns, indptr),
-                          shape=(n_features, n_features), dtype=dtype)
-
-
-def _create_dense_diagonal_precision(X, graph, n_features,
-                                     n_features_per_vertex,
-                                     dtype=np.float32, n_components=None,
-                                     bias=0, return_covariances=False,
-                                     verbose=False):
-    # Initialize precision
-    precision = np.zeros((n_features, n_features), dtype=dtype)
-    if return_covariances:
-        all_covariances = np.zeros(
-            (graph.n_vertices, n_features_per_vertex, n_features_per_vertex),
-            dtype=dtype)
-    if verbose:
-        print_dynamic('Allocated precision matrix of size {}'.format(
-            bytes_str(precision.nbytes)))
-
-    # Print information if asked
-    if verbose:
-        vertices = print_progress(
-            range(graph.n_vertices), n_items=graph.n_vertices,
-            prefix='Precision per vertex', end_with_newline=False)
-    else:
-        vertices = range(graph.n_vertices)
+        return X[:, i1] - X[:, i2]
 
-    # Compute covariance matrix for each patch
-    for v in vertices:
-        # find indices in target precision matrix
-        i_from = v * n_features_per_vertex
-        i_to = (v + 1) * n_features_per_vertex
 
-        # compute covariance
-        covmat = np.cov(X[:, i_from:i_to], rowvar=0, bias=bias)
-        if return_covariances:
-            all_covariances[v] = covmat
+def _chunks(n_items, chunk_size):
+    # slices that split n_items into consecutive chunks of chunk_size items
+    chunk_size = max(1, chunk_size)
+    return [slice(i, min(i + chunk_size, n_items))
+            for i in range(0, n_items, chunk_size)]
 
-        # invert it
-        covmat = _covariance_matrix_inverse(covmat, n_components)
 
-        # insert to precision matrix
-        precision[i_from:i_to, i_from:i_to] = covmat
-
-    # return covariances
-    if return_covariances:
-        return precision, all_covariances
+def _imap_chunks(function, chunks, n_workers=1):
+    # lazily maps function to the chunks, optionally using a pool of threads.
+    # numpy and scipy.sparse release the GIL in the heavy routines that are
+    # called per chunk, and threads do not need to copy the data.
+    if n_workers > 1 and len(chunks) > 1:
+        pool = ThreadPool(n_workers)
+        try:
+            for result in pool.imap(function, chunks):
+                yield result
+        finally:
+            pool.terminate()
     else:
-        return precision
+        for chunk in chunks:
+            yield function(chunk)
 
 
-def _increment_sparse_precision(X, mean_vector, covariances, n, graph,
-                                n_features, n_features_per_vertex,
-                                mode='concatenation', dtype=np.float32,
-                                n_components=None, bias=0, verbose=False):
-    # check mode argument
-    if mode not in ['concatenation', 'subtraction']:
-        raise ValueError("mode must be either ''concatenation'' "
-                         "or ''subtraction''; {} is given.".format(mode))
-
-    # Initialize arrays
-    all_blocks = np.zeros((graph.n_edges * 4,
-                           n_features_per_vertex, n_features_per_vertex),
-                          dtype=dtype)
-    columns = np.zeros(graph.n_edges * 4)
-    rows = np.zeros(graph.n_edges * 4)
-
-    # Print information if asked
+def _edge_statistics(X, v1, v2, n_features_per_vertex, mode='concatenation',
+                     n_workers=1, verbose=False):
+    r"""
+    Computes the mean and the scatter matrix (sum of the outer products of
+    the centred data) of the data of each edge (or vertex if ``v2`` is
+    ``None``). The edges are processed in chunks with batched linear algebra
+    calls and the chunks are optionally distributed to a pool of
+    ``n_workers`` threads.
+
+    Returns the ``(n_edges, n_edge_features)`` means and the
+    ``(n_edges, n_edge_features, n_edge_features)`` scatter matrices.
+    """
+    n_edge_features = n_features_per_vertex * (
+        2 if v2 is not None and mode == 'concatenation' else 1)
+    chunks = _chunks(len(v1),
+                     _MAX_EDGE_DATA_SIZE // (X.shape[0] * n_edge_features))
+
+    def compute_chunk(chunk):
+        data = _edge_data(X, v1[chunk], None if v2 is None else v2[chunk],
+                          n_features_per_vertex, mode=mode)
+        means = np.mean(data, axis=0)
+        # (n_edges, n_samples, n_edge_features)
+        data = (data - means).transpose(1, 0, 2)
+        return means, np.matmul(data.transpose(0, 2, 1), data)
+
+    results = _imap_chunks(compute_chunk, chunks, n_workers=n_workers)
     if verbose:
-        edges = print_progress(range(graph.n_edges), n_items=graph.n_edges,
-                               prefix='Precision per edge',
-                               end_with_newline=False)
-    else:
-        edges = range(graph.n_edges)
-
-    # Compute covariance matrix for each edge, invert it and store it
-    count = -1
-    for e in edges:
-        # edge vertices
-        v1 = graph.edges[e, 0]
-        v2 = graph.edges[e, 1]
-
-        # find indices in data matrix
-        v1_from = v1 * n_features_per_vertex
-        v1_to = (v1 + 1) * n_features_per_vertex
-        v2_from = v2 * n_features_per_vertex
-        v2_to = (v2 + 1) * n_features_per_vertex
-
-        # data concatenation
-        if mode == 'concatenation':
-            edge_data = X[:, list(range(v1_from, v1_to)) +
-                             list(range(v2_from, v2_to))]
-            m = mean_vector[list(range(v1_from, v1_to)) +
-                            list(range(v2_from, v2_to))]
-        else:
-            edge_data = X[:, v1_from:v1_to] - X[:, v2_from:v2_to]
-            m = mean_vector[v1_from:v1_to] - mean_vector[v2_from:v2_to]
-
-        # increment
-        _, covariances[e] = _increment_multivariate_gaussian_cov(
-            edge_data, m, covariances[e], n, bias=bias)
-
-        # invert it
-        covmat = _covariance_matrix_inverse(covariances[e], n_components)
-
-        # store it
-        if mode == 'concatenation':
-            # v1, v1
-            count += 1
-            all_blocks[count] = \
-                covmat[:n_features_per_vertex, :n_features_per_vertex]
-            rows[count] = v1
-            columns[count] = v1
-            # v2, v2
-            count += 1
-            all_blocks[count] = \
-                covmat[n_features_per_vertex::, n_features_per_vertex::]
-            rows[count] = v2
-            columns[count] = v2
-            # v1, v2
-            count += 1
-            all_blocks[count] = \
-                covmat[:n_features_per_vertex, n_features_per_vertex::]
-            rows[count] = v1
-            columns[count] = v2
-            # v2, v1
-            count += 1
-            all_blocks[count] = \
-                covmat[n_features_per_vertex::, :n_features_per_vertex]
-            rows[count] = v2
-            columns[count] = v1
-        else:
-            # v1, v1
-            count += 1
-            all_blocks[count] = covmat
-            rows[count] = v1
-            columns[count] = v1
-            # v2, v2
-            count += 1
-            all_blocks[count] = covmat
-            rows[count] = v2
-            columns[count] = v2
-            # v1, v2
-            count += 1
-            all_blocks[count] = -covmat
-            rows[count] = v1
-            columns[count] = v2
-            # v2, v1
-            count += 1
-            all_blocks[count] = -covmat
-            rows[count] = v2
-            columns[count] = v1
-
-    # sort rows, columns and all_blocks
-    rows_arg_sort = rows.argsort()
-    columns = columns[rows_arg_sort]
-    all_blocks = all_blocks[rows_arg_sort]
-    rows = rows[rows_arg_sort]
-
-    # create indptr
-    n_rows = graph.n_vertices
-    indptr = np.zeros(n_rows + 1)
-    for i in range(n_rows):
-        inds, = np.where(rows == i)
-        if inds.size == 0:
-            indptr[i + 1] = indptr[i]
-        else:
-            indptr[i] = inds[0]
-            indptr[i + 1] = inds[-1] + 1
-
-    # create block sparse matrix
-    return (bsr_matrix((all_blocks, columns, indptr),
-                       shape=(n_features, n_features), dtype=dtype),
-            covariances)
+        prefix = ('Statistics per vertex' if v2 is None
+                  else 'Statistics per edge')
+        results = print_progress(results, n_items=len(chunks), prefix=prefix,
+                                 end_with_newline=False)
+    means, scatters = zip(*results)
+    return np.concatenate(means), np.concatenate(scatters)
 
 
-def _increment_dense_precision(X, mean_vector, covariances, n, graph,
-                               n_features, n_features_per_vertex,
-                               mode='concatenation', dtype=np.float32,
-                               n_components=None, bias=0, verbose=False):
-    # check mode argument
-    if mode not in ['concatenation', 'subtraction']:
-        raise ValueError("mode must be either ''concatenation'' "
-                         "or ''subtraction''; {} is given.".format(mode))
-
-    # Initialize precision
-    precision = np.zeros((n_features, n_features), dtype=dtype)
+def _combine_statistics(n_a, mean_a, scatter_a, n_b, mean_b, scatter_b):
+    r"""
+    Combines the (stacked) means and scatter matrices of two disjoint sets of
+    ``n_a`` and ``n_b`` samples, using the pairwise update of Chan et al.,
+    which is numerically stable.
 
-    # Print information if asked
-    if verbose:
-        print_dynamic('Allocated precision matrix of size {}'.format(
-            bytes_str(precision.nbytes)))
-        edges = print_progress(range(graph.n_edges), n_items=graph.n_edges,
-                               prefix='Precision per edge',
-                               end_with_newline=False)
-    else:
-        edges = range(graph.n_edges)
-
-    # Compute covariance matrix for each edge, invert it and store it
-    for e in edges:
-        # edge vertices
-        v1 = graph.edges[e, 0]
-        v2 = graph.edges[e, 1]
-
-        # find indices in data matrix
-        v1_from = v1 * n_features_per_vertex
-        v1_to = (v1 + 1) * n_features_per_vertex
-        v2_from = v2 * n_features_per_vertex
-        v2_to = (v2 + 1) * n_features_per_vertex
-
-        # data concatenation
-        if mode == 'concatenation':
-            edge_data = X[:, list(range(v1_from, v1_to)) +
-                             list(range(v2_from, v2_to))]
-            m = mean_vector[list(range(v1_from, v1_to)) +
-                            list(range(v2_from, v2_to))]
-        else:
-            edge_data = X[:, v1_from:v1_to] - X[:, v2_from:v2_to]
-            m = mean_vector[v1_from:v1_to] - mean_vector[v2_from:v2_to]
-
-        # increment
-        _, covariances[e] = _increment_multivariate_gaussian_cov(
-            edge_data, m, covariances[e], n, bias=bias)
-
-        # invert it
-        covmat = _covariance_matrix_inverse(covariances[e], n_components)
-
-        # store it
-        if mode == 'concatenation':
-            # v1, v1
-            precision[v1_from:v1_to, v1_from:v1_to] += \
-                covmat[:n_features_per_vertex, :n_features_per_vertex]
-            # v2, v2
-            precision[v2_from:v2_to, v2_from:v2_to] += \
-                covmat[n_features_per_vertex::, n_features_per_vertex::]
-            # v1, v2
-            precision[v1_from:v1_to, v2_from:v2_to] = \
-                covmat[:n_features_per_vertex, n_features_per_vertex::]
-            # v2, v1
-            precision[v2_from:v2_to, v1_from:v1_to] = \
-                covmat[n_features_per_vertex::, :n_features_per_vertex]
-        elif mode == 'subtraction':
-            # v1, v2
-            precision[v1_from:v1_to, v2_from:v2_to] = -covmat
-            # v2, v1
-            precision[v2_from:v2_to, v1_from:v1_to] = -covmat
-            # v1, v1
-            precision[v1_from:v1_to, v1_from:v1_to] += covmat
-            # v2, v2
-            precision[v2_from:v2_to, v2_from:v2_to] += covmat
-
-    # return covariances
-    return precision, covariances
-
-
-def _increment_sparse_diagonal_precision(X, mean_vector, covariances, n, graph,
-                                         n_features, n_features_per_vertex,
-                                         dtype=np.float32, n_components=None,
-                                         bias=0, verbose=False):
-    # initialize covariances matrix
-    all_blocks = np.zeros((graph.n_vertices,
-                           n_features_per_vertex, n_features_per_vertex),
-                          dtype=dtype)
-    columns = np.zeros(graph.n_vertices)
-    rows = np.zeros(graph.n_vertices)
-
-    # Print information if asked
-    if verbose:
-        vertices = print_progress(
-            range(graph.n_vertices), n_items=graph.n_vertices,
-            prefix='Precision per vertex', end_with_newline=False)
+    References
+    ----------
+    .. [1] T. F. Chan, G. H. Golub, and R. J. LeVeque. "Updating formulae and
+       a pairwise algorithm for computing sample variances", Technical Report
+       STAN-CS-79-773, Stanford University, 1979.
+    """
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    scatter = (scatter_a + scatter_b +
+               (n_a * n_b / n) * (delta[..., :, None] * delta[..., None, :]))
+    return mean, scatter
+
+
+def _covariance_normalization(n_samples, bias):
+    # the same normalization as np.cov
+    return n_samples if bias else n_samples - 1
+
+
+def _edge_precision_blocks(precisions, v1, v2, n_features_per_vertex,
+                           mode='concatenation'):
+    # Splits the precision of each edge to the four blocks that correspond to
+    # the (v1, v1), (v2, v2), (v1, v2) and (v2, v1) locations of the
+    # precision matrix
+    k = n_features_per_vertex
+    if mode == 'concatenation':
+        blocks = (precisions[:, :k, :k], precisions[:, k:, k:],
+                  precisions[:, :k, k:], precisions[:, k:, :k])
     else:
-        vertices = range(graph.n_vertices)
-
-    # Compute covariance matrix for each patch
-    for v in vertices:
-        # find indices in target precision matrix
-        i_from = v * n_features_per_vertex
-        i_to = (v + 1) * n_features_per_vertex
-
-        # get data
-        edge_data = X[:, i_from:i_to]
-        m = mean_vector[i_from:i_to]
-
-        # increment
-        _, covariances[v] = _increment_multivariate_gaussian_cov(
-            edge_data, m, covariances[v], n, bias=bias)
-
-        # invert it
-        all_blocks[v] = _covariance_matrix_inverse(covariances[v], n_components)
-
-        # store the inverse covariance and its locations
-        rows[v] = v
-        columns[v] = v
-
-    # sort rows, columns and all_blocks
-    rows_arg_sort = rows.argsort()
-    columns = columns[rows_arg_sort]
-    all_blocks = all_blocks[rows_arg_sort]
-    rows = rows[rows_arg_sort]
-
-    # create indptr
-    n_rows = graph.n_vertices
-    indptr = np.zeros(n_rows + 1)
-    for i in range(n_rows):
-        inds, = np.where(rows == i)
-        if inds.size == 0:
-            indptr[i + 1] = indptr[i]
-        else:
-            indptr[i] = inds[0]
-            indptr[i + 1] = inds[-1] + 1
+        blocks = (precisions, precisions, -precisions, -precisions)
+    return (np.concatenate(blocks), np.concatenate((v1, v2, v1, v2)),
+            np.concatenate((v1, v2, v2, v1)))
 
-    # create block sparse matrix
-    return (bsr_matrix((all_blocks, columns, indptr),
-                       shape=(n_features, n_features), dtype=dtype),
-            covariances)
 
+def _merge_blocks(blocks, rows, columns, n_vertices):
+    r"""
+    Sorts the blocks in row-major order of their (row, column) location and
+    sums the blocks that share the same location (e.g. the diagonal blocks of
+    vertices that belong to many edges).
 
-def _increment_dense_diagonal_precision(X, mean_vector, covariances, n, graph,
-                                        n_features, n_features_per_vertex,
-                                        dtype=np.float32, n_components=None,
-                                        bias=0, verbose=False):
-    # Initialize precision
+    Returns the merged blocks and their rows and columns.
+    """
+    keys = np.asarray(rows, dtype=np.int64) * n_vertices + columns
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    # the first block of every group of blocks with the same location
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    blocks = np.add.reduceat(blocks[order], starts, axis=0)
+    keys = keys[starts]
+    return blocks, keys // n_vertices, keys % n_vertices
+
+
+def _bsr_from_blocks(blocks, rows, columns, n_vertices, n_features,
+                     dtype=np.float32):
+    blocks, rows, columns = _merge_blocks(blocks, rows, columns, n_vertices)
+    # the blocks of row i are blocks[indptr[i]:indptr[i + 1]]
+    indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_vertices), out=indptr[1:])
+    # create block sparse matrix, which is in canonical format as the blocks
+    # are sorted and without duplicates
+    precision = bsr_matrix((blocks.astype(dtype), columns, indptr),
+                           shape=(n_features, n_features), dtype=dtype)
+    precision.has_canonical_format = True
+    return precision
+
+
+def _dense_from_blocks(blocks, rows, columns, n_vertices, n_features,
+                       dtype=np.float32, verbose=False):
     precision = np.zeros((n_features, n_features), dtype=dtype)
-
-    # Print information if asked
     if verbose:
         print_dynamic('Allocated precision matrix of size {}'.format(
             bytes_str(precision.nbytes)))
-        vertices = print_progress(
-            range(graph.n_vertices), n_items=graph.n_vertices,
-            prefix='Precision per vertex', end_with_newline=False)
+    blocks, rows, columns = _merge_blocks(blocks, rows, columns, n_vertices)
+    # (n_vertices, n_vertices, k, k) view on the blocks of the precision
+    k = blocks.shape[1]
+    precision_blocks = precision.reshape(
+        n_vertices, k, n_vertices, k).transpose(0, 2, 1, 3)
+    precision_blocks[rows, columns] = blocks
+    return precision
+
+
+def _create_precision(covariances, v1, v2, n_vertices, n_features_per_vertex,
+                      mode='concatenation', sparse=True, dtype=np.float32,
+                      n_components=None, n_workers=1, verbose=False):
+    r"""
+    Inverts the stacked covariance matrices of the edges (or vertices if
+    ``v2`` is ``None``) and assembles the precision matrix from them.
+    """
+    chunks = _chunks(covariances.shape[0], _INVERSE_CHUNK_SIZE)
+    precisions = np.concatenate(list(_imap_chunks(
+        lambda c: _covariance_matrix_inverse(covariances[c], n_components),
+        chunks, n_workers=n_workers)))
+
+    if v2 is None:
+        blocks, rows, columns = precisions, v1, v1
     else:
-        vertices = range(graph.n_vertices)
-
-    # Compute covariance matrix for each patch
-    for v in vertices:
-        # find indices in target precision matrix
-        i_from = v * n_features_per_vertex
-        i_to = (v + 1) * n_features_per_vertex
-
-        # get data
-        edge_data = X[:, i_from:i_to]
-        m = mean_vector[i_from:i_to]
-
-        # increment
-        _, covariances[v] = _increment_multivariate_gaussian_cov(
-            edge_data, m, covariances[v], n, bias=bias)
-
-        # invert it
-        precision[i_from:i_to, i_from:i_to] = _covariance_matrix_inverse(
-            covariances[v], n_components)
-
-    # return covariances
-    return precision, covariances
-
-
-def _increment_multivariate_gaussian_mean(X, m, n):
-    # Get new number of samples
-    new_n = X.shape[0]
-
-    # Update mean vector
-    # m_{new} = (n m + \sum_{i=1}^{n_{new}} x_i) / (n + n_{new})
-    # where: m       -> old mean vector
-    #        n_{new} -> new number of samples
-    #        n       -> old number of samples
-    #        x_i     -> new data vectors
-    return (n * m + np.sum(X, axis=0)) / (n + new_n)
-
-
-def _increment_multivariate_gaussian_cov(X, m, S, n, bias=0):
-    # Get new number of samples
-    new_n = X.shape[0]
-
-    # Update mean vector
-    # m_{new} = (n m + \sum_{i=1}^{n_{new}} x_i) / (n + n_{new})
-    # where: m_{new} -> new mean vector
-    #        m       -> old mean vector
-    #        n_{new} -> new number of samples
-    #        n       -> old number of samples
-    #        x_i     -> new data vectors
-    new_m = _increment_multivariate_gaussian_mean(X, m, n)
-
-    # Select the normalization value
-    if bias == 1:
-        k = n
-    elif bias == 0:
-        k = n - 1
+        blocks, rows, columns = _edge_precision_blocks(
+            precisions, v1, v2, n_features_per_vertex, mode=mode)
+    n_features = n_vertices * n_features_per_vertex
+    if sparse:
+        return _bsr_from_blocks(blocks, rows, columns, n_vertices,
+                                n_features, dtype=dtype)
     else:
-        raise ValueError("bias must be either 0 or 1")
-
-    # Update covariance matrix
-    # S__{new} = (k S + n m^T m + X^T X - (n + n_{new}) m_{new}^T m_{new})
-    #                                                            / (k + n_{new})
-    m1 = n * m[None, :].T.dot(m[None, :])
-    m2 = (n + new_n) * new_m[None, :].T.dot(new_m[None, :])
-    new_S = (k * S + m1 + X.T.dot(X) - m2) / (k + new_n)
-
-    return new_m, new_S
+        return _dense_from_blocks(blocks, rows, columns, n_vertices,
+                                  n_features, dtype=dtype, verbose=verbose)
 
 
 class GMRFVectorModel(object):
@@ -761,6 +284,9 @@ class GMRFVectorModel(object):
         This argument must be set to ``True`` in case the user wants to
         incrementally update the GMRF. Note that if ``True``, the model
         occupies 2x memory.
+    n_workers : `int`, optional
+        The number of threads that are used to compute the precision blocks
+        of the edges. Useful for graphs with many edges.
     verbose : `bool`, optional
         If ``True``, the progress of the model's training is printed.
 
@@ -802,14 +328,95 @@ class GMRFVectorModel(object):
     """
     def __init__(self, samples, graph, n_samples=None, mode='concatenation',
                  n_components=None, dtype=np.float64, sparse=True, bias=0,
-                 incremental=False, verbose=False):
+                 incremental=False, n_workers=1, verbose=False):
         # Generate data matrix
         # (n_samples, n_features)
-        data, self.n_samples = self._data_to_matrix(samples, n_samples)
+        data, _ = self._data_to_matrix(samples, n_samples)
+
+        # Train the model from a single batch of data
+        self._init_from_batches(
+            [data], graph, mode=mode, n_components=n_components, dtype=dtype,
+            sparse=sparse, bias=bias, incremental=incremental,
+            n_workers=n_workers, verbose=verbose)
+
+    @classmethod
+    def init_from_stream(cls, samples, graph, batch_size, n_samples=None,
+                         mode='concatenation', n_components=None,
+                         dtype=np.float64, sparse=True, bias=0,
+                         incremental=False, n_workers=1, prefetch=False,
+                         verbose=False):
+        r"""
+        Trains a Gaussian Markov Random Field (GMRF) from a stream of samples
+        that are consumed in mini-batches.
+
+        The mean and scatter matrix of each edge are accumulated batch by
+        batch with the numerically stable pairwise update of Chan et al., so
+        the data matrix of all the samples is never created and only a single
+        batch is held in memory at any time.
+
+        Parameters
+        ----------
+        samples : `ndarray` or `list` or `iterable` of `ndarray`
+            List, generator or data matrix of ``(n_features,)`` samples.
+        graph : :map:`UndirectedGraph` or :map:`DirectedGraph` or :map:`Tree`
+            The graph that defines the relations between the features.
+        batch_size : `int`
+            The number of samples of each batch.
+        n_samples : `int`, optional
+            If provided, at most ``n_samples`` samples are consumed from
+            ``samples``.
+        mode : ``{'concatenation', 'subtraction'}``, optional
+            Defines the feature vector of each edge. See :map:`GMRFVectorModel`.
+        n_components : `int` or ``None``, optional
+            When ``None`` (default), the covariance matrix of each edge is
+            inverted using `np.linalg.inv`. If `int`, it is inverted using
+            truncated SVD using the specified number of compnents.
+        dtype : `numpy.dtype`, optional
+            The data type of the GMRF's precision matrix.
+        sparse : `bool`, optional
+            When ``True``, the GMRF's precision matrix has type
+            `scipy.sparse.bsr_matrix`, otherwise it is a `numpy.array`.
+        bias : `int`, optional
+            Default normalization is by ``(N - 1)``, where ``N`` is the number
+            of observations given (unbiased estimate). If `bias` is 1, then
+            normalization is by ``N``.
+        incremental : `bool`, optional
+            This argument must be set to ``True`` in case the user wants to
+            incrementally update the GMRF.
+        n_workers : `int`, optional
+            The number of threads that are used to compute the statistics and
+            the precision blocks of the edges.
+        prefetch : `bool`, optional
+            If ``True``, the next batch is loaded in a background thread while
+            the statistics of the current one are computed.
+        verbose : `bool`, optional
+            If ``True``, the progress of the model's training is printed.
 
-        # n_features and n_features_per_vertex
-        self.n_features = data.shape[1]
-        self.n_features_per_vertex = int(self.n_features / graph.n_vertices)
+        Returns
+        -------
+        model : `cls`
+            The trained GMRF.
+        """
+        if n_samples is None and hasattr(samples, '__len__'):
+            n_samples = len(samples)
+        batches = (np.asarray(batch)
+                   for batch in _iterate_batches(samples, batch_size,
+                                                 length=n_samples))
+        if prefetch:
+            batches = _prefetch(batches)
+        model = cls.__new__(cls)
+        model._init_from_batches(
+            batches, graph, mode=mode, n_components=n_components, dtype=dtype,
+            sparse=sparse, bias=bias, incremental=incremental,
+            n_workers=n_workers, verbose=verbose)
+        return model
+
+    def _init_from_batches(self, batches, graph, mode='concatenation',
+                           n_components=None, dtype=np.float64, sparse=True,
+                           bias=0, incremental=False, n_workers=1,
+                           verbose=False):
+        # check mode argument
+        _check_mode(mode)
 
         # Assign arguments
         self.graph = graph
@@ -820,35 +427,63 @@ class GMRFVectorModel(object):
         self.bias = bias
         self.is_incremental = incremental
 
-        # Compute mean vector
-        self.mean_vector = np.mean(data, axis=0)
-
-        # Select correct method to create the precision matrix based on the
-        # graph type and the sparse flag
-        if self.graph.n_edges == 0:
-            if self.sparse:
-                constructor = _create_sparse_diagonal_precision
+        # Accumulate the mean vector and the statistics of every edge
+        v1, v2 = self._edge_vertices()
+        self.n_samples = 0
+        for data in batches:
+            if self.n_samples == 0:
+                # n_features and n_features_per_vertex
+                self.n_features = data.shape[1]
+                self.n_features_per_vertex = int(self.n_features /
+                                                 graph.n_vertices)
+                self.mean_vector = np.mean(data, axis=0)
+                edge_means, scatters = _edge_statistics(
+                    data, v1, v2, self.n_features_per_vertex, mode=mode,
+                    n_workers=n_workers, verbose=verbose)
             else:
-                constructor = _create_dense_diagonal_precision
-        else:
-            if self.sparse:
-                constructor = partial(_create_sparse_precision, mode=self.mode)
-            else:
-                constructor = partial(_create_dense_precision, mode=self.mode)
+                self.mean_vector, edge_means, scatters = self._combine_batch(
+                    data, edge_means, scatters, n_workers=n_workers,
+                    verbose=verbose)
+            self.n_samples += data.shape[0]
+            if verbose:
+                print_dynamic('- Samples {}'.format(self.n_samples))
+        if self.n_samples == 0:
+            raise ValueError('Cannot build a model from an empty stream')
 
         # Create the precision matrix and optionally store the covariance
         # matrices
-        if self.is_incremental:
-            self.precision, self._covariance_matrices = constructor(
-                data, self.graph, self.n_features, self.n_features_per_vertex,
-                dtype=self.dtype, n_components=self.n_components, bias=self.bias,
-                return_covariances=self.is_incremental, verbose=verbose)
+        covariances = scatters / _covariance_normalization(self.n_samples,
+                                                           bias)
+        self._covariance_matrices = (covariances.astype(dtype)
+                                     if incremental else None)
+        self.precision = _create_precision(
+            covariances, v1, v2, graph.n_vertices, self.n_features_per_vertex,
+            mode=mode, sparse=sparse, dtype=dtype, n_components=n_components,
+            n_workers=n_workers, verbose=verbose)
+
+    def _edge_vertices(self):
+        # The vertices of the edges of the graph. If the graph has no edges,
+        # then the statistics are computed per vertex.
+        if self.graph.n_edges == 0:
+            return np.arange(self.graph.n_vertices), None
         else:
-            self._covariance_matrices = None
-            self.precision = constructor(
-                data, self.graph, self.n_features, self.n_features_per_vertex,
-                dtype=self.dtype, n_components=self.n_components, bias=self.bias,
-                return_covariances=self.is_incremental, verbose=verbose)
+            return self.graph.edges[:, 0], self.graph.edges[:, 1]
+
+    def _combine_batch(self, data, edge_means, scatters, n_workers=1,
+                       verbose=False):
+        # Combines the statistics of the samples seen so far with the ones of
+        # a new batch of data
+        v1, v2 = self._edge_vertices()
+        new_edge_means, new_scatters = _edge_statistics(
+            data, v1, v2, self.n_features_per_vertex, mode=self.mode,
+            n_workers=n_workers, verbose=verbose)
+        n_new = data.shape[0]
+        edge_means, scatters = _combine_statistics(
+            self.n_samples, edge_means, scatters, n_new, new_edge_means,
+            new_scatters)
+        mean_vector = (self.mean_vector + (np.mean(data, axis=0) -
+                       self.mean_vector) * (n_new / (self.n_samples + n_new)))
+        return mean_vector, edge_means, scatters
 
     def _data_to_matrix(self, data, n_samples):
         # build a data matrix from all the samples
@@ -870,7 +505,7 @@ class GMRFVectorModel(object):
         """
         return self.mean_vector
 
-    def increment(self, samples, n_samples=None, verbose=False):
+    def increment(self, samples, n_samples=None, n_workers=1, verbose=False):
         r"""
         Update the mean and precision matrix of the GMRF by updating the
         distributions of all the edges.
@@ -884,6 +519,9 @@ class GMRFVectorModel(object):
             If provided then ``samples``  must be an iterator that yields
             ``n_samples``. If not provided then samples has to be a
             list (so we know how large the data matrix needs to be).
+        n_workers : `int`, optional
+            The number of threads that are used to compute the statistics and
+            the precision blocks of the edges.
         verbose : `bool`, optional
             If ``True``, the progress of the model's incremental update is
             printed.
@@ -896,42 +534,37 @@ class GMRFVectorModel(object):
         data, _ = self._data_to_matrix(samples, n_samples)
 
         # Increment the model
-        self._increment(data=data, verbose=verbose)
+        self._increment(data=data, n_workers=n_workers, verbose=verbose)
 
-    def _increment(self, data, verbose):
+    def _increment(self, data, n_workers=1, verbose=False):
         # Empty memory
         self.precision = 0
 
-        # Select correct method to create the precision matrix based on the
-        # graph type and the sparse flag
-        if self.graph.n_edges == 0:
-            if self.sparse:
-                constructor = _increment_sparse_diagonal_precision
-            else:
-                constructor = _increment_dense_diagonal_precision
-        else:
-            if self.sparse:
-                constructor = partial(_increment_sparse_precision,
-                                      mode=self.mode)
-            else:
-                constructor = partial(_increment_dense_precision,
-                                      mode=self.mode)
-
-        # Create the precision matrix and optionally store the covariance
-        # matrices
-        self.precision, self._covariance_matrices = constructor(
-            data, self.mean_vector, self._covariance_matrices, self.n_samples,
-            self.graph, self.n_features, self.n_features_per_vertex,
-            dtype=self.dtype, n_components=self.n_components, bias=self.bias,
-            verbose=verbose)
-
-        # Update mean and number of samples
-        self.mean_vector = _increment_multivariate_gaussian_mean(
-            data, self.mean_vector, self.n_samples)
+        # Recover the statistics of the samples seen so far. The edge means
+        # are the corresponding elements of the mean vector.
+        v1, v2 = self._edge_vertices()
+        edge_means = _edge_data(self.mean_vector[None], v1, v2,
+                                self.n_features_per_vertex, mode=self.mode)[0]
+        scatters = (self._covariance_matrices *
+                    _covariance_normalization(self.n_samples, self.bias))
+
+        # Update them with the new data
+        self.mean_vector, _, scatters = self._combine_batch(
+            data, edge_means, scatters, n_workers=n_workers, verbose=verbose)
         self.n_samples += data.shape[0]
 
+        # Create the precision matrix and store the covariance matrices
+        covariances = scatters / _covariance_normalization(self.n_samples,
+                                                           self.bias)
+        self._covariance_matrices = covariances.astype(self.dtype)
+        self.precision = _create_precision(
+            covariances, v1, v2, self.graph.n_vertices,
+            self.n_features_per_vertex, mode=self.mode, sparse=self.sparse,
+            dtype=self.dtype, n_components=self.n_components,
+            n_workers=n_workers, verbose=verbose)
+
     def mahalanobis_distance(self, samples, subtract_mean=True,
-                             square_root=False):
+                             square_root=False, batch_size=None, n_workers=1):
         r"""
         Compute the mahalanobis distance given a sample :math:`\mathbf{x}` or an
         array of samples :math:`\mathbf{X}`, i.e.
@@ -949,32 +582,42 @@ class GMRFVectorModel(object):
             When ``True``, the mean vector is subtracted from the data vector.
         square_root : `bool`, optional
             If ``False``, the mahalanobis distance gets squared.
+        batch_size : `int` or ``None``, optional
+            The samples are processed in batches of this size, so that the
+            memory required is linear to the number of samples. If ``None``,
+            it is chosen automatically based on the number of features.
+        n_workers : `int`, optional
+            The number of threads that process the batches of samples.
         """
         samples, _ = self._data_to_matrix(samples, None)
         if len(samples.shape) == 1:
             samples = samples[..., None].T
         return self._mahalanobis_distance(samples=samples,
                                           subtract_mean=subtract_mean,
-                                          square_root=square_root)
+                                          square_root=square_root,
+                                          batch_size=batch_size,
+                                          n_workers=n_workers)
 
-    def _mahalanobis_distance(self, samples, subtract_mean, square_root):
+    def _mahalanobis_distance(self, samples, subtract_mean, square_root,
+                              batch_size=None, n_workers=1):
         # we assume that samples is an ndarray of n_samples x n_features
-
-        # create data matrix
-        if subtract_mean:
-            n_samples = samples.shape[0]
-            samples = samples - np.tile(self.mean_vector[..., None],
-                                        n_samples).T
-
-        # compute mahalanobis per sample
-        if self.sparse:
-            # if sparse, unfortunately the einstein sum is not implemented
-            tmp = self.precision.dot(samples.T)
-            d = samples.dot(tmp)
-            d = np.diag(d)
-        else:
-            # if dense, then the einstein sum is much faster
-            d = np.einsum('ij,ij->i', np.dot(samples, self.precision), samples)
+        n_samples = samples.shape[0]
+        if batch_size is None:
+            batch_size = _MAX_MAHALANOBIS_CHUNK_SIZE // self.n_features
+        d = np.empty(n_samples,
+                     dtype=np.result_type(samples.dtype, self.dtype))
+
+        def compute_chunk(chunk):
+            x = samples[chunk]
+            if subtract_mean:
+                x = x - self.mean_vector
+            # compute the quadratic form of each sample (row), without
+            # forming the (n_samples, n_samples) matrix of all the products
+            d[chunk] = np.einsum('ij,ij->i', self._precision_dot(x), x)
+
+        for _ in _imap_chunks(compute_chunk, _chunks(n_samples, batch_size),
+                              n_workers=n_workers):
+            pass
 
         # if only one sample, then return a scalar
         if d.shape[0] == 1:
@@ -986,6 +629,14 @@ class GMRFVectorModel(object):
         else:
             return d
 
+    def _precision_dot(self, x):
+        # x Q for an (n_samples, n_features) x. Q is symmetric, so it is
+        # computed as (Q x^T)^T, which is supported by the sparse precision.
+        if self.sparse:
+            return self.precision.dot(x.T).T
+        else:
+            return np.dot(x, self.precision)
+
     def principal_components_analysis(self, max_n_components=None):
         r"""
         Returns a :map:`PCAVectorModel` with the Principal Components.
@@ -1097,6 +748,9 @@ class GMRFModel(GMRFVectorModel):
         This argument must be set to ``True`` in case the user wants to
         incrementally update the GMRF. Note that if ``True``, the model
         occupies 2x memory.
+    n_workers : `int`, optional
+        The number of threads that are used to compute the precision blocks
+        of the edges. Useful for graphs with many edges.
     verbose : `bool`, optional
         If ``True``, the progress of the model's training is printed.
 
@@ -1138,7 +792,7 @@ class GMRFModel(GMRFVectorModel):
     """
     def __init__(self, samples, graph, mode='concatenation', n_components=None,
                  dtype=np.float64, sparse=True, n_samples=None, bias=0,
-                 incremental=False, verbose=False):
+                 incremental=False, n_workers=1, verbose=False):
         # Build a data matrix from all the samples
         data, self.template_instance = as_matrix(
             samples, length=n_samples, return_template=True, verbose=verbose)
@@ -1147,7 +801,87 @@ class GMRFModel(GMRFVectorModel):
         GMRFVectorModel.__init__(self, data, graph, mode=mode,
                                  n_components=n_components, dtype=dtype,
                                  sparse=sparse, n_samples=n_samples, bias=bias,
-                                 incremental=incremental, verbose=verbose)
+                                 incremental=incremental,
+                                 n_workers=n_workers, verbose=verbose)
+
+    @classmethod
+    def init_from_stream(cls, samples, graph, batch_size, n_samples=None,
+                         mode='concatenation', n_components=None,
+                         dtype=np.float64, sparse=True, bias=0,
+                         incremental=False, n_workers=1, prefetch=False,
+                         verbose=False):
+        r"""
+        Trains a Gaussian Markov Random Field (GMRF) from a stream of
+        :map:`Vectorizable` samples that are consumed in mini-batches.
+
+        The mean and scatter matrix of each edge are accumulated batch by
+        batch with the numerically stable pairwise update of Chan et al., so
+        the data matrix of all the samples is never created and only a single
+        batch is held in memory at any time, e.g. when training from a
+        :map:`LazyList` of images.
+
+        Parameters
+        ----------
+        samples : `list` or `iterable` of :map:`Vectorizable`
+            List, :map:`LazyList` or generator of samples to build the model
+            from.
+        graph : :map:`UndirectedGraph` or :map:`DirectedGraph` or :map:`Tree`
+            The graph that defines the relations between the features.
+        batch_size : `int`
+            The number of samples of each batch.
+        n_samples : `int`, optional
+            If provided, at most ``n_samples`` samples are consumed from
+            ``samples``.
+        mode : ``{'concatenation', 'subtraction'}``, optional
+            Defines the feature vector of each edge. See :map:`GMRFModel`.
+        n_components : `int` or ``None``, optional
+            When ``None`` (default), the covariance matrix of each edge is
+            inverted using `np.linalg.inv`. If `int`, it is inverted using
+            truncated SVD using the specified number of compnents.
+        dtype : `numpy.dtype`, optional
+            The data type of the GMRF's precision matrix.
+        sparse : `bool`, optional
+            When ``True``, the GMRF's precision matrix has type
+            `scipy.sparse.bsr_matrix`, otherwise it is a `numpy.array`.
+        bias : `int`, optional
+            Default normalization is by ``(N - 1)``, where ``N`` is the number
+            of observations given (unbiased estimate). If `bias` is 1, then
+            normalization is by ``N``.
+        incremental : `bool`, optional
+            This argument must be set to ``True`` in case the user wants to
+            incrementally update the GMRF.
+        n_workers : `int`, optional
+            The number of threads that are used to compute the statistics and
+            the precision blocks of the edges.
+        prefetch : `bool`, optional
+            If ``True``, the next batch is loaded and vectorized in a
+            background thread while the statistics of the current one are
+            computed.
+        verbose : `bool`, optional
+            If ``True``, the progress of the model's training is printed.
+
+        Returns
+        -------
+        model : `cls`
+            The trained GMRF.
+        """
+        if n_samples is None and hasattr(samples, '__len__'):
+            n_samples = len(samples)
+        # the first sample is needed as the template of the model
+        samples = iter(samples)
+        try:
+            template = next(samples)
+        except StopIteration:
+            raise ValueError('Cannot build a model from an empty stream')
+        batches = as_matrix_batches(chain([template], samples), batch_size,
+                                    length=n_samples, prefetch=prefetch)
+        model = cls.__new__(cls)
+        model.template_instance = template
+        model._init_from_batches(
+            batches, graph, mode=mode, n_components=n_components, dtype=dtype,
+            sparse=sparse, bias=bias, incremental=incremental,
+            n_workers=n_workers, verbose=verbose)
+        return model
 
     def mean(self):
         r"""
@@ -1157,7 +891,7 @@ class GMRFModel(GMRFVectorModel):
         """
         return self.template_instance.from_vector(self.mean_vector)
 
-    def increment(self, samples, n_samples=None, verbose=False):
+    def increment(self, samples, n_samples=None, n_workers=1, verbose=False):
         r"""
         Update the mean and precision matrix of the GMRF by updating the
         distributions of all the edges.
@@ -1170,6 +904,9 @@ class GMRFModel(GMRFVectorModel):
             If provided then ``samples``  must be an iterator that yields
             ``n_samples``. If not provided then samples has to be a
             list (so we know how large the data matrix needs to be).
+        n_workers : `int`, optional
+            The number of threads that are used to compute the statistics and
+            the precision blocks of the edges.
         verbose : `bool`, optional
             If ``True``, the progress of the model's incremental update is
             printed.
@@ -1182,10 +919,10 @@ class GMRFModel(GMRFVectorModel):
         data = as_matrix(samples, length=n_samples, verbose=verbose)
 
         # Increment the model
-        self._increment(data=data, verbose=verbose)
+        self._increment(data=data, n_workers=n_workers, verbose=verbose)
 
     def mahalanobis_distance(self, samples, subtract_mean=True,
-                             square_root=False):
+                             square_root=False, batch_size=None, n_workers=1):
         r"""
         Compute the mahalanobis distance given a sample :math:`\mathbf{x}` or an
         array of samples :math:`\mathbf{X}`, i.e.
@@ -1203,6 +940,12 @@ class GMRFModel(GMRFVectorModel):
             When ``True``, the mean vector is subtracted from the data vector.
         square_root : `bool`, optional
             If ``False``, the mahalanobis distance gets squared.
+        batch_size : `int` or ``None``, optional
+            The samples are processed in batches of this size, so that the
+            memory required is linear to the number of samples. If ``None``,
+            it is chosen automatically based on the number of features.
+        n_workers : `int`, optional
+            The number of threads that process the batches of samples.
         """
         if isinstance(samples, list):
             samples = as_matrix(samples, length=None,
@@ -1211,7 +954,9 @@ class GMRFModel(GMRFVectorModel):
             samples = samples.as_vector()[..., None].T
         return self._mahalanobis_distance(samples=samples,
                                           subtract_mean=subtract_mean,
-                                          square_root=square_root)
+                                          square_root=square_root,
+                                          batch_size=batch_size,
+                                          n_workers=n_workers)
 
     def principal_components_analysis(self, max_n_components=None):
         r"""
@@ -261,9 +261,14 @@ class LinearVectorModel(Copyable):
         Both models keep its number of components unchanged or else a value
         error is raised.
 
+        If `linear_model` is an :map:`OrthonormalBasis`, its basis is kept
+        fixed and only the components of this model are orthonormalized
+        against it, which is much faster when orthonormalizing many models
+        against the same fixed one.
+
         Parameters
         ----------
-        linear_model : :class:`LinearVectorModel`
+        linear_model : :class:`LinearVectorModel` or :map:`OrthonormalBasis`
             A second linear model to orthonormalize this against.
 
         Raises
@@ -278,6 +283,9 @@ class LinearVectorModel(Copyable):
                 "The number of features must be greater or equal than the "
                 "sum of the number of components in both linear models ({} < "
                 "{})".format(self.n_features, n_components_sum))
+        if isinstance(linear_model, OrthonormalBasis):
+            self.components = linear_model.orthonormalize(self._components)
+            return
         # take the QR decomposition of the model components
         Q = (np.linalg.qr(np.hstack((linear_model._components.T,
                                      self._components.T)))[0]).T
@@ -385,6 +393,101 @@ class MeanLinearVectorModel(LinearVectorModel):
         return x + self._mean
 
 
+class OrthonormalBasis(object):
+    r"""
+    The orthonormalized components of a fixed linear model, used to
+    orthonormalize the components of other linear models against it.
+
+    The components of the fixed model are orthonormalized (in place) once, on
+    construction, exactly as :meth:`LinearVectorModel.orthonormalize_against_inplace`
+    would do. Other models are then orthonormalized against the cached basis
+    by block Gram-Schmidt, so that only their own components are factorized
+    rather than the stack of both models' components. The resulting
+    components span the same space as those of the full QR decomposition,
+    but the sign of each one of them may differ.
+
+    Parameters
+    ----------
+    linear_model : :map:`LinearVectorModel`
+        The fixed linear model. Its components are orthonormalized in place.
+    """
+
+    def __init__(self, linear_model):
+        Q = np.linalg.qr(linear_model._components.T)[0].T
+        linear_model.components = Q
+        self._basis = Q
+
+    @property
+    def n_components(self):
+        r"""
+        The number of vectors of the basis.
+
+        :type: `int`
+        """
+        return self._basis.shape[0]
+
+    @property
+    def n_features(self):
+        r"""
+        The number of elements in each vector of the basis.
+
+        :type: `int`
+        """
+        return self._basis.shape[1]
+
+    @property
+    def basis(self):
+        r"""
+        The orthonormal basis.
+
+        :type: ``(n_components, n_features)`` `ndarray`
+        """
+        return self._basis
+
+    def project_out_vectors(self, vectors):
+        r"""
+        Returns a version of `vectors` where the basis has been projected out.
+
+        Parameters
+        ----------
+        vectors : ``(n_vectors, n_features)`` `ndarray`
+            A matrix of novel vectors.
+
+        Returns
+        -------
+        projected_out : ``(n_vectors, n_features)`` `ndarray`
+            A copy of `vectors` with the basis projected out.
+        """
+        return vectors - np.dot(np.dot(vectors, self._basis.T), self._basis)
+
+    def orthonormalize(self, components):
+        r"""
+        Orthonormalizes the given components against the basis.
+
+        The basis is projected out of the components twice (the second pass
+        restores the orthogonality lost to rounding errors) and the residual
+        is orthonormalized by a QR decomposition.
+
+        Parameters
+        ----------
+        components : ``(n_components, n_features)`` `ndarray`
+            The components to orthonormalize.
+
+        Returns
+        -------
+        orthonormal_components : ``(n_available_components, n_features)`` `ndarray`
+            The orthonormalized components, orthogonal to the basis. At most
+            ``n_features - self.n_components`` components survive.
+        """
+        # columns are the residuals of the components
+        R = np.array(components.T, dtype=np.result_type(components,
+                                                        self._basis))
+        for _ in range(2):
+            R -= np.dot(self._basis.T, np.dot(self._basis, R))
+        n_available = min(R.shape[1], self.n_features - self.n_components)
+        return np.linalg.qr(R)[0][:, :n_available].T
+
+
 # TODO: Deprecate in 0.7.0
 # These have been maintained for backwards compatibility
 LinearModel = LinearVectorModel
@@ -1,12 +1,26 @@
 from __future__ import division
+from itertools import chain, islice
+from pathlib import Path
 import numpy as np
 
 from menpo.base import doc_inherit, name_of_callable
-from menpo.math import pca, pcacov, ipca, as_matrix
-from .linear import MeanLinearVectorModel
+from menpo.io.exceptions import OverwriteError
+from menpo.io.input.pickle import pickle_importer
+from menpo.io.output.pickle import pickle_exporter
+from menpo.math import pca, pcacov, ipca, as_matrix, as_matrix_batches
+from menpo.math.linalg import _iterate_batches, _prefetch
+from menpo.visualize import print_dynamic
+from .linear import MeanLinearVectorModel, OrthonormalBasis
 from .vectorizable import VectorizableBackedModel
 
 
+# the arrays of a PCA model that are memory-mapped by init_from_mmap
+_MMAP_ARRAYS = ('_components', '_eigenvalues', '_mean')
+_MMAP_PICKLE = 'model.pkl'
+# the number of elements of the components that are dequantized at once
+_DEQUANTIZE_CHUNK_SIZE = 2 ** 18
+
+
 class PCAVectorModel(MeanLinearVectorModel):
     r"""
     A :map:`MeanLinearModel` where components are Principal Components.
@@ -34,14 +48,20 @@ class PCAVectorModel(MeanLinearVectorModel):
     inplace : `bool`, optional
         If ``True`` the data matrix is modified in place. Otherwise, the data
         matrix is copied.
+    dtype : `numpy.dtype` or ``None``, optional
+        The data type of the components, eigenvalues and mean of the model.
+        If ``None``, the dtype of the data matrix is used. For example, it can
+        be set to `numpy.float32` in order to build a single precision model,
+        which requires half the memory.
     """
     def __init__(self, samples, centre=True, n_samples=None,
-                 max_n_components=None, inplace=True):
+                 max_n_components=None, inplace=True, dtype=None):
         # Generate data matrix
         data, self.n_samples = self._data_to_matrix(samples, n_samples)
 
         # Compute pca
-        e_vectors, e_values, mean = pca(data, centre=centre, inplace=inplace)
+        e_vectors, e_values, mean = pca(data, centre=centre, inplace=inplace,
+                                        dtype=dtype)
 
         # The call to __init__ of MeanLinearModel is done in here
         self._constructor_helper(
@@ -125,6 +145,73 @@ class PCAVectorModel(MeanLinearVectorModel):
             centred=centred, max_n_components=max_n_components)
         return model
 
+    @classmethod
+    def init_from_stream(cls, samples, batch_size, n_components=None,
+                         centre=True, forgetting_factor=1.0, n_samples=None,
+                         prefetch=False, dtype=None, verbose=False):
+        r"""
+        Build the Principal Component Analysis (PCA) from a stream of samples
+        by performing incremental PCA on consecutive mini-batches. Only a
+        single batch of samples (plus, optionally, the next one) is held in
+        memory at any time, so the model can be trained on datasets that do
+        not fit in memory. For details of the implementation of the
+        incremental update, see :map:`ipca`.
+
+        Parameters
+        ----------
+        samples : `ndarray` or `list` or `iterable` of `ndarray`
+            List, generator or data matrix of ``(n_features,)`` samples.
+        batch_size : `int` >= ``2``
+            The number of samples that are used on each incremental step.
+        n_components : `int` or ``None``, optional
+            If provided, the model is truncated to this number of components
+            after every incremental step, which bounds the memory and
+            computational cost of each update. If ``None``, all the
+            components are kept.
+        centre : `bool`, optional
+            When ``True`` (default) PCA is performed after mean centering the
+            data. If ``False`` the data is assumed to be centred, and the mean
+            will be ``0``.
+        forgetting_factor : ``[0.0, 1.0]`` `float`, optional
+            Forgetting factor that weights the relative contribution of new
+            batches vs old samples. See :meth:`increment` for details.
+        n_samples : `int`, optional
+            If provided, at most ``n_samples`` samples are consumed from
+            ``samples``.
+        prefetch : `bool`, optional
+            If ``True``, the next batch is loaded in a background thread while
+            the model is being updated with the current one. This is useful
+            when producing the samples is expensive, e.g. when reading them
+            from disk.
+        dtype : `numpy.dtype` or ``None``, optional
+            The data type of the components, eigenvalues and mean of the model.
+            If ``None``, the dtype of the samples is used.
+        verbose : `bool`, optional
+            If ``True``, the number of samples seen so far and the variance
+            captured by the model are printed after each step.
+
+        Raises
+        ------
+        ValueError
+            If ``batch_size < 2`` or ``samples`` is empty.
+        """
+        if n_samples is None and hasattr(samples, '__len__'):
+            n_samples = len(samples)
+        batches = (np.asarray(batch, dtype=dtype)
+                   for batch in _iterate_batches(samples, batch_size,
+                                                 length=n_samples))
+        if prefetch:
+            batches = _prefetch(batches)
+
+        def init_model(data):
+            return cls(data, centre=centre, max_n_components=n_components,
+                       dtype=dtype)
+
+        return _pca_from_batches(init_model, batches, batch_size,
+                                 n_components=n_components,
+                                 forgetting_factor=forgetting_factor,
+                                 n_samples=n_samples, verbose=verbose)
+
     def _constructor_helper(self, eigenvalues, eigenvectors, mean, centred,
                             max_n_components):
         # if covariance is not centred, mean must be zeros.
@@ -137,7 +224,9 @@ class PCAVectorModel(MeanLinearVectorModel):
         self._eigenvalues = eigenvalues
         # start the active components as all the components
         self._n_active_components = int(self.n_components)
-        self._trimmed_eigenvalues = np.array([])
+        self._trimmed_eigenvalues = np.array([], dtype=eigenvalues.dtype)
+        self._component_scales = None
+        self._cache = {}
         if max_n_components is not None:
             self.trim_components(max_n_components)
 
@@ -152,13 +241,134 @@ class PCAVectorModel(MeanLinearVectorModel):
             data = np.array(data)[:n_samples]
         return data, n_samples
 
+    def __getstate__(self):
+        # the cached matrices are derived data, so they are never pickled
+        state = self.__dict__.copy()
+        state.pop('_cache', None)
+        return state
+
     def __setstate__(self, state):
         if 'mean_vector' in state:
             state['_mean'] = state['mean_vector']
             del state['mean_vector']
+        state.setdefault('_component_scales', None)
+        state['_cache'] = {}
 
         self.__dict__ = state
 
+    def _cached(self, name, build):
+        # matrices derived from the active components are built on first use
+        # and kept until _invalidate_cache is called by anything that changes
+        # the components, eigenvalues or number of active components
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = build()
+            self._cache[name] = value
+            return value
+
+    def _invalidate_cache(self):
+        self._cache = {}
+
+    def copy(self):
+        r"""
+        Generate an efficient copy of this model.
+
+        The cached matrices are views of the components of this model, so
+        they are not shared with the copy.
+
+        Returns
+        -------
+        ``type(self)``
+            A copy of this model.
+        """
+        new = MeanLinearVectorModel.copy(self)
+        new._cache = {}
+        return new
+
+    def export_mmap(self, path, overwrite=False):
+        r"""
+        Exports the model to a directory in a format that allows it to be
+        loaded with memory-mapped arrays via :meth:`init_from_mmap`.
+
+        The components, eigenvalues and mean of the model are stored as raw,
+        C-contiguous ``.npy`` arrays and everything else is pickled. As a
+        result, a large model can be loaded without reading the components
+        into memory and all the processes that load it share the same
+        physical memory through the page cache.
+
+        Parameters
+        ----------
+        path : `Path` or `str`
+            The directory to export the model to. It is created if it does not
+            exist.
+        overwrite : `bool`, optional
+            Whether or not to overwrite an existing export at the given path.
+
+        Raises
+        ------
+        OverwriteError
+            The directory already contains an exported model and
+            ``overwrite`` != ``True``
+        """
+        path = Path(path)
+        if (path / _MMAP_PICKLE).exists() and not overwrite:
+            raise OverwriteError('File {} already exists. Please set the '
+                                 'overwrite kwarg if you wish to '
+                                 'overwrite the file.'.format(path), path)
+        if not path.exists():
+            path.mkdir(parents=True)
+        # pickle a shallow copy of the model without the large arrays
+        model = self.__class__.__new__(self.__class__)
+        model.__dict__ = dict((k, v) for k, v in self.__dict__.items()
+                              if k not in _MMAP_ARRAYS)
+        with (path / _MMAP_PICKLE).open('wb') as f:
+            pickle_exporter(model, f)
+        for name in _MMAP_ARRAYS:
+            np.save(str(path / (name + '.npy')),
+                    np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def init_from_mmap(cls, path, mmap_mode='r'):
+        r"""
+        Loads a model exported with :meth:`export_mmap`.
+
+        The components, eigenvalues and mean of the model are memory-mapped,
+        so only the pages that are actually accessed are read from disk. For
+        instance, projecting onto the first ``n_active_components`` only
+        touches the rows of the components that are active.
+
+        Parameters
+        ----------
+        path : `Path` or `str`
+            The directory the model was exported to.
+        mmap_mode : {``'r'``, ``'c'``, ``None``}, optional
+            The memory-map mode of the arrays, see `numpy.load`. By default
+            the arrays are read-only, so any method that modifies the model in
+            place (e.g. :meth:`orthonormalize_against_inplace`) raises an
+            error. ``'c'`` (copy-on-write) allows modifications that are never
+            written back to disk and ``None`` loads the arrays in memory.
+
+        Returns
+        -------
+        model : `cls`
+            The loaded model.
+
+        Raises
+        ------
+        ValueError
+            The exported model is not an instance of `cls`
+        """
+        path = Path(path)
+        model = pickle_importer(path / _MMAP_PICKLE)
+        if not isinstance(model, cls):
+            raise ValueError('The exported model is a {}, not a {}'.format(
+                type(model).__name__, cls.__name__))
+        for name in _MMAP_ARRAYS:
+            model.__dict__[name] = np.load(str(path / (name + '.npy')),
+                                           mmap_mode=mmap_mode)
+        return model
+
     @property
     def n_active_components(self):
         r"""
@@ -221,7 +431,9 @@ class PCAVectorModel(MeanLinearVectorModel):
                     # total number of components, do nothing
                     return
         if 0 < value <= self.n_components:
-            self._n_active_components = int(value)
+            if int(value) != self._n_active_components:
+                self._n_active_components = int(value)
+                self._invalidate_cache()
         else:
             raise ValueError(err_str)
 
@@ -230,9 +442,57 @@ class PCAVectorModel(MeanLinearVectorModel):
         r"""
         Returns the active components of the model.
 
+        If the model is quantized, the components are dequantized to
+        single precision.
+
         :type: ``(n_active_components, n_features)`` `ndarray`
         """
-        return self._components[:self.n_active_components, :]
+        if self.is_quantized:
+            return self._dequantize(self.n_active_components)
+        return self._cached(
+            'components',
+            lambda: self._components[:self.n_active_components, :])
+
+    @components.setter
+    def components(self, value):
+        r"""
+        Updates all the available components of this model, ensuring that the
+        shape of the components is not changed.
+
+        Parameters
+        ----------
+        value : ``(n_components, n_features)`` `ndarray`
+            The new components array.
+
+        Raises
+        ------
+        ValueError
+            Trying to replace components of shape {} with some of shape {}
+        """
+        MeanLinearVectorModel.components.fset(self, value)
+        self._invalidate_cache()
+
+    @property
+    def _components_t(self):
+        # the active components transposed for right-multiplication. BLAS
+        # handles the transposed view directly, so a contiguous copy would
+        # only double the memory of the components.
+        return self._cached('components_t', lambda: self.components.T)
+
+    @property
+    def is_quantized(self):
+        r"""
+        ``True`` if the components of the model are stored in a compressed
+        form, see :meth:`quantize`.
+
+        :type: `bool`
+        """
+        return self._component_scales is not None
+
+    @property
+    def _compute_dtype(self):
+        # quantized components are always accumulated in single precision
+        return np.float32 if self.is_quantized else self._components.dtype
 
     @property
     def eigenvalues(self):
@@ -243,7 +503,8 @@ class PCAVectorModel(MeanLinearVectorModel):
 
         :type: ``(n_active_components,)`` `ndarray`
         """
-        return self._eigenvalues[:self.n_active_components]
+        return self._cached(
+            'eigenvalues', lambda: self._eigenvalues[:self.n_active_components])
 
     def whitened_components(self):
         r"""
@@ -252,11 +513,19 @@ class PCAVectorModel(MeanLinearVectorModel):
         Returns
         -------
         whitened_components : ``(n_active_components, n_features)`` `ndarray`
-            The whitened components.
+            The whitened components. They are computed once and cached until
+            the components or the number of active components change, so the
+            returned array is read-only.
         """
-        return self.components / (
+        return self._cached('whitened_components',
+                            self._build_whitened_components)
+
+    def _build_whitened_components(self):
+        whitened_components = self.components / (
             np.sqrt(self.eigenvalues * self.n_samples +
                     self.noise_variance())[:, None])
+        whitened_components.flags.writeable = False
+        return whitened_components
 
     def original_variance(self):
         r"""
@@ -499,7 +768,7 @@ class PCAVectorModel(MeanLinearVectorModel):
                     self.n_active_components))
         else:
             full_weights = np.zeros((n_instances, self.n_active_components),
-                                    dtype=self._components.dtype)
+                                    dtype=self._compute_dtype)
             full_weights[..., :n_weights] = weights
             weights = full_weights
 
@@ -573,12 +842,137 @@ class PCAVectorModel(MeanLinearVectorModel):
             # set self.n_components to n_components. We have to copy to ensure
             # that the data is actually removed, otherwise a view is returned
             self._components = self._components[:nac].copy()
+            if self.is_quantized:
+                self._component_scales = self._component_scales[:nac].copy()
             # store the eigenvalues associated to the discarded components
             self._trimmed_eigenvalues = np.hstack((
                 self._trimmed_eigenvalues,
                 self._eigenvalues[self.n_active_components:]))
             # make sure that the eigenvalues are trimmed too
             self._eigenvalues = self._eigenvalues[:nac].copy()
+            self._invalidate_cache()
+
+    def quantize(self, dtype=np.float16):
+        r"""
+        Permanently compresses the components of the model to reduce its
+        memory footprint and bandwidth, e.g. for serving.
+
+        The components are stored either in half precision or as 8-bit
+        integers with one single precision scale per component, which reduces
+        the memory of the components by 4 (8) times for a double precision
+        model. Projections and instances are then computed with single
+        precision accumulation, dequantizing the components in small chunks.
+
+        Once the model is quantized, the original components cannot be
+        recovered and the model can no longer be updated by
+        :meth:`increment` or :meth:`orthonormalize_against_inplace`.
+
+        Parameters
+        ----------
+        dtype : {``np.float16``, ``np.int8``}, optional
+            The type the components are stored in.
+
+        Returns
+        -------
+        errors : ``(n_components,)`` `ndarray`
+            The relative reconstruction error that the quantization introduces
+            on each component, i.e.
+            ``||component - dequantized_component|| / ||component||``.
+
+        Raises
+        ------
+        ValueError
+            The model is already quantized
+        ValueError
+            dtype must be np.float16 or np.int8
+        """
+        if self.is_quantized:
+            raise ValueError('The model is already quantized')
+        dtype = np.dtype(dtype)
+        C = self._components
+        if dtype == np.float16:
+            quantized = C.astype(np.float16)
+            scales = np.ones(C.shape[0], dtype=np.float32)
+        elif dtype == np.int8:
+            scales = (np.abs(C).max(axis=1) / 127).astype(np.float32)
+            # avoid dividing by zero for components that are all zeros
+            scales[scales == 0] = 1
+            quantized = np.rint(C / scales[:, None]).astype(np.int8)
+        else:
+            raise ValueError('dtype must be np.float16 or np.int8, '
+                             'not {}'.format(dtype))
+        self._components = quantized
+        self._component_scales = scales
+        self._invalidate_cache()
+        norms = np.linalg.norm(C, axis=1)
+        norms[norms == 0] = 1
+        return (np.linalg.norm(C - self._dequantize(self.n_components),
+                               axis=1) / norms)
+
+    def _dequantize(self, n_components):
+        # single precision copy of the first n_components components
+        C = self._components[:n_components].astype(np.float32)
+        C *= self._component_scales[:n_components, None]
+        return C
+
+    def _feature_chunks(self):
+        step = max(_DEQUANTIZE_CHUNK_SIZE // self.n_active_components, 1)
+        n_features = self._components.shape[1]
+        return [slice(i, i + step) for i in range(0, n_features, step)]
+
+    def _project_centred(self, X, mean=None):
+        # the weights of the vectors, which are centred by mean if given
+        if not self.is_quantized:
+            if mean is not None:
+                X = X - mean
+            return np.dot(X, self._components_t)
+        n = self.n_active_components
+        W = np.zeros((X.shape[0], n), dtype=np.float32)
+        for s in self._feature_chunks():
+            # centre chunk by chunk to avoid a full size temporary
+            X_s = X[:, s] if mean is None else X[:, s] - mean[s]
+            W += np.dot(X_s.astype(np.float32, copy=False),
+                        self._components[:n, s].astype(np.float32).T)
+        W *= self._component_scales[:n]
+        return W
+
+    def _centred_instance_vectors(self, weights, out=None):
+        # the instance vectors of full weights, without the mean
+        if not self.is_quantized:
+            return np.dot(weights, self.components, out=out)
+        n = self.n_active_components
+        if out is None:
+            out = np.empty((weights.shape[0], self._components.shape[1]),
+                           dtype=np.float32)
+        weights = (weights * self._component_scales[:n]).astype(np.float32)
+        for s in self._feature_chunks():
+            out[:, s] = np.dot(weights,
+                               self._components[:n, s].astype(np.float32))
+        return out
+
+    def project_vectors(self, vectors):
+        """
+        Projects each of the `vectors` onto the model, retrieving
+        the optimal linear reconstruction weights for each instance.
+
+        Parameters
+        ----------
+        vectors : ``(n_samples, n_features)`` `ndarray`
+            Array of vectorized novel instances.
+
+        Returns
+        -------
+        projected : ``(n_samples, n_components)`` `ndarray`
+            The matrix of optimal linear weights.
+        """
+        return self._project_centred(vectors, mean=self._mean)
+
+    def _instance_vectors_for_full_weights(self, full_weights):
+        return self._centred_instance_vectors(full_weights) + self._mean
+
+    def _check_not_quantized(self):
+        if self.is_quantized:
+            raise ValueError('A quantized model cannot be modified')
 
     def project_whitened(self, vector_instance):
         """
@@ -595,8 +989,9 @@ class PCAVectorModel(MeanLinearVectorModel):
         projected : ``(n_features,)`` `ndarray`
             A vector of whitened linear weightings
         """
-        whitened_components = self.whitened_components()
-        return np.dot(vector_instance, whitened_components.T)
+        whitened_components_t = self._cached(
+            'whitened_components_t', lambda: self.whitened_components().T)
+        return np.dot(vector_instance, whitened_components_t)
 
     def orthonormalize_against_inplace(self, linear_model):
         r"""
@@ -612,22 +1007,37 @@ class PCAVectorModel(MeanLinearVectorModel):
         If trimming is performed, `n_components` and `n_available_components`
         would be altered - see :meth:`trim_components` for details.
 
+        If `linear_model` is an :map:`OrthonormalBasis`, its basis is kept
+        fixed and only the components of this model are orthonormalized
+        against it, which is much faster when orthonormalizing many models
+        against the same fixed one.
+
         Parameters
         ----------
-        linear_model : :map:`LinearModel`
+        linear_model : :map:`LinearModel` or :map:`OrthonormalBasis`
             A second linear model to orthonormalize this against.
+
+        Raises
+        ------
+        ValueError
+            A quantized model cannot be modified
         """
-        # take the QR decomposition of the model components
-        Q = (np.linalg.qr(np.hstack((linear_model._components.T,
-                                     self._components.T)))[0]).T
-        # the model passed to us went first, so all it's components will
-        # survive. Pull them off, and update the other model.
-        linear_model.components = Q[:linear_model.n_components, :]
+        self._check_not_quantized()
+        if isinstance(linear_model, OrthonormalBasis):
+            Q = linear_model.orthonormalize(self._components)
+        else:
+            # take the QR decomposition of the model components
+            Q = (np.linalg.qr(np.hstack((linear_model._components.T,
+                                         self._components.T)))[0]).T
+            # the model passed to us went first, so all it's components will
+            # survive. Pull them off, and update the other model.
+            linear_model.components = Q[:linear_model.n_components, :]
+            Q = Q[linear_model.n_components:, :]
         # it's possible that all of our components didn't survive due to
         # degeneracy. We need to trim our components down before replacing
         # them to ensure the number of components is consistent (otherwise
         # the components setter will complain at us)
-        n_available_components = Q.shape[0] - linear_model.n_components
+        n_available_components = Q.shape[0]
         if n_available_components < self.n_components:
             # oh dear, we've lost some components from the end of our model.
             if self.n_active_components < n_available_components:
@@ -643,7 +1053,21 @@ class PCAVectorModel(MeanLinearVectorModel):
                 self.n_active_components = n_active_components
 
         # now we can set our own components with the updated orthogonal ones
-        self.components = Q[linear_model.n_components:, :]
+        self.components = Q
+
+    def orthonormalize_inplace(self):
+        r"""
+        Enforces that this model's components are orthonormalized,
+        s.t. ``component_vector(i).dot(component_vector(j) = dirac_delta``.
+
+        Raises
+        ------
+        ValueError
+            A quantized model cannot be modified
+        """
+        self._check_not_quantized()
+        MeanLinearVectorModel.orthonormalize_inplace(self)
+        self._invalidate_cache()
 
     def increment(self, data, n_samples=None, forgetting_factor=1.0,
                   verbose=False):
@@ -671,6 +1095,7 @@ class PCAVectorModel(MeanLinearVectorModel):
         .. [1] David Ross, Jongwoo Lim, Ruei-Sung Lin, Ming-Hsuan Yang.
            "Incremental Learning for Robust Visual Tracking". IJCV, 2007.
         """
+        self._check_not_quantized()
         data, n_new_samples = self._data_to_matrix(data, n_samples)
 
         # compute incremental pca
@@ -687,6 +1112,7 @@ class PCAVectorModel(MeanLinearVectorModel):
         self._components = e_vectors
         self._eigenvalues = e_values
         self.n_samples += n_new_samples
+        self._invalidate_cache()
 
         # reset the number of active components to the total number of
         # components
@@ -1190,18 +1616,27 @@ class PCAModel(VectorizableBackedModel, PCAVectorModel):
         matrix is copied.
     verbose : `bool`, optional
         Whether to print building information or not.
+    dtype : `numpy.dtype` or ``None``, optional
+        The data type of the data matrix and thus of the components,
+        eigenvalues and mean of the model. If ``None``, the dtype of the
+        vectorized samples is used. For example, it can be set to
+        `numpy.float32` in order to build a single precision model, which
+        requires half the memory.
      """
 
     def __init__(self, samples, centre=True, n_samples=None,
-                 max_n_components=None, inplace=True, verbose=False):
+                 max_n_components=None, inplace=True, verbose=False,
+                 dtype=None):
         # build a data matrix from all the samples
         data, template = as_matrix(samples, length=n_samples,
-                                   return_template=True, verbose=verbose)
+                                   return_template=True, verbose=verbose,
+                                   dtype=dtype)
         n_samples = data.shape[0]
 
         PCAVectorModel.__init__(self, data, centre=centre,
                                 max_n_components=max_n_components,
-                                n_samples=n_samples, inplace=inplace)
+                                n_samples=n_samples, inplace=inplace,
+                                dtype=dtype)
         VectorizableBackedModel.__init__(self, template)
 
     @classmethod
@@ -1286,6 +1721,84 @@ class PCAModel(VectorizableBackedModel, PCAVectorModel):
         VectorizableBackedModel.__init__(self_model, mean)
         return self_model
 
+    @classmethod
+    def init_from_stream(cls, samples, batch_size, n_components=None,
+                         centre=True, forgetting_factor=1.0, n_samples=None,
+                         prefetch=False, dtype=None, verbose=False):
+        r"""
+        Build the Principal Component Analysis (PCA) from a stream of
+        :map:`Vectorizable` samples by performing incremental PCA on
+        consecutive mini-batches. Only a single batch of samples (plus,
+        optionally, the next one) is held in memory at any time, so the model
+        can be trained on datasets that do not fit in memory, e.g. a
+        :map:`LazyList` of images. For details of the implementation of the
+        incremental update, see :map:`ipca`.
+
+        Parameters
+        ----------
+        samples : `list` or `iterable` of :map:`Vectorizable`
+            List, :map:`LazyList` or generator of samples to build the model
+            from.
+        batch_size : `int` >= ``2``
+            The number of samples that are used on each incremental step.
+        n_components : `int` or ``None``, optional
+            If provided, the model is truncated to this number of components
+            after every incremental step, which bounds the memory and
+            computational cost of each update. If ``None``, all the
+            components are kept.
+        centre : `bool`, optional
+            When ``True`` (default) PCA is performed after mean centering the
+            data. If ``False`` the data is assumed to be centred, and the mean
+            will be ``0``.
+        forgetting_factor : ``[0.0, 1.0]`` `float`, optional
+            Forgetting factor that weights the relative contribution of new
+            batches vs old samples. See :meth:`increment` for details.
+        n_samples : `int`, optional
+            If provided, at most ``n_samples`` samples are consumed from
+            ``samples``.
+        prefetch : `bool`, optional
+            If ``True``, the next batch is loaded and vectorized in a
+            background thread while the model is being updated with the
+            current one. This is useful when loading the samples is expensive,
+            e.g. when iterating a :map:`LazyList` that reads from disk.
+        dtype : `numpy.dtype` or ``None``, optional
+            The data type of the components, eigenvalues and mean of the model.
+            If ``None``, the dtype of the vectorized samples is used.
+        verbose : `bool`, optional
+            If ``True``, the number of samples seen so far and the variance
+            captured by the model are printed after each step.
+
+        Raises
+        ------
+        ValueError
+            If ``batch_size < 2`` or ``samples`` is empty.
+        """
+        if n_samples is None and hasattr(samples, '__len__'):
+            n_samples = len(samples)
+        # the first sample is needed as the template of the model
+        samples = iter(samples)
+        try:
+            template = next(samples)
+        except StopIteration:
+            raise ValueError('Cannot build a model from an empty stream')
+        batches = as_matrix_batches(chain([template], samples), batch_size,
+                                    length=n_samples, prefetch=prefetch,
+                                    dtype=dtype)
+
+        def init_model(data):
+            model = cls.__new__(cls)
+            PCAVectorModel.__init__(model, data, centre=centre,
+                                    n_samples=data.shape[0],
+                                    max_n_components=n_components,
+                                    dtype=dtype)
+            VectorizableBackedModel.__init__(model, template)
+            return model
+
+        return _pca_from_batches(init_model, batches, batch_size,
+                                 n_components=n_components,
+                                 forgetting_factor=forgetting_factor,
+                                 n_samples=n_samples, verbose=verbose)
+
     def mean(self):
         r"""
         Return the mean of the model.
@@ -1398,6 +1911,135 @@ class PCAModel(VectorizableBackedModel, PCAVectorModel):
         """
         return self.project_whitened_vector(instance.as_vector())
 
+    def project_many(self, instances, n_instances=None, batch_size=None,
+                     verbose=False):
+        r"""
+        Projects many instances onto the model, retrieving the optimal linear
+        weightings of each one of them.
+
+        Equivalent to stacking the result of :meth:`project` for every
+        instance, but the instances are vectorized into a single preallocated
+        data matrix and projected with one matrix multiplication, which is
+        much faster for large numbers of instances.
+
+        Parameters
+        ----------
+        instances : `list` or `iterable` of :map:`Vectorizable`
+            A list, :map:`LazyList` or generator of novel instances.
+        n_instances : `int`, optional
+            If provided then ``instances`` must be an iterator that yields
+            ``n_instances``. If not provided then ``instances`` has to be a
+            `list` (so we know how large the data matrix needs to be).
+        batch_size : `int` or ``None``, optional
+            If provided, the instances are vectorized and projected in batches
+            of this size, so that only the weights of all the instances (and
+            not their vectorized form) are held in memory at once.
+        verbose : `bool`, optional
+            If ``True``, the progress of the vectorization is printed.
+
+        Returns
+        -------
+        weights : ``(n_instances, n_active_components)`` `ndarray`
+            The optimal linear weightings of every instance.
+        """
+        dtype = self._compute_dtype
+        if batch_size is None:
+            if (n_instances if n_instances is not None
+                    else len(instances)) == 0:
+                batches = []
+            else:
+                batches = [as_matrix(instances, length=n_instances,
+                                     verbose=verbose, dtype=dtype)]
+        else:
+            batches = as_matrix_batches(instances, batch_size,
+                                        length=n_instances, dtype=dtype)
+        weights = []
+        for X in batches:
+            # the data matrix is ours, so centre it in place
+            X -= self._mean
+            weights.append(self._project_centred(X))
+            if verbose and batch_size is not None:
+                print_dynamic('- Projected {} instances'.format(
+                    sum(w.shape[0] for w in weights)))
+        if len(weights) == 0:
+            return np.zeros((0, self.n_active_components), dtype=dtype)
+        return weights[0] if len(weights) == 1 else np.vstack(weights)
+
+    def reconstruct_many(self, instances, n_instances=None, verbose=False):
+        r"""
+        Projects many instances onto the linear space and rebuilds them from
+        the weights found.
+
+        Equivalent to calling :meth:`reconstruct` on every instance, but the
+        instances are vectorized into a single preallocated data matrix and
+        reconstructed with two matrix multiplications. Every instance is kept
+        in memory until it is rebuilt.
+
+        Parameters
+        ----------
+        instances : `list` or `iterable` of :map:`Vectorizable`
+            A list, :map:`LazyList` or generator of novel instances.
+        n_instances : `int`, optional
+            If provided then ``instances`` must be an iterator that yields
+            ``n_instances``. If not provided then ``instances`` has to be a
+            `list` (so we know how large the data matrix needs to be).
+        verbose : `bool`, optional
+            If ``True``, the progress of the vectorization is printed.
+
+        Returns
+        -------
+        reconstructed : `list` of :map:`Vectorizable`
+            The reconstructed instances. Each one is rebuilt from the
+            corresponding instance.
+        """
+        instances = _list_of_instances(instances, n_instances)
+        if len(instances) == 0:
+            return []
+        X = as_matrix(instances, verbose=verbose, dtype=self._compute_dtype)
+        X -= self._mean
+        weights = self._project_centred(X)
+        # reuse the data matrix as the output buffer
+        self._centred_instance_vectors(weights, out=X)
+        X += self._mean
+        return [i.from_vector(x) for i, x in zip(instances, X)]
+
+    def project_out_many(self, instances, n_instances=None, verbose=False):
+        r"""
+        Returns a version of many instances where all the bases of the model
+        have been projected out.
+
+        Equivalent to calling :meth:`project_out` on every instance, but the
+        instances are vectorized into a single preallocated data matrix and
+        processed with two matrix multiplications. Every instance is kept in
+        memory until it is rebuilt.
+
+        Parameters
+        ----------
+        instances : `list` or `iterable` of :map:`Vectorizable`
+            A list, :map:`LazyList` or generator of novel instances.
+        n_instances : `int`, optional
+            If provided then ``instances`` must be an iterator that yields
+            ``n_instances``. If not provided then ``instances`` has to be a
+            `list` (so we know how large the data matrix needs to be).
+        verbose : `bool`, optional
+            If ``True``, the progress of the vectorization is printed.
+
+        Returns
+        -------
+        projected_out : `list` of :map:`Vectorizable`
+            The instances with all the bases of the model projected out. Each
+            one is rebuilt from the corresponding instance.
+        """
+        instances = _list_of_instances(instances, n_instances)
+        if len(instances) == 0:
+            return []
+        X = as_matrix(instances, verbose=verbose, dtype=self._compute_dtype)
+        # We don't add the mean back, in fact the residual is defined as
+        # the mean subtracted.
+        X -= self._mean
+        X -= self._centred_instance_vectors(self._project_centred(X))
+        return [i.from_vector(x) for i, x in zip(instances, X)]
+
     def increment(self, samples, n_samples=None, forgetting_factor=1.0,
                   verbose=False):
         r"""
@@ -1464,3 +2106,92 @@ class PCAModel(VectorizableBackedModel, PCAVectorModel):
             self.noise_variance_ratio(), self.n_components,
             self.components.shape)
         return str_out
+
+
+def _list_of_instances(instances, n_instances):
+    r"""
+    The list of the instances of a list or an iterator of ``n_instances``
+    instances, so that every instance can be rebuilt after they have all been
+    vectorized.
+    """
+    if n_instances is not None:
+        return list(islice(instances, n_instances))
+    return list(instances)
+
+
+def _pca_from_batches(init_model, batches, batch_size, n_components=None,
+                      forgetting_factor=1.0, n_samples=None, verbose=False):
+    r"""
+    Drives the mini-batch training of a PCA model. The model is built from
+    the first data matrix of ``batches`` using the ``init_model`` callable and
+    then incrementally updated with the rest, truncating it to
+    ``n_components`` after every step.
+
+    The variance of the discarded components cannot be recovered once they
+    are trimmed, thus the total variance of the samples is tracked alongside
+    the model and the variance that the model misses is spread evenly over
+    the components that a model built on all the samples would have trimmed.
+    """
+    if batch_size < 2:
+        # the first batch needs at least two samples to estimate a covariance
+        raise ValueError('batch_size must be >= 2 '
+                         '({} given)'.format(batch_size))
+    model = None
+    for data in batches:
+        if model is None:
+            model = init_model(data)
+            total_variance = float(model.original_variance())
+        else:
+            total_variance = _incremented_variance(
+                model, data, total_variance, forgetting_factor)
+            PCAVectorModel.increment(model, data, n_samples=data.shape[0],
+                                     forgetting_factor=forgetting_factor)
+            if n_components is not None:
+                model.trim_components(n_components)
+                _spread_trimmed_variance(model, total_variance)
+        if verbose:
+            total = ('/{}'.format(n_samples) if n_samples is not None
+                     else '')
+            print_dynamic('- Samples {}{}: {} components capture {:.1%} of '
+                          'the variance'.format(model.n_samples, total,
+                                                model.n_components,
+                                                model.variance_ratio()))
+    if model is None:
+        raise ValueError('Cannot build a model from an empty stream')
+    if verbose:
+        print_dynamic('- Done\n')
+    return model
+
+
+def _incremented_variance(model, data, total_variance, forgetting_factor):
+    # the total variance of the samples of the model and the data, following
+    # the arithmetic of the incremental update in ipca
+    n_a = model.n_samples * forgetting_factor
+    n_b = data.shape[0]
+    n = n_a + n_b
+    scatter = (forgetting_factor ** 2 * (model.n_samples - 1) *
+               total_variance)
+    mean = model._mean
+    if not np.all(mean == 0):
+        m_b = np.mean(data, axis=0, dtype=np.float64)
+        scatter += np.sum((data - m_b) ** 2, dtype=np.float64)
+        scatter += (n_a * n_b / n) * np.sum((m_b - mean) ** 2,
+                                            dtype=np.float64)
+    else:
+        scatter += np.sum(np.asarray(data, dtype=np.float64) ** 2)
+    return scatter / (n - 1)
+
+
+def _spread_trimmed_variance(model, total_variance):
+    # the variance of the samples that is not captured by the components of
+    # the model, spread over the components that would have been trimmed
+    rank = min(model.n_samples - 1 if model.centred else model.n_samples,
+               model.n_features)
+    n_trimmed = rank - model.n_components
+    residual = total_variance - model._eigenvalues.sum()
+    if n_trimmed > 0 and residual > 0:
+        model._trimmed_eigenvalues = np.full(
+            n_trimmed, residual / n_trimmed, dtype=model._eigenvalues.dtype)
+    else:
+        model._trimmed_eigenvalues = np.array(
+            [], dtype=model._eigenvalues.dtype)
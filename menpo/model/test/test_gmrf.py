@@ -5,6 +5,7 @@ from menpo.shape import PointCloud, DirectedGraph, UndirectedGraph
 from menpo.math import as_matrix
 
 from .. import GMRFModel, GMRFVectorModel
+from .. import gmrf as gmrf_module
 
 
 def _compute_sum_cost_block_sparse(samples, test_sample, graph,
@@ -157,3 +158,96 @@ def test_increment():
                                                       gmrf2.precision.todense())
                         assert_array_almost_equal(gmrf1.mean_vector,
                                                   gmrf2.mean_vector)
+
+
+def test_n_workers():
+    n_vertices = 20
+    edges = np.array([[i, i + 1] for i in range(n_vertices - 1)])
+    graph = UndirectedGraph.init_from_edges(edges, n_vertices)
+    samples = np.random.rand(30, n_vertices * 2)
+    # force the edges to be processed in several chunks
+    max_edge_data_size = gmrf_module._MAX_EDGE_DATA_SIZE
+    gmrf_module._MAX_EDGE_DATA_SIZE = 30 * 4 * 3
+    try:
+        for mode in ['concatenation', 'subtraction']:
+            gmrf1 = GMRFVectorModel(samples, graph, mode=mode,
+                                    dtype=np.float64)
+            gmrf2 = GMRFVectorModel(samples, graph, mode=mode,
+                                    dtype=np.float64, n_workers=4)
+            assert_array_almost_equal(gmrf1.precision.todense(),
+                                      gmrf2.precision.todense())
+    finally:
+        gmrf_module._MAX_EDGE_DATA_SIZE = max_edge_data_size
+
+
+def test_mahalanobis_distance_batches():
+    n_vertices = 10
+    edges = np.array([[i, i + 1] for i in range(n_vertices - 1)])
+    graph = UndirectedGraph.init_from_edges(edges, n_vertices)
+    samples = np.random.rand(40, n_vertices * 2)
+    test_samples = np.random.rand(25, n_vertices * 2)
+    for sparse in [True, False]:
+        gmrf = GMRFVectorModel(samples, graph, sparse=sparse,
+                               dtype=np.float64)
+        d = gmrf.mahalanobis_distance(test_samples)
+        assert d.shape == (25,)
+        assert_almost_equal(d[3], gmrf.mahalanobis_distance(test_samples[3]))
+        assert_almost_equal(gmrf.mahalanobis_distance(test_samples,
+                                                      batch_size=4,
+                                                      n_workers=3), d)
+
+
+def test_init_from_stream():
+    n_vertices = 6
+    edges = np.array([[0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 0]])
+    graphs = [DirectedGraph.init_from_edges(edges, n_vertices),
+              UndirectedGraph(np.zeros((n_vertices, n_vertices)))]
+    samples = [PointCloud(np.random.rand(n_vertices, 2)) for _ in range(40)]
+    for graph in graphs:
+        for mode in ['concatenation', 'subtraction']:
+            for sparse in [True, False]:
+                gmrf1 = GMRFModel.init_from_stream(
+                    iter(samples), graph, 7, mode=mode, sparse=sparse,
+                    incremental=True, prefetch=True)
+                gmrf2 = GMRFModel(samples, graph, mode=mode, sparse=sparse,
+                                  incremental=True)
+                assert gmrf1.n_samples == 40
+                if sparse:
+                    assert_array_almost_equal(gmrf1.precision.todense(),
+                                              gmrf2.precision.todense())
+                else:
+                    assert_array_almost_equal(gmrf1.precision,
+                                              gmrf2.precision)
+                assert_array_almost_equal(gmrf1.mean_vector,
+                                          gmrf2.mean_vector)
+                assert_array_almost_equal(gmrf1._covariance_matrices,
+                                          gmrf2._covariance_matrices)
+                assert_array_almost_equal(gmrf1.mean().points,
+                                          gmrf2.mean().points)
+
+
+def test_vector_init_from_stream():
+    n_vertices = 5
+    edges = np.array([[0, 1], [1, 2], [2, 3], [3, 4]])
+    graph = UndirectedGraph.init_from_edges(edges, n_vertices)
+    samples = np.random.rand(23, n_vertices * 3)
+    gmrf1 = GMRFVectorModel.init_from_stream(samples, graph, 5)
+    gmrf2 = GMRFVectorModel(samples, graph)
+    assert_array_almost_equal(gmrf1.precision.todense(),
+                              gmrf2.precision.todense())
+    assert gmrf1._covariance_matrices is None
+
+
+def test_sparse_precision_canonical():
+    n_vertices = 8
+    edges = np.array([[i, (i + 1) % n_vertices] for i in range(n_vertices)])
+    graph = UndirectedGraph.init_from_edges(edges, n_vertices)
+    samples = np.random.rand(30, n_vertices * 2)
+    for mode in ['concatenation', 'subtraction']:
+        sparse_gmrf = GMRFVectorModel(samples, graph, mode=mode)
+        dense_gmrf = GMRFVectorModel(samples, graph, mode=mode, sparse=False)
+        precision = sparse_gmrf.precision
+        # one block per vertex and two per edge, the duplicates are merged
+        assert precision.indices.shape[0] == n_vertices + 2 * graph.n_edges
+        assert precision.has_sorted_indices
+        assert_array_almost_equal(precision.todense(), dense_gmrf.precision)
@@ -1,9 +1,13 @@
+from shutil import rmtree
+from tempfile import mkdtemp
 import numpy as np
 from nose.tools import raises
 from numpy.testing import (assert_allclose, assert_equal, assert_almost_equal,
                            assert_array_almost_equal)
+from menpo.image import Image
 from menpo.shape import PointCloud
-from menpo.model import LinearVectorModel, PCAModel, PCAVectorModel
+from menpo.model import (LinearVectorModel, OrthonormalBasis, PCAModel,
+                         PCAVectorModel)
 from menpo.math import as_matrix
 
 
@@ -335,3 +339,294 @@ def test_pca_project():
     pca_model = PCAModel(pca_samples)
     projected = pca_model.project(pca_samples[0])
     assert projected.shape[0] == 9
+
+
+def test_pca_float32():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples, dtype=np.float32)
+    assert pca_model.components.dtype == np.float32
+    assert pca_model.eigenvalues.dtype == np.float32
+    assert pca_model.mean_vector.dtype == np.float32
+    pca_model.increment(pca_samples[:3])
+    assert pca_model.components.dtype == np.float32
+    assert pca_model.eigenvalues.dtype == np.float32
+    assert pca_model.mean_vector.dtype == np.float32
+
+
+def test_pca_init_from_stream():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    ipca_model = PCAModel.init_from_stream(iter(pca_samples), 4)
+    bpca_model = PCAModel(pca_samples)
+
+    assert ipca_model.n_samples == 10
+    assert_almost_equal(np.abs(ipca_model.components),
+                        np.abs(bpca_model.components))
+    assert_almost_equal(ipca_model.eigenvalues, bpca_model.eigenvalues)
+    assert_almost_equal(ipca_model.mean().as_vector(),
+                        bpca_model.mean().as_vector())
+
+
+def test_pca_vector_init_from_stream_n_components():
+    pca_samples = np.random.randn(20, 10)
+    ipca_model = PCAVectorModel.init_from_stream(pca_samples, 5,
+                                                 n_components=3)
+    assert ipca_model.n_samples == 20
+    assert ipca_model.n_components == 3
+    assert_almost_equal(ipca_model.mean(), pca_samples.mean(axis=0))
+
+
+def test_pca_vector_init_from_stream_variance():
+    rng = np.random.RandomState(0)
+    pca_samples = (3 * rng.randn(500, 5).dot(rng.randn(5, 30)) +
+                   rng.randn(500, 30))
+    ipca_model = PCAVectorModel.init_from_stream(pca_samples, 50,
+                                                 n_components=10)
+    bpca_model = PCAVectorModel(pca_samples, max_n_components=10)
+    # the variance of every trimmed component is only counted once
+    assert_allclose(ipca_model.original_variance(),
+                    bpca_model.original_variance())
+    assert_allclose(ipca_model.variance_ratio(), bpca_model.variance_ratio(),
+                    rtol=1e-2)
+    assert_allclose(ipca_model.noise_variance(), bpca_model.noise_variance(),
+                    rtol=0.1)
+
+
+def test_pca_init_from_stream_prefetch():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    model = PCAModel.init_from_stream(pca_samples, 3, dtype=np.float32)
+    p_model = PCAModel.init_from_stream(pca_samples, 3, prefetch=True,
+                                        dtype=np.float32)
+    assert p_model.components.dtype == np.float32
+    assert_allclose(p_model.components, model.components)
+    assert_allclose(p_model.eigenvalues, model.eigenvalues)
+
+
+@raises(ValueError)
+def test_pca_init_from_stream_small_batch():
+    PCAVectorModel.init_from_stream(np.random.randn(10, 5), 1)
+
+
+def test_pca_project_many():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    weights = pca_model.project_many(pca_samples)
+    assert weights.shape == (10, 4)
+    assert_almost_equal(weights[3], pca_model.project(pca_samples[3]))
+    batched_weights = pca_model.project_many(iter(pca_samples),
+                                             n_instances=10, batch_size=3)
+    assert_almost_equal(batched_weights, weights)
+
+
+def test_pca_project_many_empty():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    assert pca_model.project_many([]).shape == (0, 4)
+    assert pca_model.project_many([], batch_size=3).shape == (0, 4)
+
+
+def test_pca_reconstruct_many():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    reconstructed = pca_model.reconstruct_many(pca_samples)
+    assert len(reconstructed) == 10
+    assert_almost_equal(reconstructed[5].points,
+                        pca_model.reconstruct(pca_samples[5]).points)
+
+
+def test_pca_project_out_many():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    projected_out = pca_model.project_out_many(pca_samples)
+    assert len(projected_out) == 10
+    assert_almost_equal(projected_out[2].as_vector(),
+                        pca_model.project_out(pca_samples[2]).as_vector())
+
+
+def test_pca_many_keep_instance_landmarks():
+    pca_samples = []
+    for i in range(5):
+        image = Image(np.random.randn(1, 6, 5))
+        image.landmarks['centre'] = PointCloud(np.array([[i, i]]))
+        pca_samples.append(image)
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 2
+    reconstructed = pca_model.reconstruct_many(iter(pca_samples),
+                                               n_instances=5)
+    projected_out = pca_model.project_out_many(pca_samples)
+    for i in range(5):
+        assert_allclose(reconstructed[i].landmarks['centre'].lms.points,
+                        [[i, i]])
+        assert_allclose(projected_out[i].landmarks['centre'].lms.points,
+                        [[i, i]])
+
+
+def test_pca_export_mmap():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    path = mkdtemp()
+    try:
+        pca_model.export_mmap(path)
+        mmap_model = PCAModel.init_from_mmap(path)
+        assert isinstance(mmap_model, PCAModel)
+        assert isinstance(mmap_model._components, np.memmap)
+        assert not mmap_model._components.flags.writeable
+        assert mmap_model.n_active_components == 4
+        assert_allclose(mmap_model.components, pca_model.components)
+        assert_allclose(mmap_model.eigenvalues, pca_model.eigenvalues)
+        assert_allclose(mmap_model.project(pca_samples[0]),
+                        pca_model.project(pca_samples[0]))
+        # a PCAModel is also a PCAVectorModel
+        PCAVectorModel.init_from_mmap(path)
+    finally:
+        rmtree(path)
+
+
+@raises(ValueError)
+def test_pca_export_mmap_overwrite():
+    pca_model = PCAVectorModel(np.random.randn(10, 5))
+    path = mkdtemp()
+    try:
+        pca_model.export_mmap(path)
+        pca_model.export_mmap(path)
+    finally:
+        rmtree(path)
+
+
+@raises(ValueError)
+def test_pca_init_from_mmap_wrong_class():
+    pca_model = PCAVectorModel(np.random.randn(10, 5))
+    path = mkdtemp()
+    try:
+        pca_model.export_mmap(path)
+        PCAModel.init_from_mmap(path)
+    finally:
+        rmtree(path)
+
+
+def test_pca_quantize():
+    samples = np.random.randn(20, 600)
+    model = PCAVectorModel(samples)
+    model.n_active_components = 8
+    weights = model.project_vectors(samples[:5])
+    for dtype, decimal in [(np.float16, 2), (np.int8, 1)]:
+        q_model = model.copy()
+        errors = q_model.quantize(dtype=dtype)
+        assert q_model.is_quantized
+        assert q_model._components.dtype == dtype
+        assert errors.shape == (model.n_components,)
+        assert np.all(errors < 0.05)
+        assert q_model.components.shape == (8, 600)
+        q_weights = q_model.project_vectors(samples[:5])
+        assert q_weights.dtype == np.float32
+        assert_almost_equal(q_weights, weights, decimal=decimal)
+        assert_almost_equal(q_model.instance_vectors(weights),
+                            model.instance_vectors(weights), decimal=decimal)
+
+
+def test_pca_quantize_project_many():
+    pca_samples = [PointCloud(np.random.randn(300, 2)) for _ in range(10)]
+    pca_model = PCAModel(pca_samples)
+    pca_model.n_active_components = 4
+    weights = pca_model.project_many(pca_samples)
+    pca_model.quantize(dtype=np.int8)
+    pca_model.trim_components()
+    assert pca_model._component_scales.shape == (4,)
+    assert_almost_equal(pca_model.project_many(pca_samples), weights,
+                        decimal=1)
+    reconstructed = pca_model.reconstruct_many(pca_samples)
+    assert_almost_equal(reconstructed[0].points,
+                        pca_model.reconstruct(pca_samples[0]).points,
+                        decimal=4)
+
+
+@raises(ValueError)
+def test_pca_quantize_increment():
+    model = PCAVectorModel(np.random.randn(10, 5))
+    model.quantize()
+    model.increment(np.random.randn(5, 5))
+
+
+@raises(ValueError)
+def test_pca_quantize_invalid_dtype():
+    PCAVectorModel(np.random.randn(10, 5)).quantize(dtype=np.int16)
+
+
+def test_pca_cached_whitened_components():
+    samples = np.random.randn(15, 10)
+    model = PCAVectorModel(samples)
+    whitened = model.whitened_components()
+    assert model.whitened_components() is whitened
+    assert not whitened.flags.writeable
+    model.n_active_components = 3
+    whitened = model.whitened_components()
+    assert whitened.shape == (3, 10)
+    assert_allclose(whitened, model.components / np.sqrt(
+        model.eigenvalues * model.n_samples +
+        model.noise_variance())[:, None])
+    assert_allclose(model.project_whitened(samples[0]),
+                    np.dot(samples[0], whitened.T))
+
+
+def test_pca_cache_invalidated_by_increment():
+    model = PCAVectorModel(np.random.randn(10, 5))
+    components = model.components
+    whitened = model.whitened_components()
+    model.increment(np.random.randn(5, 5))
+    assert model.components is not components
+    assert model.whitened_components() is not whitened
+    assert_allclose(model.components, model._components)
+
+
+def test_pca_cache_invalidated_by_orthonormalize_against():
+    pca_samples = [PointCloud(np.random.randn(10, 2)) for _ in range(10)]
+    model = PCAModel(pca_samples)
+    model.n_active_components = 5
+    other = LinearVectorModel(np.random.randn(3, 20))
+    before = model.whitened_components().copy()
+    model.orthonormalize_against_inplace(other)
+    assert_allclose(model.components, model._components[:5])
+    assert not np.allclose(model.whitened_components(), before)
+
+
+def test_pca_copy_does_not_share_cache():
+    model = PCAVectorModel(np.random.randn(10, 5))
+    model.components
+    new_model = model.copy()
+    new_model._components[...] = 0
+    assert_allclose(new_model.components, 0)
+    assert not np.allclose(model.components, 0)
+
+
+def test_linear_model_orthonormalize_against_basis():
+    fixed = LinearVectorModel(np.random.randn(3, 20))
+    full_fixed = fixed.copy()
+    model = LinearVectorModel(np.random.randn(4, 20))
+    full_model = model.copy()
+    full_model.orthonormalize_against_inplace(full_fixed)
+    basis = OrthonormalBasis(fixed)
+    model.orthonormalize_against_inplace(basis)
+    assert_allclose(fixed.components, full_fixed.components)
+    assert_allclose(basis.basis, fixed.components)
+    # the same space is spanned, up to the sign of each component
+    assert_allclose(np.abs(model.components), np.abs(full_model.components),
+                    atol=1e-10)
+    assert_allclose(np.dot(model.components, fixed.components.T), 0,
+                    atol=1e-10)
+    assert_allclose(np.dot(model.components, model.components.T), np.eye(4),
+                    atol=1e-10)
+
+
+def test_pca_orthonormalize_against_basis_trims():
+    pca_samples = [PointCloud(np.random.randn(4, 2)) for _ in range(10)]
+    model = PCAModel(pca_samples)
+    basis = OrthonormalBasis(LinearVectorModel(np.random.randn(4, 8)))
+    assert basis.n_components == 4
+    model.orthonormalize_against_inplace(basis)
+    assert model.n_components == 4
+    assert_allclose(basis.project_out_vectors(model.components),
+                    model.components, atol=1e-10)
@@ -56,7 +56,8 @@ def no_cythonize(extensions, **_ignore):
     return extensions
 
 
-def build_extension_from_pyx(pyx_path, extra_sources_paths=None):
+def build_extension_from_pyx(pyx_path, extra_sources_paths=None,
+                             openmp=False):
     if extra_sources_paths is None:
         extra_sources_paths = []
     extra_sources_paths.insert(0, pyx_path)
@@ -66,6 +67,13 @@ def build_extension_from_pyx(pyx_path, extra_sources_paths=None):
                     language='c++')
     if IS_LINUX or IS_OSX:
         ext.extra_compile_args.append('-Wno-unused-function')
+    # The default OSX compiler does not support OpenMP, in which case the
+    # OpenMP pragmas are ignored and the code runs serially
+    if openmp and IS_LINUX:
+        ext.extra_compile_args.append('-fopenmp')
+        ext.extra_link_args.append('-fopenmp')
+    elif openmp and IS_WIN:
+        ext.extra_compile_args.append('/openmp')
     return ext
 
 try:
@@ -87,8 +95,10 @@ cython_modules = [
         extra_sources_paths=['menpo/feature/cpp/ImageWindowIterator.cpp',
                              'menpo/feature/cpp/WindowFeature.cpp',
                              'menpo/feature/cpp/HOG.cpp',
-                             'menpo/feature/cpp/LBP.cpp']),
-    build_extension_from_pyx('menpo/feature/_gradient.pyx'),
+                             'menpo/feature/cpp/LBP.cpp'],
+        openmp=True),
+    build_extension_from_pyx('menpo/feature/_gradient.pyx', openmp=True),
+    build_extension_from_pyx('menpo/feature/_gaussian.pyx', openmp=True),
     build_extension_from_pyx('menpo/image/patches.pyx'),
     build_extension_from_pyx('menpo/shape/mesh/normals.pyx')
 ]